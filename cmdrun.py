@@ -0,0 +1,141 @@
+"""Run many short external commands concurrently from one Python process.
+
+prepare_lstmf.py, train.recognise and make_testset.py bootstrap all run one
+tesseract per line. Each used to either run them one after another, or park
+a whole Python worker process in subprocess.run for every command in flight.
+CommandRunner keeps up to `jobs` commands running under an asyncio
+semaphore in the calling process instead, with a timeout per command,
+retries for commands that time out, are killed or cannot be started for
+lack of resources, and stdout/stderr captured for each.
+
+Callers describe one unit of work as a coroutine that awaits runner.run()
+as often as it needs -- prepare_lstmf runs the box script and tesseract in
+turn for the same line -- and feed their items through completed(), which
+keeps a bounded window of them in flight and hands back finished ones:
+
+    runner = CommandRunner(jobs=8, timeout=60)
+
+    async def recognise(img):
+        return await runner.run(["tesseract", str(img), "stdout", "--psm", "7"])
+
+    for done in runner.completed(recognise, images, tick=30):
+        for img, result in done:            # done is [] every `tick` seconds
+            ...
+
+completed() is an ordinary generator, so what the caller does with results
+-- ledger writes, progress lines -- happens between event loop steps, with
+nothing else to synchronise.
+"""
+
+import asyncio
+import os
+from collections import namedtuple
+
+TIMEOUT = 120           # seconds for one command
+RETRIES = 1             # further attempts after a timeout, kill or EAGAIN
+
+
+class Result(namedtuple("Result", "returncode stdout stderr attempts timed_out")):
+    """One command's outcome. returncode is None if it never started or
+    timed out on every attempt."""
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def error(self, width=70):
+        """A one-line reason for failure, for logs."""
+        if self.timed_out:
+            return "timed out"
+        text = self.stderr.decode("utf-8", "replace").strip()
+        return (text.splitlines() or [f"exit {self.returncode}"])[0][:width]
+
+
+class CommandRunner:
+    """Up to `jobs` commands at once, each with a timeout and retries."""
+
+    def __init__(self, jobs, timeout=TIMEOUT, retries=RETRIES, env=None):
+        self.jobs = max(1, jobs)
+        self.timeout = timeout
+        self.retries = retries
+        self.env = env
+        self._sem = None
+        self.started = 0
+
+    async def run(self, cmd, env=None, cwd=None, stdin=None):
+        """Run cmd (a list) to completion; never raises for the command's
+        own failure."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.jobs)
+        env = env if env is not None else self.env
+        timed_out = False
+        for attempt in range(1, self.retries + 2):
+            async with self._sem:
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *map(str, cmd), env=env, cwd=cwd,
+                        stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                except FileNotFoundError as exc:
+                    return Result(None, b"", str(exc).encode(), attempt, False)
+                except OSError as exc:      # EAGAIN, EMFILE: try again shortly
+                    if attempt > self.retries:
+                        return Result(None, b"", str(exc).encode(), attempt, False)
+                    await asyncio.sleep(0.5 * attempt)
+                    continue
+                self.started += 1
+                try:
+                    out, err = await asyncio.wait_for(proc.communicate(stdin),
+                                                      self.timeout)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    timed_out = True
+                    continue
+            if proc.returncode < 0 and attempt <= self.retries:
+                continue                    # killed by a signal, e.g. OOM
+            return Result(proc.returncode, out, err, attempt, False)
+        return Result(None, b"", b"", self.retries + 1, timed_out)
+
+    def completed(self, fn, items, window=None, tick=None):
+        """Run the coroutine fn(item) over items, at most window at a time.
+
+        Yields lists of (item, value) as they finish, in completion order,
+        and an empty list every tick seconds in which none did.
+        """
+        window = window or self.jobs * 4
+        items = iter(items)
+        loop = asyncio.new_event_loop()
+        pending = {}
+        try:
+            while True:
+                while len(pending) < window:
+                    item = next(items, _END)
+                    if item is _END:
+                        break
+                    pending[loop.create_task(fn(item))] = item
+                if not pending:
+                    return
+                done, _ = loop.run_until_complete(asyncio.wait(
+                    pending, timeout=tick, return_when=asyncio.FIRST_COMPLETED))
+                yield [(pending.pop(task), task.result()) for task in done]
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+            self._sem = None
+
+    def map(self, fn, items, window=None):
+        """[(item, value), ...] for every item, in completion order."""
+        return [pair for done in self.completed(fn, items, window) for pair in done]
+
+
+_END = object()
+
+
+def tesseract_env(**extra):
+    """The environment for many tesseracts at once: one OpenMP thread each."""
+    return dict(os.environ, OMP_THREAD_LIMIT="1", **extra)
+
@@ -12,6 +12,7 @@ class FontConfigProtocol(Protocol):
     DPI: int
     LINE_SPACING: int
     LINES_PER_PAGE: int
+    CROP_ENCODING: str
 
     @property
     def A4_WIDTH(self) -> int:
@@ -34,6 +35,10 @@ class DefaultTamilConfig:
     DPI = 300
     LINE_SPACING = 20
     LINES_PER_PAGE = 50
+    # How line crops are stored: "gray" (8-bit LZW, OpenCV's default),
+    # "gray-raw" (8-bit uncompressed), "bilevel" (1-bit), "bilevel-lzw" or
+    # "g4" (1-bit CCITT Group 4).
+    CROP_ENCODING = "gray"
 
     @property
     def A4_WIDTH(self) -> int:
@@ -0,0 +1,122 @@
+"""Content-addressed store for rendered pairs and their training files.
+
+Ablation variants overlap heavily. The size grid's 10k, 50k and 198k lines
+come from one seeded shuffle, so the smaller sets are prefixes of the larger;
+the font grid renders the same 50k lines again and again. Every variant used
+to render and prepare each of its pairs from scratch.
+
+The store holds, per (line text, font file, render settings):
+
+    <key>.tif  <key>.gt.txt      the rendered pair
+    <key>.box  <key>.lstmf       what prepare_lstmf.py made of it, once a
+                                 variant has trained on it
+
+under <root>/<key[:2]>/. render.generate(store=...) assembles any page whose
+every line is already stored from hardlinks instead of rendering it, and adds
+the pairs of pages it does render. runner.run_variant harvests .box/.lstmf
+after training, so the next variant that draws the same line in the same face
+skips lstm.train for it too.
+
+Hardlinks keep modification times, so tesstrain's make sees .box and .lstmf
+newer than the pair they came from and leaves them alone. Deleting a
+variant's gt/ only drops its links; the store keeps the data. Where a
+hardlink is impossible (another filesystem) files are copied.
+
+A stored crop is reused only for a page whose lines are all stored, and a
+line is stored only from a page that segmented cleanly, so every crop an
+assembled page links is the one rendering would cut for that line in that
+face. Whether a page segments is not per line, though: in the page layout
+rendering drops the whole page when projection finds the wrong number of
+bands, which depends on every line on it. An assembled page can therefore
+keep lines that rendering the same page would have dropped. Rejection
+belongs to a page's line set and fonts, which no key records. With
+layout="line" each strip segments alone and the two agree exactly.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+PAIR_SUFFIXES = (".tif", ".gt.txt")
+TRAIN_SUFFIXES = (".box", ".lstmf")
+
+
+class ArtifactStore:
+    """Pairs and training files by content key."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(text, font_hash, settings):
+        """Key for one line drawn in one face under one set of settings."""
+        blob = json.dumps([text, font_hash, settings], ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def path(self, key, suffix):
+        return self.root / key[:2] / f"{key}{suffix}"
+
+    def has(self, key):
+        return all(self.path(key, s).exists() for s in PAIR_SUFFIXES)
+
+    def size(self, key, suffix):
+        return self.path(key, suffix).stat().st_size
+
+    def read(self, key, suffix):
+        return self.path(key, suffix).read_bytes()
+
+    def put(self, key, image, gt):
+        """Store a pair given its bytes. First writer wins."""
+        for suffix, data in zip(PAIR_SUFFIXES, (image, gt)):
+            dest = self.path(key, suffix)
+            if dest.exists():
+                continue
+            dest.parent.mkdir(exist_ok=True)
+            tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, dest)
+
+    def adopt(self, key, stem_path, suffixes=PAIR_SUFFIXES):
+        """Link files already on disk at <stem_path><suffix> into the store."""
+        for suffix in suffixes:
+            src, dest = Path(f"{stem_path}{suffix}"), self.path(key, suffix)
+            if dest.exists() or not src.exists() or src.stat().st_size == 0:
+                continue
+            dest.parent.mkdir(exist_ok=True)
+            tmp = dest.with_name(f"{dest.name}.{os.getpid()}.tmp")
+            _link(src, tmp)
+            os.replace(tmp, dest)
+
+    def place(self, key, stem_path):
+        """Link the stored pair, and any .box/.lstmf, to <stem_path><suffix>."""
+        for suffix in PAIR_SUFFIXES + TRAIN_SUFFIXES:
+            src = self.path(key, suffix)
+            if not src.exists():
+                continue
+            dest = Path(f"{stem_path}{suffix}")
+            dest.unlink(missing_ok=True)
+            _link(src, dest)
+
+    def harvest(self, gt_dir, records):
+        """Adopt the .box/.lstmf prepare_lstmf.py made for these index
+        records. Returns how many .lstmf files are now stored."""
+        gt_dir, n = Path(gt_dir), 0
+        for r in records:
+            if "key" not in r:
+                continue
+            stem = gt_dir / r["image"][:-len(".tif")]
+            # .box first: an .lstmf is only worth keeping with its .box.
+            if Path(f"{stem}.box").exists():
+                self.adopt(r["key"], stem, TRAIN_SUFFIXES)
+            n += self.path(r["key"], ".lstmf").exists()
+        return n
+
+
+def _link(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
@@ -0,0 +1,143 @@
+"""Disk footprint and read cost of each crop encoding.
+
+Renders a sample of corpus lines once, then stores the same crops in every
+encoding render.ENCODINGS offers and reports, per line:
+
+    bytes       file size, and what the filesystem actually allocates
+    write ms    encode + write
+    decode ok   OpenCV reads it back (and, for the gray encodings, exactly)
+    train ms    tesseract ... --psm 13 lstm.train, the .lstmf preparation
+                step, when tesseract is available
+
+    python experiments/bench_encoding.py --lines 1000 --train-sample 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import corpus  # noqa: E402
+import render  # noqa: E402
+from config import DefaultTamilConfig  # noqa: E402
+from prepare_lstmf import line_box  # noqa: E402
+
+
+def sample_crops(n_lines, font_dir):
+    """(stem, crop, text) for n_lines rendered with the normal pipeline."""
+    cfg = DefaultTamilConfig()
+    fonts = render.load_fonts(font_dir, cfg.FONT_SIZE)
+    lines = corpus.select(corpus.build_pool(), n_lines=n_lines, seed=0)
+    lpp = cfg.LINES_PER_PAGE
+    out = []
+    for page in range((len(lines) + lpp - 1) // lpp):
+        page_lines = lines[page * lpp:(page + 1) * lpp]
+        page_fonts = [fonts[(page * lpp + i) % len(fonts)] for i in range(len(page_lines))]
+        image, drawn = render.render_page(page_lines, page_fonts, None, cfg)
+        for r in render.segment_page(image, None, drawn, f"page_{page + 1:06d}",
+                                     page_fonts, encoding="gray"):
+            tif, gt = r["data"]
+            crop = cv2.imdecode(np.frombuffer(tif, np.uint8), cv2.IMREAD_GRAYSCALE)
+            out.append((r["stem"], crop, gt.decode("utf-8")))
+    return out
+
+
+def train_timer():
+    """Time lstm.train over a directory of written crops, or None if
+    tesseract is missing."""
+    if shutil.which("tesseract") is None:
+        return None
+
+    def run(paths):
+        for img in paths:
+            stem = img.with_suffix("")
+            text = Path(f"{stem}.gt.txt").read_text(encoding="utf-8")
+            stem.with_suffix(".box").write_bytes(line_box(img, text))
+        env = dict(os.environ, OMP_THREAD_LIMIT="1")
+        started, failed = time.perf_counter(), 0
+        for img in paths:
+            r = subprocess.run(["tesseract", str(img), str(img.with_suffix("")),
+                                "--psm", "13", "lstm.train"],
+                               capture_output=True, env=env)
+            failed += r.returncode != 0
+        return (time.perf_counter() - started) / len(paths) * 1000, failed
+    return run
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=500)
+    ap.add_argument("--train-sample", type=int, default=30,
+                    help="lines per encoding to run through lstm.train")
+    ap.add_argument("--font-dir", default="fonts")
+    ap.add_argument("--json", default=None, help="also write the table here")
+    args = ap.parse_args()
+
+    crops = sample_crops(args.lines, args.font_dir)
+    print(f"{len(crops)} crops, mean {np.mean([c.shape[1] for _, c, _ in crops]):.0f}"
+          f" x {np.mean([c.shape[0] for _, c, _ in crops]):.0f} px\n")
+    trainer = train_timer()
+
+    rows = []
+    for enc in render.ENCODINGS:
+        with tempfile.TemporaryDirectory(prefix=f"enc-{enc}-") as tmp:
+            tmp = Path(tmp)
+            started = time.perf_counter()
+            for stem, crop, text in crops:
+                (tmp / f"{stem}.tif").write_bytes(render.encode_crop(crop, enc))
+            write_ms = (time.perf_counter() - started) / len(crops) * 1000
+            for stem, _, text in crops:
+                (tmp / f"{stem}.gt.txt").write_text(text, encoding="utf-8")
+
+            imgs = sorted(tmp.glob("*.tif"))
+            size = sum(p.stat().st_size for p in imgs)
+            alloc = sum(p.stat().st_blocks * 512 for p in imgs)
+
+            started = time.perf_counter()
+            decoded = {p.stem: cv2.imread(str(p), cv2.IMREAD_GRAYSCALE) for p in imgs}
+            read_ms = (time.perf_counter() - started) / len(imgs) * 1000
+            ok = all(d is not None for d in decoded.values())
+            exact = ok and all(np.array_equal(decoded[s], c) for s, c, _ in crops)
+
+            train = trainer(imgs[:args.train_sample]) if trainer else None
+
+        rows.append({"encoding": enc, "bytes_per_line": size / len(crops),
+                     "allocated_per_line": alloc / len(crops),
+                     "write_ms": write_ms, "cv2_read_ms": read_ms,
+                     "decodes": ok, "lossless": exact,
+                     "lstm_train_ms": train and train[0],
+                     "lstm_train_failed": train and train[1]})
+
+    base = rows[0]["bytes_per_line"]
+    print(f"{'encoding':<12} {'bytes/line':>10} {'alloc/line':>10} {'vs gray':>8} "
+          f"{'write ms':>9} {'read ms':>8} {'train ms':>9}  lossless")
+    print("-" * 84)
+    for r in rows:
+        train = f"{r['lstm_train_ms']:>9.1f}" if r["lstm_train_ms"] else f"{'--':>9}"
+        print(f"{r['encoding']:<12} {r['bytes_per_line']:>10,.0f} "
+              f"{r['allocated_per_line']:>10,.0f} "
+              f"{r['bytes_per_line'] / base * 100:>7.0f}% {r['write_ms']:>9.3f} "
+              f"{r['cv2_read_ms']:>8.3f} {train}  "
+              f"{'yes' if r['lossless'] else 'no' if r['decodes'] else 'UNREADABLE'}")
+    if trainer is None:
+        print("\ntrain ms needs tesseract on PATH")
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
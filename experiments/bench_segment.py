@@ -0,0 +1,142 @@
+"""Per-page segmentation timing, and a check that nothing moved.
+
+Renders a few real pages from the corpus, then segments each one twice: with
+the Python loops that render.segment_page, generate-gt.py and
+make_testset.find_lines used to carry, and with the shared segmentation
+module that replaced them. Band lists and column extents must match exactly;
+the script exits non-zero if any differ.
+
+    python experiments/bench_segment.py --pages 5 --repeat 20
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import corpus  # noqa: E402
+import render  # noqa: E402
+import segmentation  # noqa: E402
+from config import DefaultTamilConfig  # noqa: E402
+from make_testset import binarise, find_lines  # noqa: E402
+
+
+# -- the loops as they were ---------------------------------------------------
+
+def loop_bands(projection, threshold, close_open=True):
+    bands, in_line, start = [], False, 0
+    for i, val in enumerate(projection):
+        if val > threshold and not in_line:
+            start, in_line = i, True
+        elif val <= threshold and in_line:
+            bands.append((start, i))
+            in_line = False
+    if in_line and close_open:
+        bands.append((start, len(projection)))
+    return bands
+
+
+def loop_extent(crop):
+    _, thresh = cv2.threshold(crop, render.BINARY_THRESHOLD, 255, cv2.THRESH_BINARY)
+    coords = cv2.findNonZero(255 - thresh)
+    if coords is None:
+        return None
+    x, _, w, _ = cv2.boundingRect(coords)
+    return x, x + w
+
+
+def loop_find_lines(binary):
+    proj = (binary > 0).sum(axis=1).astype(float)
+    if proj.max() == 0:
+        return []
+    k = max(3, binary.shape[0] // 400)
+    proj = np.convolve(proj, np.ones(k) / k, mode="same")
+    bands = [list(b) for b in loop_bands(proj, max(1.0, proj.max() * 0.06))]
+    if not bands:
+        return []
+    heights = sorted(b[1] - b[0] for b in bands)
+    median_h = heights[len(heights) // 2]
+    merged = [bands[0]]
+    for s, e in bands[1:]:
+        if s - merged[-1][1] < median_h * 0.45:
+            merged[-1][1] = e
+        else:
+            merged.append([s, e])
+    total_ink = (binary > 0).sum()
+    return [(s, e) for s, e in merged
+            if e - s >= 12 and (binary[s:e] > 0).sum() >= total_ink * 0.002]
+
+
+# -----------------------------------------------------------------------------
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--font-dir", default="fonts")
+    args = ap.parse_args()
+
+    cfg = DefaultTamilConfig()
+    fonts = render.load_fonts(args.font_dir, cfg.FONT_SIZE)
+    lpp = cfg.LINES_PER_PAGE
+    lines = corpus.select(corpus.build_pool(), n_lines=args.pages * lpp, seed=0)
+
+    mismatches = 0
+    rows = []
+    for page in range(args.pages):
+        page_lines = lines[page * lpp:(page + 1) * lpp]
+        page_fonts = [fonts[(page * lpp + i) % len(fonts)] for i in range(len(page_lines))]
+        image, _ = render.render_page(page_lines, page_fonts, None, cfg)
+        _, binary = cv2.threshold(image, render.BINARY_THRESHOLD, 255,
+                                  cv2.THRESH_BINARY_INV)
+
+        def old_render():
+            bands = loop_bands(np.sum(binary, axis=1), render.PROJECTION_THRESHOLD)
+            return bands, [loop_extent(image[y1:y2]) for y1, y2 in bands]
+
+        def new_render():
+            bands = segmentation.projection_bands(binary, render.PROJECTION_THRESHOLD)
+            return bands, [segmentation.ink_extent(image[y1:y2] <= render.BINARY_THRESHOLD)
+                           for y1, y2 in bands]
+
+        photo = binarise(image)
+        checks = [
+            ("render", old_render, new_render),
+            ("generate-gt",
+             lambda: loop_bands(np.sum(binary, axis=1), 10, close_open=False),
+             lambda: segmentation.projection_bands(binary, 10, close_open=False)),
+            ("make_testset", lambda: loop_find_lines(photo), lambda: find_lines(photo)),
+        ]
+        for name, old, new in checks:
+            a, t_old = timed(old, args.repeat)
+            b, t_new = timed(new, args.repeat)
+            same = a == b
+            mismatches += not same
+            rows.append((page + 1, name, t_old, t_new, same))
+
+    print(f"{'page':>4}  {'segmenter':<13} {'loop ms':>9} {'numpy ms':>9} "
+          f"{'speedup':>8}  match")
+    for page, name, t_old, t_new, same in rows:
+        print(f"{page:>4}  {name:<13} {t_old:>9.2f} {t_new:>9.2f} "
+              f"{t_old / t_new:>7.1f}x  {'yes' if same else 'NO'}")
+    if mismatches:
+        print(f"\n{mismatches} segmentations differ from the reference loops")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Word-bitmap engine: how fast, and how far from draw.text.
+
+Draws a sample of corpus lines twice, with draw.text (render_line's default)
+and composed from word_cache.WordCache, then compares:
+
+    pixels      lines whose strips are identical, and the share of ink
+                pixels that differ where they are not
+    crops       lines whose encoded crop (what training sees) is identical,
+                and lines that segment into a different number of bands
+    time        ms per line for draw.text, for the word engine as a render
+                would meet it (cold cache), and again with every word cached
+
+Exits non-zero if the mean differing-ink share exceeds --max-diff or any line
+segments differently, so it can gate a change to the engine.
+
+    python experiments/bench_words.py --lines 3000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import corpus  # noqa: E402
+import render  # noqa: E402
+from config import DefaultTamilConfig  # noqa: E402
+from font_registry import registry  # noqa: E402
+from word_cache import WordCache  # noqa: E402
+
+
+def crop(strip, line, name, font):
+    """Encoded crop bytes, or None if the strip is not exactly one band."""
+    records = render.segment_page(strip, None, [line], "bench", [(name, font)])
+    return records[0]["data"][0] if records else None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=2000)
+    ap.add_argument("--font-dir", default="fonts")
+    ap.add_argument("--max-diff", type=float, default=0.001,
+                    help="largest acceptable mean share of ink pixels that differ")
+    ap.add_argument("--json", default=None, help="also write the summary here")
+    args = ap.parse_args()
+
+    cfg = DefaultTamilConfig()
+    fonts = render.load_fonts(args.font_dir, cfg.FONT_SIZE)
+    reg = registry(args.font_dir)
+    probes = {name: reg.probe_height(name, cfg.FONT_SIZE) for name, _ in fonts}
+    lines = corpus.select(corpus.build_pool(), n_lines=args.lines, seed=0)
+    jobs = [(line, *fonts[i % len(fonts)]) for i, line in enumerate(lines)]
+
+    started = time.perf_counter()
+    text = [render.render_line(line, font, cfg, probes[name]) for line, name, font in jobs]
+    t_text = time.perf_counter() - started
+
+    cache = WordCache()
+    started = time.perf_counter()
+    words = [render.render_line(line, font, cfg, probes[name], cache, name)
+             for line, name, font in jobs]
+    t_cold = time.perf_counter() - started
+    cold = cache.stats()
+    started = time.perf_counter()
+    for line, name, font in jobs:
+        render.render_line(line, font, cfg, probes[name], cache, name)
+    t_warm = time.perf_counter() - started
+
+    same_px = same_crop = band_changes = 0
+    shares, worst = [], 0
+    for (line, name, font), a, b in zip(jobs, text, words):
+        # Strips are as wide as each engine's advance; compare on the wider.
+        width = max(a.shape[1], b.shape[1])
+        a, b = (np.pad(s, ((0, 0), (0, width - s.shape[1])), constant_values=255)
+                for s in (a, b))
+        differ = a != b
+        if not differ.any():
+            same_px += 1
+            same_crop += 1
+            shares.append(0.0)
+            continue
+        shares.append(differ.sum() / max(1, (a < 255).sum()))
+        worst = max(worst, int(np.abs(a.astype(int) - b).max()))
+        ca, cb = crop(a, line, name, font), crop(b, line, name, font)
+        same_crop += ca == cb
+        band_changes += (ca is None) != (cb is None)
+
+    n = len(jobs)
+    summary = {
+        "lines": n, "fonts": len(fonts),
+        "identical_strips": same_px, "identical_crops": same_crop,
+        "segmentation_changed": band_changes,
+        "mean_ink_px_differing": float(np.mean(shares)),
+        "max_ink_px_differing": float(np.max(shares)),
+        "max_abs_pixel_diff": worst,
+        "ms_per_line_text": t_text / n * 1000,
+        "ms_per_line_words_cold": t_cold / n * 1000,
+        "ms_per_line_words_warm": t_warm / n * 1000,
+        "cold_hit_rate": cold["hit_rate"], "cached_words": cold["words"],
+    }
+
+    print(f"{n:,} lines over {len(fonts)} fonts, "
+          f"{cold['words']:,} distinct (font, word) bitmaps, "
+          f"cold hit rate {cold['hit_rate']:.1%}\n")
+    print(f"  identical strips       {same_px:>7,}  ({same_px / n:.1%})")
+    print(f"  identical crops        {same_crop:>7,}  ({same_crop / n:.1%})")
+    print(f"  segmentation changed   {band_changes:>7,}")
+    print(f"  ink px differing       mean {summary['mean_ink_px_differing']:.5f}"
+          f"  max {summary['max_ink_px_differing']:.5f}"
+          f"  (largest pixel diff {worst})")
+    print(f"\n  ms/line  draw.text {summary['ms_per_line_text']:.2f}"
+          f"   words cold {summary['ms_per_line_words_cold']:.2f}"
+          f"   words warm {summary['ms_per_line_words_warm']:.2f}")
+
+    if args.json:
+        Path(args.json).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.json).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+
+    if summary["mean_ink_px_differing"] > args.max_diff or band_changes:
+        print(f"\nFAIL: word engine departs from draw.text beyond --max-diff "
+              f"{args.max_diff} or changes segmentation")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Several models against the fixed test set: recognise once, then tabulate.
+
+Each model writes its predictions to pred/<name>/<stem>.txt under the test
+set (or --pred), through ocrpool.recognise_models: every line image is
+decoded once and handed to each model's loaded engine, and only predictions
+not in the cache (--cache, shared with the ablation runner) are made.
+Adding a model to the comparison and running it again recognises with that
+model alone; the table is rescored from the files every time.
+
+A model is a tessdata name (`tam`, from --tessdata-dir or tesseract's own),
+a path to a .traineddata file, or either as name=model to choose its
+directory name:
+
+    python experiments/compare_models.py --test-dir testset \\
+        tam model/01-05-25/tamhng.traineddata model/22-07-25/tam_new.traineddata
+
+Trained ablation variants are models too (results/<grid>/<variant>/tessdata/).
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ocrpool  # noqa: E402
+from tamil_ocr_eval import aggregate, score_pair  # noqa: E402
+
+
+def parse_model(spec, tessdata_dir, pred_root):
+    """An ocrpool.Model for `name=model`, a .traineddata path, or a tessdata
+    name."""
+    name, _, model = spec.rpartition("=")
+    if model.endswith(".traineddata"):
+        path = Path(model)
+        if not path.exists():
+            raise SystemExit(f"no such model: {path}")
+        lang, datapath = path.stem, str(path.resolve().parent)
+    else:
+        lang, datapath = model, tessdata_dir
+    name = name or lang
+    return ocrpool.Model(name, lang, datapath, Path(pred_root) / name)
+
+
+def score_dir(gt_dir, pred_dir):
+    per_line = []
+    for gt_file in sorted(Path(gt_dir).glob("*.gt.txt")):
+        pred = Path(pred_dir) / f"{gt_file.name[:-len('.gt.txt')]}.txt"
+        if pred.exists():
+            per_line.append(score_pair(gt_file.read_text(encoding="utf-8"),
+                                       pred.read_text(encoding="utf-8")))
+    return aggregate(per_line)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("models", nargs="+", metavar="MODEL")
+    ap.add_argument("--test-dir", default="testset",
+                    help="holding images/*.tif and gt/*.gt.txt")
+    ap.add_argument("--pred", default=None,
+                    help="prediction root (default: <test-dir>/pred)")
+    ap.add_argument("--tessdata-dir", default=None,
+                    help="where models given by name are found")
+    ap.add_argument("--psm", default=str(ocrpool.PSM_SINGLE_LINE))
+    ap.add_argument("--jobs", type=int, default=None)
+    ap.add_argument("--cache", default="results/predictions.jsonl",
+                    help="prediction cache; 'none' to go by the files in --pred alone")
+    ap.add_argument("--json", default=None, help="also write the table here")
+    args = ap.parse_args()
+
+    test_dir = Path(args.test_dir)
+    pred_root = Path(args.pred) if args.pred else test_dir / "pred"
+    models = [parse_model(s, args.tessdata_dir, pred_root) for s in args.models]
+    names = [m.name for m in models]
+    if len(set(names)) != len(names):
+        sys.exit(f"model names must differ: {names}; use name=model")
+
+    images = sorted((test_dir / "images").glob("*.tif"))
+    cache = ocrpool.PredictionCache(args.cache) if args.cache != "none" else None
+    made = failed = 0
+    try:
+        for img, name, error in ocrpool.recognise_models(images, models, psm=args.psm,
+                                                          jobs=args.jobs, cache=cache):
+            made += 1
+            if error:
+                failed += 1
+                print(f"[warn] {name} failed on {img.name}: {error}")
+                (pred_root / name / f"{img.stem}.txt").write_text("", encoding="utf-8")
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"{len(images):,} lines x {len(models)} models: {made:,} predictions made, "
+          f"{failed} failed, the rest already there\n")
+
+    table = {m.name: score_dir(test_dir / "gt", m.out_dir) for m in models}
+    width = max(len(n) for n in table)
+    print(f"{'model':<{width}}  {'lines':>6}  {'CER (graph.)':>12}  "
+          f"{'CER (cp)':>8}  {'WER':>6}")
+    for name, agg in table.items():
+        print(f"{name:<{width}}  {agg['lines']:>6}  "
+              f"{agg['cer_grapheme_micro'] * 100:>11.2f}%  "
+              f"{agg['cer_codepoint_micro'] * 100:>7.2f}%  "
+              f"{agg['wer_micro'] * 100:>5.2f}%")
+    if args.json:
+        Path(args.json).write_text(json.dumps(table, ensure_ascii=False, indent=2),
+                                   encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
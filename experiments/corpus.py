@@ -96,12 +96,14 @@ def has_tamil(line):
 
 
 def select(pool, sources=None, n_lines=None, seed=0, dedup=True,
-           require_tamil=True):
+           require_tamil=True, with_source=False):
     """Build one variant's line list.
 
-    sources  restrict to these source stems (None = all)
-    n_lines  cap the result at this many lines (None = no cap)
-    seed     controls the shuffle, so variants are reproducible
+    sources      restrict to these source stems (None = all)
+    n_lines      cap the result at this many lines (None = no cap)
+    seed         controls the shuffle, so variants are reproducible
+    with_source  return (line, source stem) pairs instead of bare lines, in
+                 the same order, for render.stream and the pair index
 
     Lines are pooled across the selected sources, deduplicated, shuffled with
     a fixed seed, then truncated. Shuffling before truncation matters: the
@@ -117,11 +119,14 @@ def select(pool, sources=None, n_lines=None, seed=0, dedup=True,
     seen = set()
     for stem in stems:
         chunk = pool[stem]
-        lines.extend(deduplicate(chunk, seen) if dedup else chunk)
+        chunk = deduplicate(chunk, seen) if dedup else chunk
+        lines.extend(((ln, stem) for ln in chunk) if with_source else chunk)
 
     if require_tamil:
-        lines = [ln for ln in lines if has_tamil(ln)]
+        lines = [ln for ln in lines if has_tamil(ln[0] if with_source else ln)]
 
+    # The permutation depends only on the seed and the length, so pairs land
+    # in the same order the bare lines would.
     random.Random(seed).shuffle(lines)
 
     if n_lines is not None:
@@ -24,11 +24,8 @@ import unicodedata
 from collections import Counter
 from pathlib import Path
 
-from fontTools.ttLib import TTFont
-
-# Name table IDs we care about.
-NAME_IDS = {1: "family", 2: "subfamily", 5: "version", 8: "manufacturer",
-            9: "designer", 13: "license", 14: "license_url", 0: "copyright"}
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from font_registry import FontRegistry  # noqa: E402
 
 TAMIL_BLOCK = range(0x0B80, 0x0C00)
 
@@ -47,44 +44,10 @@ def check_shaping():
     return out
 
 
-def shaping_smoke_test(font_path, size=22):
-    """Render a conjunct two ways and see whether shaping changed anything.
-
-    'கி' must be narrower than the naive sum of its parts once shaped, and
-    a shaped 'ஸ்ரீ' differs in width from the unshaped sequence. If widths are
-    identical to the naive concatenation the font is being drawn unshaped.
-    """
-    from PIL import Image, ImageDraw, ImageFont
-    font = ImageFont.truetype(str(font_path), size)
-    draw = ImageDraw.Draw(Image.new("L", (10, 10)))
-
-    def w(s):
-        return draw.textbbox((0, 0), s, font=font)[2]
-
-    # A conjunct that must reorder/ligate, vs its constituent codepoints.
-    conj = "ஸ்ரீ"
-    parts = sum(w(c) for c in conj)
-    return {"shaped_width": w(conj), "naive_sum": parts,
-            "differs": w(conj) != parts}
-
-
-def font_report(path, corpus_freq):
-    """Metadata + coverage for one font."""
-    tt = TTFont(str(path), fontNumber=0, lazy=True)
-
-    meta = {}
-    try:
-        for rec in tt["name"].names:
-            key = NAME_IDS.get(rec.nameID)
-            if key and key not in meta:
-                try:
-                    meta[key] = rec.toUnicode().strip()
-                except Exception:
-                    pass
-    except Exception:
-        pass
-
-    cmap = set(tt.getBestCmap().keys())
+def font_report(path, corpus_freq, reg):
+    """Metadata + coverage + shaping for one font, from the font registry."""
+    entry = reg.entry(path.stem)
+    cmap = set(entry["cmap"])
 
     # Which corpus codepoints does this font not cover, and how much text
     # do they account for?
@@ -94,24 +57,15 @@ def font_report(path, corpus_freq):
 
     tamil_covered = sum(1 for cp in TAMIL_BLOCK if cp in cmap)
 
-    gsub = "GSUB" in tt
-    tamil_scripts = []
-    if gsub:
-        try:
-            for rec in tt["GSUB"].table.ScriptList.ScriptRecord:
-                tamil_scripts.append(rec.ScriptTag)
-        except Exception:
-            pass
-
-    tt.close()
     return {
         "file": path.name,
         "stem": path.stem,
-        **meta,
+        **entry["meta"],
         "cmap_size": len(cmap),
         "tamil_block_covered": tamil_covered,
-        "has_gsub": gsub,
-        "gsub_scripts": sorted(set(tamil_scripts)),
+        "has_gsub": entry["has_gsub"],
+        "gsub_scripts": entry["gsub_scripts"],
+        "shaping": reg.shaping(path.stem),
         "missing_codepoints": sorted(missing),
         "missing_count": len(missing),
         "missing_occurrences": missing_n,
@@ -219,14 +173,14 @@ def main():
     print("=" * 78)
     print("3. PER-FONT COVERAGE")
     print("=" * 78)
-    paths = sorted(p for p in Path(args.font_dir).iterdir()
-                   if p.suffix.lower() in (".ttf", ".otf"))
+    reg = FontRegistry(args.font_dir)
     reports = []
-    for path in paths:
+    for path in reg.paths():
         try:
-            reports.append(font_report(path, freq))
+            reports.append(font_report(path, freq, reg))
         except Exception as exc:
             print(f"[warn] {path.name}: {exc}")
+    reg.save()
 
     print(f"{'font':<20} {'tamil':>6} {'gsub':>5} {'miss cp':>8} "
           f"{'miss share':>11}  licence")
@@ -255,6 +209,11 @@ def main():
         print(f"\nFonts with no GSUB table (cannot form conjuncts): "
               f"{', '.join(r['stem'] for r in nogsub)}")
 
+    unshaped = [r for r in reports if not r["shaping"]["differs"]]
+    if shaping["raqm"] and unshaped:
+        print(f"\nFonts drawing ஸ்ரீ at the naive width (shaping had no "
+              f"effect): {', '.join(r['stem'] for r in unshaped)}")
+
     print()
     print("=" * 78)
     print("4. LICENCE DISTRIBUTION")
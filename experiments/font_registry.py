@@ -0,0 +1,249 @@
+"""Per-typeface facts, computed once and kept on disk.
+
+Several stages ask the same questions of the same font files: which
+codepoints does each face cover (render.common_coverage, runner._COVERAGE),
+how tall is the Tamil probe at the render size (every render_page), which
+GSUB scripts does it carry and does shaping change anything (font_audit.py).
+Each used to reopen and reparse every face to answer them.
+
+The registry answers each question once per face and persists the answer in
+<font_dir>/.font_registry.json, keyed by the SHA-256 of the font file, so a
+renamed file keeps its entry and an edited one gets a fresh one. Adding a font
+costs one face's worth of work, not a re-scan of all of them.
+
+Two kinds of fact are kept apart:
+
+  static     cmap, GSUB scripts, name-table metadata. Properties of the file.
+  measured   probe height and the shaping smoke test. These depend on the
+             Pillow build that draws the text -- with and without Raqm the
+             same face measures differently -- so they are stored per
+             renderer and re-measured when Pillow or Raqm changes.
+
+Pillow face objects cannot be persisted; they are cached per process instead.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Exercises ascender, descender, pulli and a two-part vowel sign.
+HEIGHT_PROBE = "ஆழ்ந்த கூஜா ஜஸ்ரீ"
+
+REGISTRY_FILE = ".font_registry.json"
+FORMAT = 1
+
+# Name table IDs we care about.
+NAME_IDS = {1: "family", 2: "subfamily", 5: "version", 8: "manufacturer",
+            9: "designer", 13: "license", 14: "license_url", 0: "copyright"}
+
+
+def font_paths(font_dir):
+    """Font files in deterministic (sorted) order."""
+    return sorted(p for p in Path(font_dir).iterdir()
+                  if p.suffix.lower() in (".ttf", ".otf"))
+
+
+def file_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def renderer_id():
+    """Identifies the drawing stack that measured values depend on."""
+    from PIL import __version__, features
+    return f"pillow-{__version__}/raqm-{int(bool(features.check('raqm')))}"
+
+
+def _draw():
+    from PIL import Image, ImageDraw
+    return ImageDraw.Draw(Image.new("L", (10, 10)))
+
+
+def shaping_smoke_test(font, size=22):
+    """Render a conjunct two ways and see whether shaping changed anything.
+
+    'கி' must be narrower than the naive sum of its parts once shaped, and
+    a shaped 'ஸ்ரீ' differs in width from the unshaped sequence. If widths are
+    identical to the naive concatenation the font is being drawn unshaped.
+
+    font is a Pillow face or a path to one.
+    """
+    from PIL import ImageFont
+    if not hasattr(font, "getbbox"):
+        font = ImageFont.truetype(str(font), size)
+    draw = _draw()
+
+    def w(s):
+        return draw.textbbox((0, 0), s, font=font)[2]
+
+    # A conjunct that must reorder/ligate, vs its constituent codepoints.
+    conj = "ஸ்ரீ"
+    parts = sum(w(c) for c in conj)
+    return {"shaped_width": w(conj), "naive_sum": parts,
+            "differs": w(conj) != parts}
+
+
+def _static_facts(path):
+    """cmap, GSUB scripts and name-table metadata from one parse."""
+    from fontTools.ttLib import TTFont
+
+    tt = TTFont(str(path), fontNumber=0, lazy=True)
+    meta = {}
+    try:
+        for rec in tt["name"].names:
+            key = NAME_IDS.get(rec.nameID)
+            if key and key not in meta:
+                try:
+                    meta[key] = rec.toUnicode().strip()
+                except Exception:
+                    pass
+    except Exception:
+        pass
+
+    cmap = sorted(tt.getBestCmap().keys())
+
+    gsub = "GSUB" in tt
+    scripts = []
+    if gsub:
+        try:
+            for rec in tt["GSUB"].table.ScriptList.ScriptRecord:
+                scripts.append(rec.ScriptTag)
+        except Exception:
+            pass
+    tt.close()
+    return {"cmap": cmap, "has_gsub": gsub, "gsub_scripts": sorted(set(scripts)),
+            "meta": meta}
+
+
+class FontRegistry:
+    """Cached facts for every face in one font directory."""
+
+    def __init__(self, font_dir="fonts", cache_path=None):
+        self.font_dir = Path(font_dir)
+        self.cache_path = Path(cache_path) if cache_path else self.font_dir / REGISTRY_FILE
+        self.renderer = renderer_id()
+        self._files, self._faces = {}, {}
+        if self.cache_path.exists():
+            try:
+                data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+                if data.get("format") == FORMAT:
+                    self._files, self._faces = data["files"], data["faces"]
+            except (OSError, ValueError, KeyError):
+                print(f"[warn] ignoring unreadable {self.cache_path}")
+        self._pillow = {}
+        self._dirty = False
+        self._paths = {p.stem: p for p in font_paths(self.font_dir)}
+
+    # -- lookup ---------------------------------------------------------------
+
+    def paths(self, names=None):
+        """Sorted font paths, optionally restricted to these stems."""
+        paths = sorted(self._paths.values())
+        if names is not None:
+            wanted = set(names)
+            paths = [p for p in paths if p.stem in wanted]
+            missing = wanted - {p.stem for p in paths}
+            if missing:
+                raise FileNotFoundError(
+                    f"fonts not found in {self.font_dir}: {sorted(missing)}")
+        return paths
+
+    def key(self, stem):
+        """Content hash of a face, re-hashed only when its size or mtime moves."""
+        path = self._paths[stem]
+        st = path.stat()
+        rec = self._files.get(path.name)
+        if rec and rec["size"] == st.st_size and rec["mtime_ns"] == st.st_mtime_ns:
+            return rec["sha256"]
+        digest = file_hash(path)
+        self._files[path.name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                  "sha256": digest}
+        self._dirty = True
+        return digest
+
+    def entry(self, stem):
+        """Static facts for one face, parsed on first sight of its content."""
+        digest = self.key(stem)
+        entry = self._faces.get(digest)
+        if entry is None:
+            entry = _static_facts(self._paths[stem])
+            entry["measured"] = {}
+            self._faces[digest] = entry
+            self._dirty = True
+        return entry
+
+    def _measured(self, stem):
+        return self.entry(stem)["measured"].setdefault(self.renderer, {})
+
+    # -- the questions callers ask --------------------------------------------
+
+    def face(self, stem, size):
+        """Pillow face, opened once per process."""
+        from PIL import ImageFont
+        key = (stem, size)
+        if key not in self._pillow:
+            self._pillow[key] = ImageFont.truetype(str(self._paths[stem]), size)
+        return self._pillow[key]
+
+    def cmap(self, stem):
+        return set(self.entry(stem)["cmap"])
+
+    def probe_height(self, stem, size, probe=HEIGHT_PROBE):
+        """Bottom of the probe string's bounding box when drawn at y=0."""
+        heights = self._measured(stem).setdefault("probe_height", {})
+        k = f"{size}:{probe}"
+        if k not in heights:
+            heights[k] = _draw().textbbox((0, 0), probe, font=self.face(stem, size))[3]
+            self._dirty = True
+        return heights[k]
+
+    def shaping(self, stem, size=22):
+        tests = self._measured(stem).setdefault("shaping", {})
+        k = str(size)
+        if k not in tests:
+            tests[k] = shaping_smoke_test(self.face(stem, size), size)
+            self._dirty = True
+        return tests[k]
+
+    def common_coverage(self, names=None):
+        """Codepoints every selected face covers."""
+        paths = sorted(self._paths.values())
+        if names is not None:
+            wanted = set(names)
+            paths = [p for p in paths if p.stem in wanted]
+        common = None
+        for path in paths:
+            cmap = self.cmap(path.stem)
+            common = cmap if common is None else (common & cmap)
+        return common or set()
+
+    # -- persistence ----------------------------------------------------------
+
+    def save(self):
+        """Write the cache if anything was added. Atomic, so concurrent
+        renderers never see a half-written file."""
+        if not self._dirty:
+            return
+        present = {p.name for p in self._paths.values()}
+        files = {n: r for n, r in self._files.items() if n in present}
+        tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps({"format": FORMAT, "files": files,
+                                       "faces": self._faces}), encoding="utf-8")
+            os.replace(tmp, self.cache_path)
+        except OSError as exc:
+            print(f"[warn] could not persist font registry: {exc}")
+            tmp.unlink(missing_ok=True)
+            return
+        self._dirty = False
+
+
+_REGISTRIES = {}
+
+
+def registry(font_dir="fonts"):
+    """One registry per font directory per process."""
+    key = str(Path(font_dir).resolve())
+    if key not in _REGISTRIES:
+        _REGISTRIES[key] = FontRegistry(font_dir)
+    return _REGISTRIES[key]
@@ -0,0 +1,197 @@
+"""Catch lines too wide for the page before rendering them.
+
+render_page draws every line at x=PADDING on an A4_WIDTH canvas and never
+checks the width. A long line in a wide face -- 160-170 characters in
+TiroTamil or Yogeshwaran reach 2,600 px against 2,480 -- is clipped at the
+right edge while its .gt.txt keeps the full text, and nothing downstream
+notices.
+
+WidthIndex estimates every line's drawn width from per-(face, word) widths
+instead: the advance of every word but the last, the face's space advance
+between them, and the last word's ink extent, which is where clipping bites.
+Each distinct (face, word) pair is measured once, and the per-line sums are a
+single np.add.reduceat over all lines. On the corpus this lands within a
+pixel of textbbox for the whole line, at a fraction of the cost of drawing it.
+
+check() reports the lines that overflow. reassign() moves each one to the
+next face, in assignment order, that fits it; rechunk() splits it at a word
+boundary instead. render.generate(overflow=...) runs either before rendering.
+
+    python experiments/preflight.py --lines 20000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+
+class WidthIndex:
+    """Per-(face, word) widths, measured on first use."""
+
+    def __init__(self, fonts):
+        self.fonts = fonts                       # [(name, face), ...]
+        self._advance = {}
+        self._ink = {}
+        self._space = [face.getlength(" ") for _, face in fonts]
+
+    def _measure(self, table, fi, word, fn):
+        key = (fi, word)
+        if key not in table:
+            table[key] = fn(self.fonts[fi][1], word)
+        return table[key]
+
+    def widths(self, lines, assigned):
+        """Estimated right ink edge of each line drawn at x=0, as an array."""
+        if not len(lines):
+            return np.zeros(0)
+        tokens = [line.split(" ") for line in lines]
+        counts = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+        faces = np.asarray(assigned, dtype=np.int64)
+        flat = [w for t in tokens for w in t]
+        word_face = np.repeat(faces, counts)
+        last = np.zeros(len(flat), dtype=bool)
+        ends = np.cumsum(counts)
+        last[ends - 1] = True
+
+        # Measure each distinct (face, word, is-last) once.
+        vocab, word_ids = np.unique(np.asarray(flat, dtype=object), return_inverse=True)
+        pair = (word_face * len(vocab) + word_ids) * 2 + last
+        uniq, inverse = np.unique(pair, return_inverse=True)
+        sizes = np.empty(len(uniq))
+        for k, p in enumerate(uniq.tolist()):
+            fi, rest = divmod(p, len(vocab) * 2)
+            wid, is_last = divmod(rest, 2)
+            word = vocab[wid]
+            if is_last:
+                sizes[k] = self._measure(self._ink, fi, word,
+                                         lambda f, w: f.getbbox(w)[2] if w else 0)
+            else:
+                sizes[k] = self._measure(self._advance, fi, word,
+                                         lambda f, w: f.getlength(w))
+
+        starts = np.concatenate(([0], ends[:-1]))
+        space = np.asarray(self._space)[faces]
+        return np.add.reduceat(sizes[inverse], starts) + (counts - 1) * space
+
+
+def limit(cfg):
+    """Widest line that keeps the right margin equal to the left."""
+    return cfg.A4_WIDTH - 2 * cfg.PADDING
+
+
+def check(lines, assigned, index, cfg):
+    """(indices of overflowing lines, all estimated widths)."""
+    widths = index.widths(lines, assigned)
+    return np.flatnonzero(widths > limit(cfg)).tolist(), widths
+
+
+def reassign(lines, assigned, index, cfg):
+    """Move each overflowing line to the next face, in order, that fits it.
+
+    Returns (new assignment, lines still overflowing in every face). Only
+    the moved lines change face, so balance shifts by at most their count.
+    """
+    over, _ = check(lines, assigned, index, cfg)
+    assigned = list(assigned)
+    n_fonts = len(index.fonts)
+    stuck = []
+    for i in over:
+        for step in range(1, n_fonts):
+            fi = (assigned[i] + step) % n_fonts
+            if index.widths([lines[i]], [fi])[0] <= limit(cfg):
+                assigned[i] = fi
+                break
+        else:
+            stuck.append(i)
+    return assigned, stuck
+
+
+def rechunk(lines, assign, index, cfg, max_rounds=5):
+    """Split overflowing lines at word boundaries until every line fits.
+
+    assign(n) gives the font assignment for n lines (splitting shifts every
+    later line's position, so the assignment is redrawn each round). Returns
+    (lines, assignment, origin), origin[i] being the input line that new
+    line i came from, for carrying sources along.
+
+    Neither part of a split is ever empty: a line that is one word too wide
+    for the page is left whole, and check() still finds it afterwards.
+    """
+    origin = list(range(len(lines)))
+    assigned = assign(len(lines))
+    for _ in range(max_rounds):
+        over, _ = check(lines, assigned, index, cfg)
+        if not over:
+            break
+        over = set(over)
+        new_lines, new_origin = [], []
+        for i, line in enumerate(lines):
+            parts = _split(line, assigned[i], index, cfg) if i in over else None
+            for part in parts or (line,):
+                new_lines.append(part)
+                new_origin.append(origin[i])
+        if len(new_lines) == len(lines):
+            break                               # nothing left that can split
+        lines, origin = new_lines, new_origin
+        assigned = assign(len(lines))
+    return lines, assigned, origin
+
+
+def _split(line, face, index, cfg):
+    """(head, tail) at the last word boundary whose head fits face, or the
+    middle one if none does; None if the line has no boundary to split at."""
+    words = line.split(" ")
+    cuts = [k for k in range(1, len(words))
+            if " ".join(words[:k]).strip() and " ".join(words[k:]).strip()]
+    if not cuts:
+        return None
+    heads = [" ".join(words[:k]) for k in cuts]
+    fits = np.flatnonzero(index.widths(heads, [face] * len(heads)) <= limit(cfg))
+    cut = cuts[fits[-1]] if len(fits) else cuts[len(cuts) // 2]
+    return " ".join(words[:cut]), " ".join(words[cut:])
+
+
+def main():
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import time
+    import corpus
+    import render
+    from config import DefaultTamilConfig
+
+    ap = argparse.ArgumentParser(description="Report lines that overflow the page.")
+    ap.add_argument("--lines", type=int, default=None, help="default: every line")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--font-dir", default="fonts")
+    ap.add_argument("--verify", type=int, default=200,
+                    help="compare this many estimates against textbbox")
+    args = ap.parse_args()
+
+    cfg = DefaultTamilConfig()
+    fonts = render.load_fonts(args.font_dir, cfg.FONT_SIZE)
+    lines = corpus.select(corpus.build_pool(), n_lines=args.lines, seed=args.seed)
+    assigned = render.assign_fonts(len(lines), len(fonts))
+    index = WidthIndex(fonts)
+
+    started = time.perf_counter()
+    over, widths = check(lines, assigned, index, cfg)
+    elapsed = time.perf_counter() - started
+    print(f"{len(lines):,} lines, {len(index._advance) + len(index._ink):,} "
+          f"(face, word) widths measured in {elapsed:.1f}s")
+    print(f"limit {limit(cfg)} px; widest {widths.max():.0f} px; "
+          f"{len(over):,} lines overflow\n")
+    for i in sorted(over, key=lambda i: -widths[i])[:15]:
+        print(f"  line {i:>7}  {fonts[assigned[i]][0]:<16} {widths[i]:>6.0f} px  "
+              f"{len(lines[i])} chars")
+
+    sample = np.linspace(0, len(lines) - 1, min(args.verify, len(lines))).astype(int)
+    err = [widths[i] - fonts[assigned[i]][1].getbbox(lines[i])[2] for i in sample]
+    print(f"\nestimate - textbbox over {len(sample)} lines: "
+          f"min {min(err):+.0f}  max {max(err):+.0f}  mean {np.mean(err):+.2f} px")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
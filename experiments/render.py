@@ -22,47 +22,61 @@ Behaviour is otherwise identical, with two deliberate corrections:
    the pulli. A Tamil probe is used instead so tall glyphs are not clipped.
 """
 
+import hashlib
 import json
-import shutil
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, islice
 from pathlib import Path
 
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from tqdm import tqdm
 
 import sys
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from config import DefaultTamilConfig  # noqa: E402
+from gt_store import (PACK_PAGES, WRITE_THREADS, IndexWriter,  # noqa: E402,F401
+                      PackWriter, PageLedger, WriteBehind, index_path, pack_name,
+                      pair_digest, shard_dir, validate, write_pairs)
+from segmentation import ink_extent, projection_bands  # noqa: E402
 
-# Exercises ascender, descender, pulli and a two-part vowel sign.
-HEIGHT_PROBE = "ஆழ்ந்த கூஜா ஜஸ்ரீ"
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from font_registry import HEIGHT_PROBE, registry  # noqa: E402
+from word_cache import WordCache  # noqa: E402
 
 BINARY_THRESHOLD = 200      # grayscale cutoff for inverse binarisation
 PROJECTION_THRESHOLD = 10   # row-sum above which a row counts as ink
 CROP_PADDING = 3
 
+# Crop encodings. The renderer draws black on white, so crops are bilevel
+# apart from anti-aliased glyph edges; the 1-bit encodings drop those edges
+# at BINARY_THRESHOLD, the same cutoff segmentation uses for ink. Only the
+# gray encodings are lossless. experiments/bench_encoding.py measures them.
+ENCODINGS = {
+    "gray": None,                  # cv2 default, 8-bit LZW (the original)
+    "gray-raw": None,              # cv2, 8-bit uncompressed
+    "bilevel": "raw",              # Pillow, 1-bit packed
+    "bilevel-lzw": "tiff_lzw",
+    "g4": "group4",                # CCITT Group 4 fax
+}
+
 
 def load_fonts(font_dir, size, names=None):
     """Load fonts in deterministic (sorted) order.
 
     names, when given, selects a subset by filename stem. Sorting matters:
     os.listdir order is filesystem-dependent, so the original code's font
-    indexing was not portable between machines.
+    indexing was not portable between machines. Faces come from the font
+    registry, so each is opened once per process however often this is called.
     """
-    paths = sorted(p for p in Path(font_dir).iterdir()
-                   if p.suffix.lower() in (".ttf", ".otf"))
-    if names is not None:
-        wanted = set(names)
-        paths = [p for p in paths if p.stem in wanted]
-        missing = wanted - {p.stem for p in paths}
-        if missing:
-            raise FileNotFoundError(f"fonts not found in {font_dir}: {sorted(missing)}")
-
+    reg = registry(font_dir)
     fonts = []
-    for path in paths:
+    for path in reg.paths(names):
         try:
-            fonts.append((path.stem, ImageFont.truetype(str(path), size)))
+            fonts.append((path.stem, reg.face(path.stem, size)))
         except OSError as exc:
             print(f"[warn] skipping unreadable font {path.name}: {exc}")
     if not fonts:
@@ -79,181 +93,809 @@ def common_coverage(font_dir, names=None):
     Sundaram_0810 arrived it was the first face lacking a Tamil codepoint the
     corpus uses (U+0BB6, TAMIL LETTER SHA), and only luck kept the two
     affected lines off it.
+
+    cmaps come from the font registry, so only faces it has not seen before
+    are parsed.
     """
-    from fontTools.ttLib import TTFont
+    reg = registry(font_dir)
+    common = reg.common_coverage(names)
+    reg.save()
+    return common
 
-    paths = sorted(p for p in Path(font_dir).iterdir()
-                   if p.suffix.lower() in (".ttf", ".otf"))
-    if names is not None:
-        wanted = set(names)
-        paths = [p for p in paths if p.stem in wanted]
 
-    common = None
-    for path in paths:
-        tt = TTFont(str(path), fontNumber=0, lazy=True)
-        cmap = set(tt.getBestCmap().keys())
-        tt.close()
-        common = cmap if common is None else (common & cmap)
-    return common or set()
+def can_render(line, coverage):
+    """Whether every font can render line."""
+    return all(c.isspace() or ord(c) in coverage for c in line)
 
 
 def renderable(lines, coverage):
     """Split lines into those every font can render and those it cannot."""
     ok, bad = [], []
     for ln in lines:
-        safe = all(c.isspace() or ord(c) in coverage for c in ln)
-        (ok if safe else bad).append(ln)
+        (ok if can_render(ln, coverage) else bad).append(ln)
     return ok, bad
 
 
-def render_page(lines, page_fonts, out_path, cfg):
-    """Draw one A4 page, one line per row, using the supplied font pairing."""
-    image = Image.new("L", (cfg.A4_WIDTH, cfg.A4_HEIGHT), 255)
-    draw = ImageDraw.Draw(image)
+def render_page(lines, page_fonts, out_path, cfg, probe_heights=None, words=None):
+    """Draw one A4 page, one line per row, using the supplied font pairing.
+
+    Returns (page, drawn): the page as a grayscale array ready for
+    segment_page, and the lines that fitted. The page only touches disk when
+    out_path is given; otherwise it goes straight from Pillow's buffer to
+    segmentation with no TIFF encode, write, read and decode in between.
+
+    probe_heights maps font name to its HEIGHT_PROBE height (from the font
+    registry); without it every face on the page is measured here.
+
+    words, a word_cache.WordCache, composes each line from cached word
+    bitmaps instead of drawing it with draw.text.
+    """
+    if words is not None:
+        # Composed straight into the array segment_page takes; Pillow sees
+        # the page only if it is saved.
+        canvas = np.full((cfg.A4_HEIGHT, cfg.A4_WIDTH), 255, dtype=np.uint8)
+        draw = None
+    else:
+        canvas = None
+        image = Image.new("L", (cfg.A4_WIDTH, cfg.A4_HEIGHT), 255)
+        draw = ImageDraw.Draw(image)
 
-    probe = max(draw.textbbox((0, 0), HEIGHT_PROBE, font=f)[3] for _, f in page_fonts)
+    if probe_heights is not None:
+        probe = max(probe_heights[name] for name, _ in page_fonts)
+    else:
+        measure = draw or ImageDraw.Draw(Image.new("L", (1, 1)))
+        probe = max(measure.textbbox((0, 0), HEIGHT_PROBE, font=f)[3]
+                    for _, f in page_fonts)
     line_height = probe + cfg.LINE_SPACING
 
     drawn = []
-    for i, (line, (_, font)) in enumerate(zip(lines, page_fonts)):
+    for i, (line, (name, font)) in enumerate(zip(lines, page_fonts)):
         y = cfg.PADDING + i * line_height
         if y + probe + cfg.PADDING > cfg.A4_HEIGHT:
             break
-        draw.text((cfg.PADDING, y), line, font=font, fill=0)
+        if canvas is not None:
+            words.draw(canvas, (cfg.PADDING, y), line, name, font)
+        else:
+            draw.text((cfg.PADDING, y), line, font=font, fill=0)
         drawn.append(line)
 
-    image.save(out_path, "TIFF", dpi=(cfg.DPI, cfg.DPI))
-    return drawn
+    if canvas is None:
+        canvas = np.asarray(image)
+    elif out_path is not None:
+        image = Image.fromarray(canvas)
+    if out_path is not None:
+        image.save(out_path, "TIFF", dpi=(cfg.DPI, cfg.DPI))
+    return canvas, drawn
+
 
+def render_line(line, font, cfg, probe_height=None, words=None, name=None):
+    """Draw one line on a strip one page row tall and only as wide as it.
 
-def segment_page(image_path, out_dir, gt_lines, base_name, fonts_used):
+    The strip is one line pitch (probe height plus LINE_SPACING) tall and
+    the line's advance wide, with PADDING all round, and the line sits where
+    it would at the top of a page. A glyph that inks the right-hand PADDING
+    (an overhang past the advance) gets the strip redrawn a page wide, so
+    the crop segment_page cuts from the strip always matches the one it
+    would cut from a page: ~0.09 MB of pixels per corpus line on average,
+    against ~0.17 MB for a page-wide strip and ~8.7 MB for a page.
+
+    words, a word_cache.WordCache, composes the line from cached word
+    bitmaps; name is the face's cache key.
+    """
+    if probe_height is None:
+        probe_height = ImageDraw.Draw(Image.new("L", (1, 1))).textbbox(
+            (0, 0), HEIGHT_PROBE, font=font)[3]
+    height = cfg.PADDING + probe_height + cfg.LINE_SPACING + cfg.PADDING
+    laid = None
+    if words is not None:
+        laid = words.layout(line, name, font)
+        advance = laid[1]
+    else:
+        advance = font.getlength(line)
+    width = min(cfg.A4_WIDTH, cfg.PADDING + int(advance) + 1 + cfg.PADDING)
+    strip = _draw_strip(line, font, cfg, (width, height), words, name, laid)
+    if width < cfg.A4_WIDTH and (strip[:, -cfg.PADDING:] <= BINARY_THRESHOLD).any():
+        strip = _draw_strip(line, font, cfg, (cfg.A4_WIDTH, height), words, name, laid)
+    return strip
+
+
+def _draw_strip(line, font, cfg, size, words, name, laid):
+    if words is not None:
+        canvas = np.full(size[::-1], 255, dtype=np.uint8)
+        words.draw(canvas, (cfg.PADDING, cfg.PADDING), line, name, font, laid)
+        return canvas
+    image = Image.new("L", size, 255)
+    ImageDraw.Draw(image).text((cfg.PADDING, cfg.PADDING), line, font=font, fill=0)
+    return np.asarray(image)
+
+
+def encode_crop(crop, encoding="gray"):
+    """Encode one crop as TIFF bytes in the named encoding."""
+    if encoding == "gray":
+        return cv2.imencode(".tif", crop)[1].tobytes()
+    if encoding == "gray-raw":
+        return cv2.imencode(".tif", crop, [cv2.IMWRITE_TIFF_COMPRESSION, 1])[1].tobytes()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown crop encoding {encoding!r}; "
+                         f"expected one of {sorted(ENCODINGS)}")
+    import io
+    buf = io.BytesIO()
+    Image.fromarray(crop > BINARY_THRESHOLD).save(
+        buf, "TIFF", compression=ENCODINGS[encoding])
+    return buf.getvalue()
+
+
+def segment_page(page, out_dir, gt_lines, base_name, fonts_used, shard="",
+                 encoding="gray", first_line=1):
     """Recover line crops from the rendered page by horizontal projection.
 
     Deliberately re-derives the lines from pixels rather than reusing the
     layout coordinates, so training crops carry the same geometry a segmenter
-    produces at inference time. Returns the number of crops written.
+    produces at inference time. page is a grayscale array from render_page,
+    or a path to a saved page.
+
+    Pairs go to out_dir/shard, crops in the given encoding (see ENCODINGS),
+    numbered from first_line (a line canvas holds one line of a page).
+    Returns one pair-index record per crop written
+    (see gt_store), with paths relative to out_dir. With out_dir=None nothing
+    is written and each record carries the encoded pair as "data" instead,
+    for the caller to pack.
     """
-    image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
-    if image is None:
-        print(f"[warn] unreadable page {image_path}")
-        return 0
+    if isinstance(page, np.ndarray):
+        image = page
+    else:
+        image = cv2.imread(str(page), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f"[warn] unreadable page {page}")
+            return []
     height = image.shape[0]
 
     _, binary = cv2.threshold(image, BINARY_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
-    projection = np.sum(binary, axis=1)
-
-    bands, in_line, start = [], False, 0
-    for i, val in enumerate(projection):
-        if val > PROJECTION_THRESHOLD and not in_line:
-            start, in_line = i, True
-        elif val <= PROJECTION_THRESHOLD and in_line:
-            bands.append((start, i))
-            in_line = False
-    if in_line:
-        bands.append((start, height))
+    bands = projection_bands(binary, PROJECTION_THRESHOLD)
 
     if len(bands) != len(gt_lines):
         # Never silently misalign an image with the wrong transcription.
-        print(f"[warn] {base_name}: {len(bands)} bands for {len(gt_lines)} lines; "
-              f"skipping page")
-        return 0
-
-    out_dir = Path(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
-    written = 0
+        if len(gt_lines) == 1:
+            print(f"[warn] {base_name}_line_{first_line:03d}: {len(bands)} bands "
+                  f"for 1 line; skipping line")
+        else:
+            print(f"[warn] {base_name}: {len(bands)} bands for {len(gt_lines)} lines; "
+                  f"skipping page")
+        return []
+
+    dest = None
+    if out_dir is not None:
+        dest = Path(out_dir) / shard
+        dest.mkdir(parents=True, exist_ok=True)
+    records = []
     for idx, (y1, y2) in enumerate(bands):
         text = gt_lines[idx].strip()
         if not text:
             continue
         crop = image[max(0, y1 - CROP_PADDING):min(height, y2 + CROP_PADDING), :]
-        _, thresh = cv2.threshold(crop, BINARY_THRESHOLD, 255, cv2.THRESH_BINARY)
-        coords = cv2.findNonZero(255 - thresh)
-        if coords is not None:
-            x, _, w, _ = cv2.boundingRect(coords)
-            crop = crop[:, max(0, x - CROP_PADDING):min(crop.shape[1], x + w + CROP_PADDING)]
+        extent = ink_extent(crop <= BINARY_THRESHOLD)
+        if extent is not None:
+            x0, x1 = extent
+            crop = crop[:, max(0, x0 - CROP_PADDING):min(crop.shape[1], x1 + CROP_PADDING)]
+
+        line_no = first_line + idx
+        stem = f"{base_name}_line_{line_no:03d}"
+        tif = encode_crop(crop, encoding)
+        gt = text.encode("utf-8")
+        rel = f"{shard}/{stem}" if shard else stem
+        rec = {"stem": stem, "image": f"{rel}.tif", "gt": f"{rel}.gt.txt",
+               "line": line_no, "font": fonts_used[idx][0],
+               "image_bytes": len(tif), "gt_bytes": len(gt),
+               "sha256": pair_digest(tif, gt)}
+        if dest is None:
+            rec["data"] = (tif, gt)
+        else:
+            (dest / f"{stem}.tif").write_bytes(tif)
+            (dest / f"{stem}.gt.txt").write_bytes(gt)
+        records.append(rec)
+
+    return records
+
+
+def _pack_intact(out_dir, name, entries):
+    """The shard holds every byte the ledger says its pages wrote."""
+    path = out_dir / name
+    if not path.exists():
+        return False
+    end = max((max(r["image_offset"] + r["image_bytes"], r["gt_offset"] + r["gt_bytes"])
+               for e in entries for r in e["records"]), default=0)
+    return path.stat().st_size >= end and all(
+        r.get("pack") == name for e in entries for r in e["records"])
+
+
+def iter_fonts(n_fonts, assignment="round-robin", seed=0):
+    """Endless font indices in line order; see assign_fonts."""
+    if assignment == "round-robin":
+        for i in count():
+            yield i % n_fonts
+    if assignment == "random":
+        import random as _random
+        rng = _random.Random(seed)
+        while True:
+            yield rng.randrange(n_fonts)
+    raise ValueError(f"unknown assignment {assignment!r}")
+
+
+def assign_fonts(n_lines, n_fonts, assignment="round-robin", seed=0):
+    """Font index for every line, fixed before any page is rendered.
+
+    Drawing the whole assignment up front, in line order, is what makes the
+    output independent of how pages are spread over workers: a shared
+    random.Random consumed page by page would hand each worker a different
+    stream depending on scheduling. The sequence is the same one the serial
+    loop used to draw, so existing seeds reproduce existing corpora.
+    """
+    return list(islice(iter_fonts(n_fonts, assignment, seed), n_lines))
+
+
+# Per-process rendering state. Set once by _init_worker so faces are loaded
+# once per worker rather than pickled into every task.
+_WORKER = {}
+
+
+def _init_worker(font_dir, font_names, cfg, out_dir, page_dir, probes,
+                 shard_pages, encoding, layout="page", engine="text"):
+    """out_dir=None means the worker writes nothing: crops travel back to the
+    parent, which packs them or writes them behind. shard_pages only names
+    the loose layout's subdirectories; packed output passes None."""
+    _WORKER.update(
+        fonts=load_fonts(font_dir, cfg.FONT_SIZE, font_names), cfg=cfg,
+        out_dir=out_dir and Path(out_dir), page_dir=page_dir and Path(page_dir),
+        probes=probes, shard_pages=shard_pages, encoding=encoding, layout=layout,
+        words=WordCache() if engine == "words" else None)
+
+
+def _render_one(task):
+    """Render and segment one page. Returns (page, index records, fonts drawn)."""
+    page, page_lines, font_idx = task
+    fonts = _WORKER["fonts"]
+    page_fonts = [fonts[i] for i in font_idx]
+
+    base = f"page_{page + 1:06d}"
+    shard = shard_dir(page, _WORKER["shard_pages"])
+    if _WORKER["layout"] == "line":
+        records = []
+        for i, (line, (name, font)) in enumerate(zip(page_lines, page_fonts)):
+            image = render_line(line, font, _WORKER["cfg"], _WORKER["probes"][name],
+                                _WORKER["words"], name)
+            records += segment_page(image, _WORKER["out_dir"], [line], base,
+                                    [(name, font)], shard, _WORKER["encoding"],
+                                    first_line=i + 1)
+        return page, records, [name for name, _ in page_fonts]
+
+    keep = _WORKER["page_dir"] and _WORKER["page_dir"] / f"{base}.tif"
+    image, drawn = render_page(page_lines, page_fonts, keep, _WORKER["cfg"],
+                               _WORKER["probes"], _WORKER["words"])
+    records = segment_page(image, _WORKER["out_dir"], drawn, base, page_fonts, shard,
+                           _WORKER["encoding"])
+    return page, records, [name for (name, _), _line in zip(page_fonts, drawn)]
+
+
+def _config_summary(cfg):
+    return {
+        "dpi": cfg.DPI, "font_size": cfg.FONT_SIZE,
+        "line_spacing": cfg.LINE_SPACING, "lines_per_page": cfg.LINES_PER_PAGE,
+        "padding": cfg.PADDING,
+        "page_px": [cfg.A4_WIDTH, cfg.A4_HEIGHT],
+    }
+
+
+ENGINES = ("text", "words")
+
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}; expected one of {ENGINES}")
+    return engine
 
-        stem = f"{base_name}_line_{idx + 1:03d}"
-        cv2.imwrite(str(out_dir / f"{stem}.tif"), crop)
-        (out_dir / f"{stem}.gt.txt").write_text(text, encoding="utf-8")
-        written += 1
 
-    return written
+def _check_encoding(cfg, encoding):
+    encoding = encoding or getattr(cfg, "CROP_ENCODING", "gray")
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown crop encoding {encoding!r}; "
+                         f"expected one of {sorted(ENCODINGS)}")
+    return encoding
 
 
 def generate(lines, out_dir, font_dir="fonts", font_names=None,
-             assignment="round-robin", seed=0, cfg=None, keep_pages=False):
+             assignment="round-robin", seed=0, cfg=None, keep_pages=False,
+             jobs=1, shard_pages=None, sources=None, packed=False,
+             encoding=None, resume=True, store=None, layout="page",
+             engine="text", overflow=None, io_threads=WRITE_THREADS):
     """Render `lines` to paired .tif/.gt.txt crops under out_dir.
 
+    jobs > 1 spreads pages over a process pool. Each page is a pure function
+    of its lines and their pre-assigned fonts, so crops, transcriptions and
+    font counts are byte-identical whatever the worker count.
+
+    shard_pages, when set, puts each run of that many pages in its own
+    subdirectory (gt/000/, gt/001/, ...) instead of one flat directory.
+    sources, when given, is each line's source stem, recorded in the index.
+    Either way every pair is listed in <out_dir>.index.jsonl (see gt_store).
+
+    packed=True writes pairs into shard files under out_dir (one per
+    shard_pages pages, default gt_store.PACK_PAGES) instead of loose files;
+    read them with gt_store.PairReader or unpack with gt_store.export_loose.
+
+    encoding picks the crop format (see ENCODINGS); None takes
+    cfg.CROP_ENCODING.
+
+    Finished pages are recorded in <out_dir>.pages.jsonl, keyed by their
+    lines, fonts and every setting above. With resume (the default) a re-run
+    renders only pages that are missing or whose key changed and takes the
+    rest from the ledger; the manifest comes out as if rendered in one go.
+    Packed output resumes a whole shard at a time.
+
+    layout="line" draws each line on its own strip (render_line)
+    instead of 50 to an A4 page, and segments that the same way. A line that
+    does not come back as exactly one band then costs that line rather than
+    its whole page. Stems, sharding and the index are the same as for pages;
+    keep_pages has nothing to keep.
+
+    engine="words" draws lines from a per-worker cache of word bitmaps
+    (word_cache.py) instead of shaping each line with draw.text. A word can
+    land a pixel from where draw.text puts it, so the crops are close to, not
+    identical with, the default engine's; experiments/bench_words.py says
+    how close.
+
+    overflow runs preflight.py's width check first, for lines too wide for
+    the page in their assigned face: "report" lists them, "reassign" moves
+    each to the next face that fits, "rechunk" splits it at a word boundary
+    (so later lines shift and crops_written can exceed requested_lines). The
+    manifest's "overflow" records what was found and done.
+
+    io_threads > 0 has workers hand encoded loose pairs back to be written by
+    a bounded thread pool here (gt_store.WriteBehind), so rendering the next
+    page never waits on file creation; 0 has each worker write its own.
+
+    store, an artifacts.ArtifactStore, shares pairs between runs: pages whose
+    lines are all stored are linked (or, packed, copied) from it instead of
+    rendered, rendered pairs are added to it, and index records gain the
+    pair's store "key".
+
     Returns a manifest dict suitable for writing next to the corpus.
     """
     cfg = cfg or DefaultTamilConfig()
+    encoding = _check_encoding(cfg, encoding)
+    _check_engine(engine)
+    if layout not in ("page", "line"):
+        raise ValueError(f"unknown layout {layout!r}; expected 'page' or 'line'")
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    page_dir = out_dir.parent / f"{out_dir.name}_pages"
-    page_dir.mkdir(parents=True, exist_ok=True)
-
-    fonts = load_fonts(font_dir, cfg.FONT_SIZE, font_names)
-    n_fonts = len(fonts)
-
-    if assignment == "round-robin":
-        pick = lambda i: fonts[i % n_fonts]
-    elif assignment == "random":
-        import random as _random
-        rng = _random.Random(seed)
-        pick = lambda i: fonts[rng.randrange(n_fonts)]
-    else:
-        raise ValueError(f"unknown assignment {assignment!r}")
+    # Full pages are only written for inspection; segmentation reads them
+    # from memory either way.
+    page_dir = None
+    if keep_pages and layout == "page":
+        page_dir = out_dir.parent / f"{out_dir.name}_pages"
+        page_dir.mkdir(parents=True, exist_ok=True)
+
+    faces = load_fonts(font_dir, cfg.FONT_SIZE, font_names)
+    names = [name for name, _ in faces]
+    n_fonts = len(names)
+    reg = registry(font_dir)
+    probes = {name: reg.probe_height(name, cfg.FONT_SIZE) for name in names}
+    requested = len(lines)
+    assigned = assign_fonts(len(lines), n_fonts, assignment, seed)
+    overflow_report = None
+    if overflow is not None:
+        lines, assigned, sources, overflow_report = _preflight(
+            lines, assigned, sources, faces, cfg, overflow,
+            lambda n: assign_fonts(n, n_fonts, assignment, seed))
 
     lpp = cfg.LINES_PER_PAGE
     n_pages = (len(lines) + lpp - 1) // lpp
-    total, font_counts = 0, {name: 0 for name, _ in fonts}
-
-    for page in tqdm(range(n_pages), desc=f"render {out_dir.name}", unit="page"):
-        start = page * lpp
-        page_lines = lines[start:start + lpp]
-        page_fonts = [pick(start + i) for i in range(len(page_lines))]
-
-        base = f"page_{page + 1:06d}"
-        img_path = page_dir / f"{base}.tif"
-
-        drawn = render_page(page_lines, page_fonts, img_path, cfg)
-        written = segment_page(img_path, out_dir, drawn, base, page_fonts)
-        total += written
-        for (name, _), line in zip(page_fonts, drawn):
-            font_counts[name] += 1
-
-        if not keep_pages:
-            img_path.unlink(missing_ok=True)
-
-    if not keep_pages:
-        shutil.rmtree(page_dir, ignore_errors=True)
+    config = _config_summary(cfg)
+
+    # Everything besides its own lines and fonts that decides a page's bytes.
+    # Fonts go in by content, so replacing a font file re-renders its pages.
+    settings = json.dumps({"config": config, "encoding": encoding, "layout": layout,
+                           "engine": engine, "packed": packed, "shard_pages": shard_pages,
+                           "renderer": reg.renderer,
+                           "fonts": {name: reg.key(name) for name in names}},
+                          sort_keys=True)
+    reg.save()
+
+    def page_key(page):
+        lo, hi = page * lpp, (page + 1) * lpp
+        blob = json.dumps([settings, page, lines[lo:hi],
+                           [names[f] for f in assigned[lo:hi]]], ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    ledger = PageLedger(out_dir, resume=resume)
+    keys = [page_key(page) for page in range(n_pages)]
+    done = [ledger.get(page, key) for page, key in enumerate(keys)]
+    if packed:
+        # A shard is rewritten from its first page, so a page only counts as
+        # done if its whole shard is, and the shard file is all there.
+        per_shard = shard_pages or PACK_PAGES
+        for first in range(0, n_pages, per_shard):
+            pages = range(first, min(first + per_shard, n_pages))
+            if not all(done[p] for p in pages) or not _pack_intact(
+                    out_dir, pack_name(first, shard_pages), [done[p] for p in pages]):
+                for p in pages:
+                    done[p] = None
+
+    # Pages whose every line is already in the artifact store are assembled
+    # from it rather than rendered. Blank lines never reach the store, so a
+    # page holding one is always rendered.
+    stored = set()
+    if store is not None:
+        pair_settings = json.dumps({"config": config, "encoding": encoding,
+                                    "layout": layout, "engine": engine,
+                                    "renderer": reg.renderer},
+                                   sort_keys=True)
+        font_hash = {name: reg.key(name) for name in names}
+        pair_keys = [store.key(line, font_hash[names[f]], pair_settings)
+                     for line, f in zip(lines, assigned)]
+        for page in range(n_pages):
+            lo, hi = page * lpp, min((page + 1) * lpp, len(lines))
+            if done[page] is None and all(
+                    lines[i].strip() and store.has(pair_keys[i]) for i in range(lo, hi)):
+                stored.add(page)
+
+    def forget(page):
+        # A page about to be re-rendered may write fewer pairs than last time,
+        # and its old .box/.lstmf no longer match. Store-backed output is
+        # cleared of every stem the page could use, so rendering never writes
+        # through a hardlink into the store.
+        if packed:
+            return
+        entry = ledger.entries.get(page)
+        stems = {out_dir / r["image"][:-len(".tif")] for r in entry["records"]} \
+            if entry is not None else set()
+        if store is not None:
+            rel = out_dir / shard_dir(page, shard_pages)
+            stems.update(rel / f"page_{page + 1:06d}_line_{i + 1:03d}" for i in range(lpp))
+        for stem in stems:
+            for suffix in (".tif", ".gt.txt", ".box", ".lstmf"):
+                Path(f"{stem}{suffix}").unlink(missing_ok=True)
+
+    def tasks():
+        for page in range(n_pages):
+            if done[page] is None and page not in stored:
+                forget(page)
+                yield (page, lines[page * lpp:(page + 1) * lpp],
+                       assigned[page * lpp:(page + 1) * lpp])
+
+    def assemble(page):
+        # What _render_one would return, from the store.
+        forget(page)
+        base, shard = f"page_{page + 1:06d}", shard_dir(page, shard_pages)
+        records, fonts = [], []
+        for i in range(page * lpp, min((page + 1) * lpp, len(lines))):
+            line, key, font = i - page * lpp + 1, pair_keys[i], names[assigned[i]]
+            stem = f"{base}_line_{line:03d}"
+            rel = f"{shard}/{stem}" if shard and not packed else stem
+            tif, gt = store.read(key, ".tif"), store.read(key, ".gt.txt")
+            rec = {"stem": stem, "image": f"{rel}.tif", "gt": f"{rel}.gt.txt",
+                   "line": line, "font": font,
+                   "image_bytes": len(tif), "gt_bytes": len(gt),
+                   "sha256": pair_digest(tif, gt)}
+            if packed:
+                rec["data"] = (tif, gt)
+            else:
+                (out_dir / shard).mkdir(parents=True, exist_ok=True)
+                store.place(key, out_dir / rel)
+            records.append(rec)
+            fonts.append(font)
+        return page, records, fonts
+
+    def in_order(rendered):
+        # Interleave finished pages from the ledger with freshly rendered ones.
+        rendered = iter(rendered)
+        for page in range(n_pages):
+            if done[page] is not None:
+                yield page, done[page]["records"], done[page]["fonts"], False
+            elif page in stored:
+                yield (*assemble(page), True)
+            else:
+                yield (*next(rendered), True)
+
+    total, font_counts = 0, {name: 0 for name in names}
+    todo = sum(entry is None for entry in done)
+    if todo < n_pages:
+        print(f"[render] resuming: {n_pages - todo:,} of {n_pages:,} pages already done")
+    if stored:
+        print(f"[render] {len(stored):,} of {todo:,} pages assembled from {store.root}")
+    todo -= len(stored)
+
+    writer = WriteBehind(io_threads) if io_threads and not packed else None
+    init = (font_dir, font_names, cfg, None if packed or writer else out_dir, page_dir,
+            probes, None if packed else shard_pages, encoding, layout, engine)
+    jobs = max(1, min(jobs or 1, todo or 1))
+    progress = tqdm(total=n_pages, desc=f"render {out_dir.name}", unit="page")
+    index = IndexWriter(out_dir)
+    pack = PackWriter(out_dir, shard_pages) if packed else None
+
+    # A page enters the ledger, and its pairs the store, only once its files
+    # are on disk; with write-behind that is some pages after it was handed in.
+    unsettled = deque()
+
+    def settle(wait=False):
+        while unsettled and (wait or all(f.done() for f in unsettled[0][3])):
+            page, drawn_fonts, out, futures = unsettled.popleft()
+            for f in futures:
+                f.result()
+            if store is not None and pack is None:
+                for rec in out:
+                    store.adopt(rec["key"], out_dir / rec["image"][:-len(".tif")])
+            ledger.add(page, keys[page], drawn_fonts, out)
+
+    def collect(results):
+        nonlocal total
+        for page, records, drawn_fonts, fresh in results:
+            total += len(records)
+            out, futures = [], []
+            for r in records:
+                i = page * lpp + r["line"] - 1
+                if fresh:
+                    rec = {"stem": r["stem"], "image": r["image"], "gt": r["gt"],
+                           "page": page + 1, "line": r["line"], "font": r["font"],
+                           "source": None, "image_bytes": r["image_bytes"],
+                           "gt_bytes": r["gt_bytes"], "sha256": r["sha256"]}
+                    if store is not None:
+                        rec["key"] = pair_keys[i]
+                        if pack is not None:
+                            store.put(rec["key"], *r["data"])
+                    if pack is not None:
+                        rec.update(pack.write(page, *r["data"]))
+                    elif "data" in r:
+                        futures.append(writer.write(out_dir / r["image"], r["data"][0]))
+                        futures.append(writer.write(out_dir / r["gt"], r["data"][1]))
+                else:
+                    rec = dict(r)
+                rec["source"] = sources[i] if sources is not None else None
+                index.write(rec)
+                out.append(rec)
+            if fresh:
+                if pack is not None:
+                    pack.flush()
+                unsettled.append((page, drawn_fonts, out, futures))
+            settle()
+            for name in drawn_fonts:
+                font_counts[name] += 1
+            progress.update()
+        if writer is not None:
+            writer.close()
+        settle(wait=True)
+
+    try:
+        if todo == 0:
+            collect(in_order(()))
+        elif jobs == 1:
+            _init_worker(*init)
+            collect(in_order(map(_render_one, tasks())))
+        else:
+            # Results come back in page order; chunking keeps IPC off the
+            # critical path without letting one worker hoard the tail.
+            chunk = max(1, min(16, todo // (jobs * 8)))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                     initargs=init) as ex:
+                collect(in_order(ex.map(_render_one, tasks(), chunksize=chunk)))
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        index.abort()
+        ledger.close()
+        raise
+    finally:
+        progress.close()
+        if pack is not None:
+            pack.close()
+    index.close()
+
+    # Pages a previous, longer run left behind.
+    for page in [p for p in ledger.entries if p >= n_pages]:
+        forget(page)
+    if packed:
+        last = pack_name(n_pages - 1, shard_pages) if n_pages else ""
+        for stale in out_dir.glob("shard-*.pack"):
+            if stale.name > last:
+                stale.unlink()
+    ledger.compact(range(n_pages))
 
     manifest = {
         "output_dir": str(out_dir),
-        "requested_lines": len(lines),
+        "requested_lines": requested,
         "crops_written": total,
         "fonts": sorted(font_counts),
         "n_fonts": n_fonts,
         "font_line_counts": font_counts,
         "assignment": assignment,
         "seed": seed,
-        "config": {
-            "dpi": cfg.DPI, "font_size": cfg.FONT_SIZE,
-            "line_spacing": cfg.LINE_SPACING, "lines_per_page": cfg.LINES_PER_PAGE,
-            "padding": cfg.PADDING,
-            "page_px": [cfg.A4_WIDTH, cfg.A4_HEIGHT],
-        },
+        "shard_pages": shard_pages,
+        "packed": packed,
+        "encoding": encoding,
+        "layout": layout,
+        "engine": engine,
+        "overflow": overflow_report,
+        "index": str(index.path),
+        "config": config,
     }
-    (out_dir.parent / f"{out_dir.name}.manifest.json").write_text(
-        json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    _write_manifest(out_dir, manifest)
     return manifest
 
 
-def validate(out_dir):
-    """Every .tif has a .gt.txt and vice versa."""
-    files = list(Path(out_dir).iterdir())
-    imgs = {f.name[:-4] for f in files if f.name.endswith(".tif")}
-    gts = {f.name[:-7] for f in files if f.name.endswith(".gt.txt")}
-    return {"images": len(imgs), "transcriptions": len(gts),
-            "orphan_images": sorted(imgs - gts)[:10],
-            "orphan_transcriptions": sorted(gts - imgs)[:10]}
+def _preflight(lines, assigned, sources, faces, cfg, mode, assign):
+    """Apply generate's overflow= mode; returns lines, assignment, sources
+    and the manifest's overflow report."""
+    import preflight
+    if mode not in ("report", "reassign", "rechunk"):
+        raise ValueError(f"unknown overflow mode {mode!r}; "
+                         f"expected 'report', 'reassign' or 'rechunk'")
+    index = preflight.WidthIndex(faces)
+    over, widths = preflight.check(lines, assigned, index, cfg)
+    report = {"mode": mode, "limit_px": preflight.limit(cfg),
+              "overflowing": len(over),
+              "lines": [{"line": i, "font": faces[assigned[i]][0],
+                         "width_px": round(float(widths[i]))} for i in over[:50]]}
+    if over:
+        print(f"[render] {len(over):,} lines wider than {report['limit_px']} px "
+              f"in their assigned face ({mode})")
+    if mode == "reassign" and over:
+        assigned, stuck = preflight.reassign(lines, assigned, index, cfg)
+        report.update(reassigned=len(over) - len(stuck), unresolved=stuck)
+    elif mode == "rechunk" and over:
+        before = len(lines)
+        lines, assigned, origin = preflight.rechunk(lines, assign, index, cfg)
+        if sources is not None:
+            sources = [sources[o] for o in origin]
+        stuck, _ = preflight.check(lines, assigned, index, cfg)
+        report.update(lines_added=len(lines) - before, unresolved=stuck)
+        if stuck:
+            print(f"[render] {len(stuck):,} lines still too wide after rechunk "
+                  f"(a single word wider than the page)")
+    return lines, assigned, sources, report
+
+
+def _write_manifest(out_dir, manifest):
+    """Replace <out_dir>.manifest.json in one step: a reader sees the old
+    manifest or the new one, never half of either."""
+    path = out_dir.parent / f"{out_dir.name}.manifest.json"
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _in_order(ex, fn, tasks, window):
+    """ex.map without reading ahead: at most `window` tasks in flight.
+
+    Executor.map submits the whole iterable before yielding anything, which
+    for a corpus larger than memory is the whole corpus. Each task here is
+    (work, passenger); the passenger comes back untouched with its result.
+    """
+    pending = deque()
+    for work, passenger in tasks:
+        pending.append((ex.submit(fn, work), passenger))
+        if len(pending) >= window:
+            fut, passenger = pending.popleft()
+            yield fut.result(), passenger
+    while pending:
+        fut, passenger = pending.popleft()
+        yield fut.result(), passenger
+
+
+def stream(records, font_dir="fonts", font_names=None, assignment="round-robin",
+           seed=0, cfg=None, jobs=1, shard_pages=None, encoding=None,
+           layout="page", window=None, font_counts=None, engine="text"):
+    """Render any iterable of lines, yielding pair records page by page.
+
+    records are lines, or (line, source) pairs. Each yielded record is an
+    index record (see gt_store) plus "data": the encoded .tif and .gt.txt
+    bytes. Lines are read one page ahead of rendering, and at most `window`
+    pages (default 4 per job) are in flight, so memory stays flat however
+    long the input is. Output is the same as generate() for the same lines
+    and arguments.
+
+    Feed the records to gt_store.write_pairs for loose or packed output, or
+    anywhere else. font_counts, if given, is filled with lines drawn per font,
+    as in generate's manifest.
+    """
+    cfg = cfg or DefaultTamilConfig()
+    encoding = _check_encoding(cfg, encoding)
+    _check_engine(engine)
+    names = [name for name, _ in load_fonts(font_dir, cfg.FONT_SIZE, font_names)]
+    reg = registry(font_dir)
+    probes = {name: reg.probe_height(name, cfg.FONT_SIZE) for name in names}
+    reg.save()
+    if font_counts is not None:
+        font_counts.update({name: 0 for name in names})
+
+    lpp = cfg.LINES_PER_PAGE
+    fonts = iter_fonts(len(names), assignment, seed)
+    items = ((r, None) if isinstance(r, str) else tuple(r) for r in records)
+
+    def tasks():
+        for page in count():
+            chunk = list(islice(items, lpp))
+            if not chunk:
+                return
+            page_lines = [line for line, _ in chunk]
+            yield ((page, page_lines, list(islice(fonts, len(chunk)))),
+                   [source for _, source in chunk])
+
+    init = (font_dir, font_names, cfg, None, None, probes, shard_pages, encoding,
+            layout, engine)
+    jobs = max(1, jobs or 1)
+    if jobs == 1:
+        _init_worker(*init)
+        results = ((_render_one(work), sources) for work, sources in tasks())
+        yield from _stream_records(results, font_counts)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=init) as ex:
+        results = _in_order(ex, _render_one, tasks(), window or jobs * 4)
+        yield from _stream_records(results, font_counts)
+
+
+def _stream_records(results, font_counts):
+    for (page, records, drawn_fonts), sources in results:
+        for r in records:
+            data = r.pop("data")
+            rec = {"stem": r["stem"], "image": r["image"], "gt": r["gt"],
+                   "page": page + 1, "line": r["line"], "font": r["font"],
+                   "source": sources[r["line"] - 1],
+                   "image_bytes": r["image_bytes"], "gt_bytes": r["gt_bytes"],
+                   "sha256": r["sha256"], "data": data}
+            yield rec
+        if font_counts is not None:
+            for name in drawn_fonts:
+                font_counts[name] += 1
+
+
+def generate_stream(records, out_dir, font_dir="fonts", font_names=None,
+                    assignment="round-robin", seed=0, cfg=None, jobs=1,
+                    shard_pages=None, packed=False, encoding=None, layout="page",
+                    engine="text", io_threads=WRITE_THREADS):
+    """generate() for input that does not fit in memory.
+
+    Streams `records` (lines or (line, source) pairs) through stream() into
+    gt_store.write_pairs, so neither the lines nor the pairs are ever held in
+    full. Output and manifest match generate() with the same arguments; there
+    is no resume ledger, artifact store or overflow preflight on this path
+    (the manifest's "overflow" is null).
+    """
+    cfg = cfg or DefaultTamilConfig()
+    encoding = _check_encoding(cfg, encoding)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    counts, requested = {}, 0
+
+    def counted(items):
+        nonlocal requested
+        for item in items:
+            requested += 1
+            yield item
+
+    # Packed records keep bare stems; shard_pages then only groups pages
+    # into pack files.
+    pairs = stream(counted(records), font_dir, font_names, assignment, seed, cfg,
+                   jobs, None if packed else shard_pages, encoding, layout,
+                   font_counts=counts, engine=engine)
+    total = write_pairs(out_dir, tqdm(pairs, desc=f"render {out_dir.name}", unit="line"),
+                        packed=packed, shard_pages=shard_pages, threads=io_threads)
+    manifest = {
+        "output_dir": str(out_dir),
+        "requested_lines": requested,
+        "crops_written": total,
+        "fonts": sorted(counts),
+        "n_fonts": len(counts),
+        "font_line_counts": counts,
+        "assignment": assignment,
+        "seed": seed,
+        "shard_pages": shard_pages,
+        "packed": packed,
+        "encoding": encoding,
+        "layout": layout,
+        "engine": engine,
+        "overflow": None,
+        "index": str(index_path(out_dir)),
+        "config": _config_summary(cfg),
+    }
+    _write_manifest(out_dir, manifest)
+    return manifest
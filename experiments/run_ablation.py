@@ -38,7 +38,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 import corpus  # noqa: E402
 from render import load_fonts  # noqa: E402
-from runner import Variant, run_grid  # noqa: E402
+from runner import ARTIFACTS, Variant, run_grid  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # Fixed quantities shared across grids.
@@ -173,11 +173,22 @@ def main():
                     help="recompute variants that already have result.json")
     ap.add_argument("--keep-images", action="store_true",
                     help="retain rendered crops (large: ~2.5 GB per 100k lines)")
+    ap.add_argument("--early-stop", type=int, default=None, metavar="ITERATIONS",
+                    help="stop a variant once its error has not improved for this "
+                         "many iterations (exploratory runs: the tables assume "
+                         "every variant's full budget)")
+    ap.add_argument("--early-stop-metric", choices=["eval", "train"], default="eval",
+                    help="BCER to watch for --early-stop")
+    ap.add_argument("--no-store", action="store_true",
+                    help="render and prepare every variant from scratch instead "
+                         "of sharing pairs and .lstmf files via results/artifacts")
     args = ap.parse_args()
 
     pool = corpus.build_pool()
     all_fonts = [name for name, _ in load_fonts(args.font_dir, 22)]
     variants = build(args.experiment, pool, all_fonts)
+    for v in variants:
+        v.early_stop, v.early_stop_metric = args.early_stop, args.early_stop_metric
 
     print(f"{len(all_fonts)} fonts available, "
           f"{sum(len(v) for v in pool.values()):,} corpus lines\n")
@@ -206,7 +217,8 @@ def main():
         return 1
 
     run_grid(variants, test_dir, tessdata,
-             force=args.force, keep_images=args.keep_images)
+             force=args.force, keep_images=args.keep_images,
+             store_dir=None if args.no_store else ARTIFACTS)
 
     print("\nAggregate with:  python experiments/aggregate.py")
     return 0
@@ -17,16 +17,24 @@ import time
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import corpus  # noqa: E402
 import render  # noqa: E402
+from artifacts import ArtifactStore  # noqa: E402
 import train as trainer  # noqa: E402
+import trainlog  # noqa: E402
+from gt_store import index_path, ledger_path, lstmf_ledger_path, read_index  # noqa: E402
 from tamil_ocr_eval import score_pair, aggregate, bootstrap_ci, confusion_counts  # noqa: E402
 
 RESULTS = Path("results")
 JOURNAL = RESULTS / "journal.jsonl"
+# Rendered pairs and their .box/.lstmf, shared by every variant (artifacts.py).
+ARTIFACTS = RESULTS / "artifacts"
+# Test-set predictions by model and image hash (ocrpool.PredictionCache).
+PREDICTIONS = RESULTS / "predictions.jsonl"
 
 # Computed once: the codepoints every typeface can render. Shared by all
 # variants so the candidate line pool is identical across the grid.
@@ -47,6 +55,11 @@ class Variant:
     # ablation tables are not on the same footing.
     max_iterations: int = 100_000
     start_model: str = "tam"
+    # Stop once eval (or train) BCER has not improved for this many
+    # iterations (trainlog.Plateau). None runs the full budget above, which
+    # is what keeps the tables comparable; set it for exploratory sweeps.
+    early_stop: Optional[int] = None
+    early_stop_metric: str = "eval"
 
     def dir(self):
         return RESULTS / self.experiment / self.name
@@ -91,11 +104,16 @@ def score(gt_dir, pred_dir, bootstrap=2000, top_confusions=30):
     return agg
 
 
-def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False):
+def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False,
+                store_dir=ARTIFACTS):
     """Generate -> train -> recognise -> score for one variant.
 
     test_dir is the fixed held-out real-document test set. It is never
     regenerated and never varies between variants; that is the whole point.
+
+    store_dir holds pairs and .lstmf files other variants already made; a
+    variant links what it can from there and adds what it had to make.
+    None renders and prepares everything from scratch.
     """
     vdir = v.dir()
     result_path = vdir / "result.json"
@@ -128,16 +146,23 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
 
     # 2. render
     gt_dir = vdir / "gt"
+    store = ArtifactStore(store_dir) if store_dir is not None else None
     manifest = render.generate(
         lines, gt_dir, font_names=v.font_names,
-        assignment="round-robin", seed=v.seed)
+        assignment="round-robin", seed=v.seed, store=store)
 
     # 3. train
     model_name = f"{v.experiment}_{v.name}"
+    progress = trainlog.TrainingLog(
+        trainlog.Plateau(v.early_stop, metric=v.early_stop_metric)
+        if v.early_stop else None)
     model_path = trainer.train(
         gt_dir, model_name, vdir / "model",
         start_model=v.start_model, max_iterations=v.max_iterations,
-        log_path=vdir / "train.log")
+        log_path=vdir / "train.log", progress=progress)
+    if store is not None:
+        stored = store.harvest(gt_dir, read_index(index_path(gt_dir)))
+        print(f"    {stored:,} of {manifest['crops_written']:,} .lstmf in {store.root}")
 
     # tesseract wants the model discoverable by -l <name> in a tessdata dir
     staging = vdir / "tessdata"
@@ -147,7 +172,7 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
     # 4. recognise the FIXED test set
     pred_dir = vdir / "pred"
     infer = trainer.recognise(
-        Path(test_dir) / "images", pred_dir, model_name, staging)
+        Path(test_dir) / "images", pred_dir, model_name, staging, cache=PREDICTIONS)
 
     # 5. score
     agg = score(Path(test_dir) / "gt", pred_dir)
@@ -156,6 +181,7 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
         "variant": asdict(v),
         "manifest": manifest,
         "inference": infer,
+        "training": progress.summary(),
         "metrics": agg,
         "model": str(model_path),
         "wall_clock_s": round(time.time() - started, 1),
@@ -168,13 +194,16 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
     # the scripts change.
     snap = vdir / "code_snapshot"
     snap.mkdir(exist_ok=True)
-    for mod in ("corpus.py", "render.py", "train.py", "runner.py"):
+    for mod in ("corpus.py", "render.py", "train.py", "trainlog.py", "runner.py"):
         src = Path(__file__).parent / mod
         if src.exists():
             shutil.copy(src, snap / mod)
 
     if not keep_images:
         shutil.rmtree(gt_dir, ignore_errors=True)
+        index_path(gt_dir).unlink(missing_ok=True)
+        ledger_path(gt_dir).unlink(missing_ok=True)
+        lstmf_ledger_path(gt_dir).unlink(missing_ok=True)
 
     log_journal({
         "experiment": v.experiment,
@@ -186,6 +215,8 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
         "cer_grapheme_micro": agg["cer_grapheme_micro"],
         "wer_micro": agg["wer_micro"],
         "ci95": agg.get("cer_grapheme_ci95"),
+        "iterations": result["training"]["iterations"],
+        "stopped_early": result["training"]["stopped_early"],
         "wall_clock_s": result["wall_clock_s"],
         "timestamp": result["timestamp"],
     })
@@ -196,13 +227,15 @@ def run_variant(v, pool, test_dir, tessdata_dir, force=False, keep_images=False)
     return result
 
 
-def run_grid(variants, test_dir, tessdata_dir, force=False, keep_images=False):
+def run_grid(variants, test_dir, tessdata_dir, force=False, keep_images=False,
+             store_dir=ARTIFACTS):
     pool = corpus.build_pool()
     results = []
     for v in variants:
         try:
             results.append(run_variant(v, pool, test_dir, tessdata_dir,
-                                       force=force, keep_images=keep_images))
+                                       force=force, keep_images=keep_images,
+                                       store_dir=store_dir))
         except Exception as exc:                       # keep the sweep alive
             print(f"[FAIL] {v.experiment}/{v.name}: {exc}")
             log_journal({
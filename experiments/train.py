@@ -10,10 +10,16 @@ Environment:
 
 import os
 import shutil
+import signal
 import subprocess
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import ocrpool
+import trainlog
+
 # Line images: tell Tesseract it is looking at exactly one text line.
 # Leaving this at the default causes layout analysis to run on a 30px-tall
 # strip, which is a common and silent source of inflated error rates.
@@ -60,29 +66,49 @@ def require_toolchain(training=True):
             "Toolchain incomplete:\n  - " + "\n  - ".join(problems))
 
 
-def prepare_lstmf(gt_dir, jobs=None):
+def prepare_lstmf(gt_dir, jobs=None, api=False, lists=None, stratify=None, seed=0):
     """Generate .box/.lstmf pairs in parallel via prepare_lstmf.py.
 
     Idempotent: completed pairs are skipped, so an interrupted sweep resumes.
+    api keeps one libtesseract handle per worker where the library is found.
+    lists, a directory, also gets tesstrain's all-lstmf/list.train/list.eval,
+    split with seed (per font or source with stratify).
+
+    Returns True if the lists were written.
     """
     script = Path(__file__).resolve().parent.parent / "prepare_lstmf.py"
     if not script.exists():
         print(f"[warn] {script.name} not found; falling back to make's serial "
               f"generation, which is roughly 20x slower")
-        return
+        return False
     cmd = [sys.executable, str(script), "--gt-dir", str(Path(gt_dir).resolve())]
     if jobs:
         cmd += ["--jobs", str(jobs)]
+    if api:
+        cmd.append("--api")
+    if lists:
+        cmd += ["--lists", str(lists), "--seed", str(seed)]
+        if stratify:
+            cmd += ["--stratify", stratify]
     proc = subprocess.run(cmd)
     if proc.returncode != 0:
         raise RuntimeError(f"lstmf preparation failed for {gt_dir}")
+    return bool(lists)
 
 
 def train(gt_dir, model_name, out_dir, start_model="tam",
           max_iterations=10000, extra_make_args=None, log_path=None,
-          jobs=None):
+          jobs=None, stratify=None, split_seed=0, progress=None):
     """Run tesstrain's `make training` for one variant.
 
+    The train/eval split is written by prepare_lstmf.py, seeded with
+    split_seed and optionally per font or source (stratify), not by make.
+
+    progress, a trainlog.TrainingLog, is fed make's output as it comes. If
+    its Plateau fires, make is stopped once lstmtraining has next finished
+    writing its checkpoint -- never during the write -- and the .traineddata
+    is written from that checkpoint (stop_training).
+
     Returns the path to the produced .traineddata.
     """
     require_toolchain(training=True)
@@ -97,7 +123,11 @@ def train(gt_dir, model_name, out_dir, start_model="tam",
     # running recipes -- measured at 117 lines/min against 2,311 for the same
     # work in a process pool. make then finds every .lstmf present and goes
     # straight to training. Skipping this would cost roughly a day per variant.
-    prepare_lstmf(gt_dir, jobs=jobs)
+    # It also writes the list files, which -o keeps make from rebuilding --
+    # or stat-ing every .lstmf to decide whether to.
+    lists = out_dir.resolve() / model_name
+    have_lists = prepare_lstmf(gt_dir, jobs=jobs, lists=lists, stratify=stratify,
+                               seed=split_seed)
 
     cmd = [
         "make", "training",
@@ -108,23 +138,51 @@ def train(gt_dir, model_name, out_dir, start_model="tam",
         f"DATA_DIR={out_dir.resolve()}",
         f"MAX_ITERATIONS={max_iterations}",
     ]
+    if have_lists:
+        for name in ("all-lstmf", "list.train", "list.eval"):
+            cmd += ["-o", str(lists / name)]
     cmd += list(extra_make_args or [])
 
     log_path = Path(log_path) if log_path else out_dir / f"{model_name}.train.log"
-    with open(log_path, "w") as log:
+    progress = progress if progress is not None else trainlog.TrainingLog()
+    stopped, killed = None, False
+    with open(log_path, "w", encoding="utf-8") as log:
         log.write(f"$ cd {tesstrain} && {' '.join(cmd)}\n\n")
         log.flush()
-        proc = subprocess.run(cmd, cwd=tesstrain, stdout=log,
-                              stderr=subprocess.STDOUT)
-
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"tesstrain failed for {model_name} (exit {proc.returncode}). "
-            f"See {log_path}")
-
-    produced = out_dir / model_name / f"{model_name}.traineddata"
+        # Its own process group, so stopping it stops lstmtraining too.
+        proc = subprocess.Popen(cmd, cwd=tesstrain, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, start_new_session=True)
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", "replace")
+            log.write(line)
+            log.flush()
+            reason = progress.feed(line)
+            if reason:
+                stopped = reason
+                log.write(f"\n[early stop] {stopped}; stopping at the next checkpoint\n")
+            # SIGTERM mid-write would leave a truncated checkpoint; the line
+            # saying it was written comes once the file is whole.
+            if stopped and not killed and trainlog.CHECKPOINT_WRITTEN in line:
+                os.killpg(proc.pid, signal.SIGTERM)
+                killed = True
+        proc.wait()
+
+        if stopped and not killed:
+            progress.stopped = None         # make finished first
+        if killed:
+            print(f"    stopped early: {stopped}")
+            stop_training(tesstrain, out_dir, model_name, log)
+        elif proc.returncode != 0:
+            raise RuntimeError(
+                f"tesstrain failed for {model_name} (exit {proc.returncode}). "
+                f"See {log_path}")
+
+    # <out_dir>/<model_name>/<model_name>.traineddata is the starter
+    # traineddata make builds for lstmtraining; the trained model sits beside
+    # that directory.
+    produced = out_dir / f"{model_name}.traineddata"
     if not produced.exists():
-        alt = out_dir / f"{model_name}.traineddata"
+        alt = out_dir / model_name / f"{model_name}.traineddata"
         if alt.exists():
             produced = alt
         else:
@@ -134,29 +192,53 @@ def train(gt_dir, model_name, out_dir, start_model="tam",
     return produced
 
 
+def stop_training(tesstrain, out_dir, model_name, log):
+    """Write <out_dir>/<model_name>.traineddata from the last checkpoint, as
+    tesstrain does once lstmtraining reaches MAX_ITERATIONS."""
+    data = Path(out_dir).resolve() / model_name
+    cmd = ["lstmtraining", "--stop_training",
+           "--continue_from", str(data / "checkpoints" / f"{model_name}_checkpoint"),
+           "--traineddata", str(data / f"{model_name}.traineddata"),
+           "--model_output", f"{data}.traineddata"]
+    log.write(f"\n$ {' '.join(cmd)}\n")
+    log.flush()
+    proc = subprocess.run(cmd, cwd=tesstrain, stdout=log, stderr=subprocess.STDOUT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"lstmtraining --stop_training failed for {model_name} "
+                           f"(exit {proc.returncode}). See {log.name}")
+
+
 def recognise(image_dir, out_dir, model, tessdata_dir, psm=PSM_SINGLE_LINE,
-              jobs=None):
+              jobs=None, cache=None):
     """Run inference over every .tif in image_dir, writing <stem>.txt.
 
     Skips images that already have a prediction, so an interrupted sweep
-    resumes rather than restarting.
+    resumes rather than restarting. jobs (default: every CPU) workers each
+    keep the model loaded for all their lines (ocrpool).
+
+    cache, a path, is an ocrpool.PredictionCache: an image counts as done
+    only if this model file recognised this image file before, and a line
+    that failed is tried again. A failure still leaves an empty <stem>.txt
+    so the line scores as missed.
     """
     require_toolchain(training=False)
     image_dir, out_dir = Path(image_dir), Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
 
     images = sorted(image_dir.glob("*.tif"))
-    todo = [p for p in images if not (out_dir / f"{p.stem}.txt").exists()]
-
-    for path in todo:
-        dest = out_dir / path.stem          # tesseract appends .txt itself
-        cmd = ["tesseract", str(path), str(dest),
-               "--tessdata-dir", str(tessdata_dir), "-l", model, "--psm", psm]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        if proc.returncode != 0:
-            print(f"[warn] tesseract failed on {path.name}: "
-                  f"{proc.stderr.strip().splitlines()[:1]}")
-            dest.with_suffix(".txt").write_text("", encoding="utf-8")
-
-    return {"images": len(images), "recognised": len(todo),
-            "skipped_existing": len(images) - len(todo)}
+    cache = ocrpool.PredictionCache(cache) if cache is not None else None
+    recognised = failed = 0
+    try:
+        for path, error in ocrpool.recognise(images, out_dir, model, str(tessdata_dir),
+                                             psm=psm, jobs=jobs, cache=cache):
+            recognised += 1
+            if error:
+                failed += 1
+                print(f"[warn] tesseract failed on {path.name}: {error}")
+                (out_dir / f"{path.stem}.txt").write_text("", encoding="utf-8")
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return {"images": len(images), "recognised": recognised, "failed": failed,
+            "skipped_existing": len(images) - recognised}
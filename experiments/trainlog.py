@@ -0,0 +1,174 @@
+"""lstmtraining's progress, read from its log as training runs.
+
+tesstrain's `make training` prints a line per 100 iterations,
+
+    At iteration 14170/54200/54200, mean rms=0.236%, delta=0.103%,
+        BCER train=0.294%, BWER train=1.117%, skip ratio=0.000%, ...
+
+(learning, training and sample iteration; MAX_ITERATIONS counts the second)
+and, whenever an evaluation on list.eval finishes, one for that,
+
+    At iteration 13154, stage 1, BCER eval=8.095, BWER eval=35.781
+
+which lstmtraining often writes onto the end of a training line. TrainingLog
+takes the output a line at a time and keeps both curves, each point stamped
+with the training iteration it was seen at and the seconds since the first
+line, so iterations per second come from the same data.
+
+Given a Plateau it also says when to stop: once the chosen error (eval BCER
+by default) has not improved on its best by more than min_delta for window
+training iterations. train.train then lets lstmtraining finish its next
+checkpoint -- a line ending CHECKPOINT_WRITTEN, printed once the file is
+whole -- ends make, and writes the .traineddata from that checkpoint, as
+tesstrain itself would at MAX_ITERATIONS.
+
+    python experiments/trainlog.py results/training/tam_new_training.log \\
+        --window 20000
+
+replays a finished log and prints where a Plateau would have stopped it.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+TRAIN_RE = re.compile(
+    r"At iteration (\d+)/(\d+)/(\d+), mean rms=[\d.]+%, delta=[\d.]+%, "
+    r"BCER train=([\d.]+)%, BWER train=([\d.]+)%")
+EVAL_RE = re.compile(
+    r"At iteration (\d+), stage (\d+), BCER eval=([\d.]+), BWER eval=([\d.]+)")
+# lstmtraining ends a training line with this once the checkpoint is saved.
+CHECKPOINT_WRITTEN = "wrote checkpoint."
+
+
+class Plateau:
+    """Stop once `metric` ("eval" or "train" BCER) has gone `window`
+    training iterations without improving on its best by more than
+    min_delta (percentage points)."""
+
+    def __init__(self, window, min_delta=0.0, metric="eval"):
+        if metric not in ("eval", "train"):
+            raise ValueError(f"metric must be 'eval' or 'train', not {metric!r}")
+        self.window = window
+        self.min_delta = min_delta
+        self.metric = metric
+
+    def check(self, log):
+        """Why to stop now, or None to go on."""
+        points = log.eval if self.metric == "eval" else log.train
+        if not points or not log.train:
+            return None
+        best_iter, best = points[0]["iteration"], points[0]["bcer"]
+        for p in points[1:]:
+            if p["bcer"] < best - self.min_delta:
+                best_iter, best = p["iteration"], p["bcer"]
+        now = log.train[-1]["iteration"]
+        if now - best_iter >= self.window:
+            return (f"{self.metric} BCER {best:.3f}% at iteration {best_iter:,} "
+                    f"not bettered by {now - best_iter:,} iterations")
+        return None
+
+    def describe(self):
+        return {"window": self.window, "min_delta": self.min_delta,
+                "metric": self.metric}
+
+
+class TrainingLog:
+    """Training and eval curves from lstmtraining's output lines."""
+
+    def __init__(self, plateau=None, clock=time.monotonic):
+        self.plateau = plateau
+        self.train = []
+        self.eval = []
+        self.stopped = None         # the Plateau's reason, once it fires
+        self._clock = clock
+        self._t0 = None
+
+    def feed(self, line):
+        """Take one line of output. Returns the reason to stop training, the
+        first time there is one, else None."""
+        now = self._clock() if self._clock else None
+        if self._t0 is None and now is not None:
+            self._t0 = now
+        t = round(now - self._t0, 1) if now is not None else None
+        found = False
+        for m in TRAIN_RE.finditer(line):
+            self.train.append({"iteration": int(m[2]), "learning_iteration": int(m[1]),
+                               "bcer": float(m[4]), "bwer": float(m[5]), "t": t})
+            found = True
+        for m in EVAL_RE.finditer(line):
+            # Stamped with the training iteration it was reported at, so
+            # both curves share one axis; the eval's own is kept too.
+            at = self.train[-1]["iteration"] if self.train else 0
+            self.eval.append({"iteration": at, "learning_iteration": int(m[1]),
+                              "stage": int(m[2]), "bcer": float(m[3]),
+                              "bwer": float(m[4]), "t": t})
+            found = True
+        if found and self.plateau is not None and self.stopped is None:
+            self.stopped = self.plateau.check(self)
+            return self.stopped
+        return None
+
+    def iterations_per_s(self):
+        timed = [p for p in self.train if p["t"] is not None]
+        if len(timed) < 2 or timed[-1]["t"] == timed[0]["t"]:
+            return None
+        return round((timed[-1]["iteration"] - timed[0]["iteration"])
+                     / (timed[-1]["t"] - timed[0]["t"]), 2)
+
+    def summary(self):
+        """What result.json records under "training"."""
+        last = self.train[-1] if self.train else None
+        best_eval = min(self.eval, key=lambda p: p["bcer"]) if self.eval else None
+        return {
+            "iterations": last["iteration"] if last else 0,
+            "iterations_per_s": self.iterations_per_s(),
+            "final_bcer_train": last["bcer"] if last else None,
+            "best_bcer_eval": best_eval["bcer"] if best_eval else None,
+            "best_eval_iteration": best_eval["iteration"] if best_eval else None,
+            "early_stop": self.plateau.describe() if self.plateau else None,
+            "stopped_early": self.stopped,
+            "curves": {"train": self.train, "eval": self.eval},
+        }
+
+
+def parse(path, plateau=None):
+    """A TrainingLog for a finished log file (no timings), replayed against
+    plateau if given; it keeps every line, stop or not."""
+    log = TrainingLog(plateau, clock=None)
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            log.feed(line)
+    return log
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("log")
+    ap.add_argument("--window", type=int, default=None,
+                    help="replay with a Plateau of this many iterations")
+    ap.add_argument("--min-delta", type=float, default=0.0)
+    ap.add_argument("--metric", choices=["eval", "train"], default="eval")
+    ap.add_argument("--json", default=None, help="also write the summary here")
+    args = ap.parse_args()
+
+    plateau = Plateau(args.window, args.min_delta, args.metric) if args.window else None
+    log = parse(args.log, plateau)
+    s = log.summary()
+    print(f"{len(log.train):,} training and {len(log.eval):,} eval points, "
+          f"{s['iterations']:,} iterations")
+    print(f"final BCER train {s['final_bcer_train']}%, best BCER eval "
+          f"{s['best_bcer_eval']}% at iteration {s['best_eval_iteration']}")
+    if plateau:
+        print(f"would stop: {log.stopped}" if log.stopped else "would not stop early")
+    if args.json:
+        Path(args.json).write_text(json.dumps(s, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
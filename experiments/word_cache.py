@@ -0,0 +1,105 @@
+"""Compose lines from cached word bitmaps instead of shaping every line.
+
+The corpus is Zipfian: a few thousand words make up most tokens, and each
+line is 12 of them. draw.text shapes and rasterises the whole line every
+time, so the same word in the same face is shaped tens of thousands of times
+over a corpus. WordCache shapes and rasterises each (face, size, word) once,
+keeps the coverage bitmap, its offset from the pen and its advance, and
+lays lines out from those: pen advances by each word's width plus the face's
+space width, and each bitmap is darkened onto the canvas.
+
+Tamil shaping never reaches across a space, so each word's glyphs are what
+draw.text would produce. Pen positions are not quite: draw.text places every
+glyph from one fractional pen, a composed line rounds the pen once per word,
+so a word can land one pixel off. experiments/bench_words.py measures how
+often, and how much that moves the crops.
+
+Entries are held in an LRU bounded by count; one cache per render worker.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+MAX_WORDS = 50_000
+
+
+class WordCache:
+    """Word bitmaps by (face, size, word), least recently used first out."""
+
+    def __init__(self, max_words=MAX_WORDS):
+        self.max_words = max_words
+        self._words = OrderedDict()
+        self._spaces = {}
+        self.hits = self.misses = 0
+
+    def _shape(self, word, font):
+        # draw.text itself, on a canvas exactly the word's bounding box, so
+        # the glyphs are identical: getbbox is the offset and size of the
+        # mask draw.text rasterises.
+        left, top, right, bottom = font.getbbox(word, "L")
+        coverage = None
+        if right > left and bottom > top:
+            mask = Image.new("L", (right - left, bottom - top), 0)
+            ImageDraw.Draw(mask).text((-left, -top), word, font=font, fill=255)
+            coverage = np.asarray(mask)
+        return coverage, left, top, font.getlength(word)
+
+    def word(self, word, name, font):
+        """(coverage, dx, dy, advance) for one word; coverage may be None."""
+        key = (name, font.size, word)
+        entry = self._words.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._words.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = self._words[key] = self._shape(word, font)
+        if len(self._words) > self.max_words:
+            self._words.popitem(last=False)
+        return entry
+
+    def space(self, name, font):
+        key = (name, font.size)
+        if key not in self._spaces:
+            self._spaces[key] = font.getlength(" ")
+        return self._spaces[key]
+
+    def layout(self, line, name, font):
+        """The inked words of `line` as (coverage, dx, dy, pen) with the pen
+        starting at 0, and where the pen ends."""
+        space = self.space(name, font)
+        placed, pen = [], 0.0
+        for i, word in enumerate(line.split(" ")):
+            if i:
+                pen += space
+            if not word:
+                continue
+            coverage, dx, dy, advance = self.word(word, name, font)
+            if coverage is not None:
+                placed.append((coverage, dx, dy, pen))
+            pen += advance
+        return placed, pen
+
+    def draw(self, canvas, xy, line, name, font, laid=None):
+        """Darken `line` onto a grayscale canvas (white paper, black ink) with
+        its pen starting at xy, as ImageDraw.text(xy, line, fill=0) would.
+        laid is layout()'s result for the line, if the caller already has it."""
+        x, y = xy
+        placed, _ = laid or self.layout(line, name, font)
+        height, width = canvas.shape
+        for coverage, dx, dy, pen in placed:
+            x0, y0 = int(round(x + pen)) + dx, y + dy
+            h, w = coverage.shape
+            # Clip to the canvas, as draw.text does.
+            cx0, cy0 = max(0, -x0), max(0, -y0)
+            cx1, cy1 = min(w, width - x0), min(h, height - y0)
+            if cx1 > cx0 and cy1 > cy0:
+                region = canvas[y0 + cy0:y0 + cy1, x0 + cx0:x0 + cx1]
+                np.minimum(region, 255 - coverage[cy0:cy1, cx0:cx1], out=region)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"words": len(self._words), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
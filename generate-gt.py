@@ -4,11 +4,11 @@ import shutil
 from pathlib import Path
 
 import cv2
-import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from tqdm import tqdm
 
 from config import DefaultTamilConfig
+from segmentation import ink_extent, projection_bands
 
 # Configuration
 FONT_DIR = "fonts"
@@ -69,31 +69,17 @@ def segment_lines_using_projection(image_path: str, output_dir: str, gt_lines, b
         image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
         height, width = image.shape
         _, binary = cv2.threshold(image, 200, 255, cv2.THRESH_BINARY_INV)
-        projection = np.sum(binary, axis=1)
-        in_line = False
-        line_bounds = []
-        threshold = 10
-
-        for i, val in enumerate(projection):
-            if val > threshold and not in_line:
-                start = i
-                in_line = True
-            elif val <= threshold and in_line:
-                end = i
-                in_line = False
-                line_bounds.append((start, end))
+        line_bounds = projection_bands(binary, 10, close_open=False)
 
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         for idx, (y1, y2) in enumerate(line_bounds):
             y1_pad = max(0, y1 - padding)
             y2_pad = min(height, y2 + padding)
             line_crop = image[y1_pad:y2_pad, :]
-            _, line_thresh = cv2.threshold(line_crop, 200, 255, cv2.THRESH_BINARY)
-            coords = cv2.findNonZero(255 - line_thresh)
-            if coords is not None:
-                x, y, w, h = cv2.boundingRect(coords)
-                x1 = max(0, x - padding)
-                x2 = min(line_crop.shape[1], x + w + padding)
+            extent = ink_extent(line_crop <= 200)
+            if extent is not None:
+                x1 = max(0, extent[0] - padding)
+                x2 = min(line_crop.shape[1], extent[1] + padding)
                 trimmed = line_crop[:, x1:x2]
             else:
                 trimmed = line_crop
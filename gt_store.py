@@ -0,0 +1,667 @@
+"""Where rendered ground truth lives on disk, and the index that lists it.
+
+render.generate writes every crop and transcription as a tesstrain pair,
+<stem>.tif + <stem>.gt.txt. At corpus scale that is ~400k files, and every
+later stage used to find them by listing the directory and stat-ing what it
+found. Two things make that cheaper:
+
+  Sharding. With shard_pages set, page p's pairs go to gt/<p // shard_pages>/
+  instead of one flat directory, so no directory holds more than a few
+  thousand entries. tesstrain locates pairs with `find`, so a sharded tree
+  trains unchanged.
+
+  The pair index. gt.index.jsonl, next to gt.manifest.json, is written at
+  render time with one record per pair:
+
+      {"stem": "page_000001_line_001", "image": "000/page_000001_line_001.tif",
+       "gt": "000/page_000001_line_001.gt.txt", "page": 1, "line": 1,
+       "font": "Aazhi", "source": "wikinews-ta",
+       "image_bytes": 31822, "gt_bytes": 187, "sha256": "<pair_digest>"}
+
+  Paths are relative to the output directory. Downstream tools iterate this
+  instead of re-discovering the pairs, and compare "sha256" (over the image
+  bytes, then the transcription's) to tell a changed pair without reading it.
+
+iter_pairs() gives the same records for a directory without an index (older
+output, make_testset trees), minus what only the renderer knew.
+
+Packed output. Loose pairs cost ~2.5 GB and 200k inodes per 100k lines and
+make copying, archiving and sampling slow. With packed=True the renderer
+instead appends each pair to a shard file, gt/shard-00000.pack and so on, one
+per PACK_PAGES pages (or shard_pages). A shard is PACK_MAGIC followed by the
+raw .tif and .gt.txt bytes back to back; the pair index is its offset table,
+adding "pack", "image_offset" and "gt_offset" to each record. "image" and "gt"
+still name where the pair lands when exported to the loose layout.
+
+PairReader reads either layout by stem, through a memory map for shards.
+export_loose() turns packed output back into the tesstrain layout `make
+training` expects:
+
+    python gt_store.py export gt_packed gt
+
+The page ledger. gt.pages.jsonl records each page as it lands on disk: a key
+over everything that determines its output, the fonts it drew and its index
+records. A re-run with the same inputs takes finished pages from the ledger
+instead of rendering them again, so an interrupted render resumes where it
+stopped.
+
+gt.lstmf.jsonl does the same for prepare_lstmf.py: each pair it finishes,
+with the pair digest it was made from.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+INDEX_SUFFIX = ".index.jsonl"
+LEDGER_SUFFIX = ".pages.jsonl"
+LSTMF_SUFFIX = ".lstmf.jsonl"
+PACK_MAGIC = b"TGTPACK1"
+PACK_PAGES = 500            # ~25k lines per shard at 50 lines per page
+WRITE_THREADS = 8           # loose-file writers; file creates overlap rendering
+WRITE_PENDING = 1024        # files queued before write() blocks the renderer
+
+
+def index_path(out_dir):
+    """gt/ -> gt.index.jsonl, the same place the manifest goes."""
+    out_dir = Path(out_dir)
+    return out_dir.parent / f"{out_dir.name}{INDEX_SUFFIX}"
+
+
+def ledger_path(out_dir):
+    """gt/ -> gt.pages.jsonl."""
+    out_dir = Path(out_dir)
+    return out_dir.parent / f"{out_dir.name}{LEDGER_SUFFIX}"
+
+
+def lstmf_ledger_path(out_dir):
+    """gt/ -> gt.lstmf.jsonl, prepare_lstmf.py's record of finished pairs."""
+    out_dir = Path(out_dir)
+    return out_dir.parent / f"{out_dir.name}{LSTMF_SUFFIX}"
+
+
+def pair_digest(image, gt):
+    """The index's "sha256": over the image bytes, then the transcription's."""
+    h = hashlib.sha256(image)
+    h.update(gt)
+    return h.hexdigest()
+
+
+def shard_dir(page, shard_pages):
+    """Relative directory for a 0-based page, or '' for the flat layout."""
+    if not shard_pages:
+        return ""
+    return f"{page // shard_pages:03d}"
+
+
+class IndexWriter:
+    """Append records in render order; the index appears only on close().
+
+    Writing to a temporary file and renaming means a crashed render leaves
+    no index rather than a truncated one that looks complete.
+    """
+
+    def __init__(self, out_dir):
+        self.path = index_path(out_dir)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._fh = open(self._tmp, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, record):
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._fh.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._fh.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class WriteBehind:
+    """Write files from a thread pool so the caller can get on with rendering.
+
+    write() queues one file and returns its Future; once max_pending files
+    are queued it blocks until one lands, so a slow volume throttles the
+    renderer instead of filling memory. A failed write is raised from the
+    next write() or from close(). Threads help most where each create is a
+    round trip, as on NFS.
+    """
+
+    def __init__(self, threads=WRITE_THREADS, max_pending=WRITE_PENDING):
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="gt-write")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._made = set()
+        self._error = None
+
+    def write(self, path, data):
+        if self._error is not None:
+            raise self._error
+        path = Path(path)
+        if path.parent not in self._made:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._made.add(path.parent)
+        self._slots.acquire()
+        fut = self._pool.submit(path.write_bytes, data)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut):
+        self._slots.release()
+        if fut.cancelled():
+            return          # dropped by abort()
+        if fut.exception() is not None and self._error is None:
+            self._error = fut.exception()
+
+    def close(self):
+        """Wait for every queued write; raise the first failure."""
+        self._pool.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+
+    def abort(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+class PageLedger:
+    """Finished pages of a render, appended one line per page.
+
+        {"page": 0, "key": "<sha256>", "fonts": [...], "records": [...]}
+
+    Each line is flushed as soon as its page is on disk, so a crash loses at
+    most the pages in flight. A page's later line supersedes earlier ones;
+    compact() rewrites the file with only the current entries.
+    """
+
+    def __init__(self, out_dir, resume=True):
+        self.path = ledger_path(out_dir)
+        self.entries = {}
+        if resume and self.path.exists():
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue            # torn last line from a crash
+                    self.entries[entry["page"]] = entry
+        self._fh = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if self._fh.tell() and not _ends_with_newline(self.path):
+            self._fh.write("\n")
+
+    def get(self, page, key):
+        """The page's entry if it was finished with this key, else None."""
+        entry = self.entries.get(page)
+        return entry if entry is not None and entry["key"] == key else None
+
+    def add(self, page, key, fonts, records):
+        entry = {"page": page, "key": key, "fonts": fonts, "records": records}
+        self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        self.entries[page] = entry
+
+    def compact(self, pages):
+        """Keep only these pages' entries, rewriting the file atomically."""
+        self.close()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for page in sorted(pages):
+                if page in self.entries:
+                    fh.write(json.dumps(self.entries[page], ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+
+class LstmfLedger:
+    """Pairs prepare_lstmf.py has finished, appended one line per pair.
+
+        {"image": "000/page_000001_line_001.tif", "sha256": "...", "status": "ok"}
+
+    "image" is the index's relative path and "sha256" its pair digest when
+    the pair went through. A pair hashed from disk because it no longer
+    matched the index (prepare_lstmf.py --verify) also keeps the index's
+    digest as "indexed", so it is done against either until the index
+    changes. A pair's later line supersedes earlier ones.
+
+    Several processes, on one machine or several sharing the directory, each
+    append to a part of their own, gt.lstmf.<part>.jsonl, never to one
+    another's. Every ledger reads the main file and all parts; an "ok" is not
+    undone by another part's failure of the same pair. merge() folds the
+    parts into gt.lstmf.jsonl once they have all finished.
+
+    refresh() reads what the other parts have appended since, so a process
+    can tell a pair finished elsewhere from the ledger rather than from file
+    times on another host's clock. readonly opens no part of its own.
+    """
+
+    def __init__(self, gt_dir, resume=True, part=None, readonly=False):
+        main = lstmf_ledger_path(gt_dir)
+        self._main = main
+        self.path = main.with_name(f"{main.name[:-len(LSTMF_SUFFIX)]}.lstmf.{part}.jsonl") \
+            if part else main
+        self.entries = {}
+        self.indexed = {}           # image -> index digest, where it is not "sha256"
+        self.superseded = 0
+        self._read = {}             # path -> bytes of whole lines read
+        for path in [main] + self.parts():
+            if resume:
+                self._load(path)
+            elif path.exists():
+                self._read[path] = path.stat().st_size    # only what comes after
+        self._fh = None
+        if not readonly:
+            self._fh = open(self.path, "a" if resume else "w", encoding="utf-8")
+            if self._fh.tell() and not _ends_with_newline(self.path):
+                self._fh.write("\n")
+
+    def parts(self):
+        prefix = self._main.name[:-len(LSTMF_SUFFIX)] + ".lstmf."
+        return sorted(p for p in self._main.parent.glob(f"{prefix}*.jsonl")
+                      if p != self._main)
+
+    def _load(self, path):
+        try:
+            with open(path, "rb") as fh:
+                fh.seek(self._read.get(path, 0))
+                data = fh.read()
+        except FileNotFoundError:
+            return
+        # A last line without its newline may still be being written.
+        whole = data[:data.rfind(b"\n") + 1]
+        self._read[path] = self._read.get(path, 0) + len(whole)
+        for line in whole.decode("utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue                # torn line from a crash
+            old = self.entries.get(entry["image"])
+            if old is not None:
+                self.superseded += 1
+                if (old["status"] == "ok" and entry["status"] != "ok"
+                        and old["sha256"] == entry["sha256"]):
+                    continue
+            self.entries[entry["image"]] = entry
+
+    def refresh(self):
+        """Take in what the main file and the other parts have had appended
+        since they were last read."""
+        for path in [self._main] + self.parts():
+            if path != self.path or self._fh is None:
+                self._load(path)
+
+    def done(self, image, digest):
+        entry = self.entries.get(image)
+        return (entry is not None and entry["status"] == "ok" and digest is not None
+                and digest in (entry["sha256"], entry.get("indexed")))
+
+    def add(self, image, digest, status):
+        entry = {"image": image, "sha256": digest, "status": status}
+        if self.indexed.get(image, digest) != digest:
+            entry["indexed"] = self.indexed[image]
+        self.superseded += image in self.entries
+        self._fh.write(json.dumps(entry) + "\n")
+        self.entries[image] = entry
+
+    def flush(self):
+        self._fh.flush()
+
+    def compact(self):
+        """Rewrite the main file with only current entries, atomically."""
+        self.close()
+        tmp = self._main.with_name(self._main.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            for entry in self.entries.values():
+                fh.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self._main)
+        self.superseded = 0
+
+    def merge(self):
+        """compact(), then drop the parts now folded in. Only once every
+        process writing a part has finished."""
+        parts = self.parts()
+        self.compact()
+        for part in parts:
+            part.unlink(missing_ok=True)
+
+    def close(self):
+        if self._fh is not None and not self._fh.closed:
+            self._fh.close()
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1) == b"\n"
+
+
+def read_index(path):
+    """Yield index records one at a time."""
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_pairs(gt_dir):
+    """Every image/transcription pair under gt_dir, index first.
+
+    Without an index, falls back to listing gt_dir (and any shard
+    subdirectories) for *.tif files.
+    """
+    gt_dir = Path(gt_dir)
+    idx = index_path(gt_dir)
+    if idx.exists():
+        yield from read_index(idx)
+        return
+    for img in sorted(gt_dir.rglob("*.tif")):
+        rel = img.relative_to(gt_dir)
+        yield {"stem": img.stem, "image": rel.as_posix(),
+               "gt": rel.with_name(f"{img.stem}.gt.txt").as_posix()}
+
+
+def pack_name(page, shard_pages=None):
+    """Shard file for a 0-based page."""
+    return f"shard-{page // (shard_pages or PACK_PAGES):05d}.pack"
+
+
+class PackWriter:
+    """Append pairs to shard files. Pages must arrive in order."""
+
+    def __init__(self, out_dir, shard_pages=None):
+        self.out_dir = Path(out_dir)
+        self.shard_pages = shard_pages or PACK_PAGES
+        self._name, self._fh = None, None
+
+    def write(self, page, image, gt):
+        """Store one pair; returns the offset fields for its index record."""
+        name = pack_name(page, self.shard_pages)
+        if name != self._name:
+            self.close()
+            self._name = name
+            self._fh = open(self.out_dir / name, "wb")
+            self._fh.write(PACK_MAGIC)
+        image_offset = self._fh.tell()
+        self._fh.write(image)
+        gt_offset = self._fh.tell()
+        self._fh.write(gt)
+        return {"pack": name, "image_offset": image_offset, "gt_offset": gt_offset}
+
+    def flush(self):
+        if self._fh is not None:
+            self._fh.flush()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class PackCache:
+    """Memory maps of shard files, opened on first use."""
+
+    def __init__(self):
+        self._maps = {}
+
+    def read(self, path, offset, size):
+        path = str(path)
+        m = self._maps.get(path)
+        if m is None:
+            with open(path, "rb") as fh:
+                m = self._maps[path] = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return m[offset:offset + size]
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
+
+
+class PairReader:
+    """Random access to rendered pairs by stem, loose or packed.
+
+        pairs = PairReader("gt")
+        for rec in pairs:
+            text = pairs.text(rec)
+            img = pairs.image(rec["stem"])      # grayscale ndarray
+    """
+
+    def __init__(self, gt_dir):
+        self.gt_dir = Path(gt_dir)
+        self.records = list(iter_pairs(self.gt_dir))
+        self._by_stem = {r["stem"]: r for r in self.records}
+        self._packs = PackCache()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __contains__(self, stem):
+        return stem in self._by_stem
+
+    def __getitem__(self, stem):
+        return self._by_stem[stem]
+
+    @property
+    def packed(self):
+        return bool(self.records) and "pack" in self.records[0]
+
+    def _rec(self, rec):
+        return self._by_stem[rec] if isinstance(rec, str) else rec
+
+    def image_bytes(self, rec):
+        """The encoded .tif, exactly as the renderer wrote it."""
+        rec = self._rec(rec)
+        if "pack" in rec:
+            return self._packs.read(self.gt_dir / rec["pack"],
+                                    rec["image_offset"], rec["image_bytes"])
+        return (self.gt_dir / rec["image"]).read_bytes()
+
+    def gt_bytes(self, rec):
+        rec = self._rec(rec)
+        if "pack" in rec:
+            return self._packs.read(self.gt_dir / rec["pack"],
+                                    rec["gt_offset"], rec["gt_bytes"])
+        return (self.gt_dir / rec["gt"]).read_bytes()
+
+    def text(self, rec):
+        return self.gt_bytes(rec).decode("utf-8")
+
+    def image(self, rec):
+        """Decoded grayscale crop."""
+        import cv2
+        import numpy as np
+        buf = np.frombuffer(self.image_bytes(rec), dtype=np.uint8)
+        return cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+
+    def close(self):
+        self._packs.close()
+
+
+_PACK_FIELDS = ("pack", "image_offset", "gt_offset")
+
+
+def write_pairs(out_dir, records, packed=False, shard_pages=None,
+                threads=WRITE_THREADS):
+    """Write a stream of pair records to out_dir, with their index.
+
+    Each record is an index record plus "data", the (.tif, .gt.txt) bytes,
+    as render.stream yields them; records must arrive in page order. Loose
+    pairs go to their "image" and "gt" paths through a WriteBehind (threads=0
+    writes inline), packed ones into shards. Only the records in flight are
+    held. Returns the number of pairs written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = IndexWriter(out_dir)
+    pack = PackWriter(out_dir, shard_pages) if packed else None
+    writer = WriteBehind(threads) if threads and not packed else None
+    try:
+        for rec in records:
+            image, gt = rec.pop("data")
+            if pack is not None:
+                rec.update(pack.write(rec["page"] - 1, image, gt))
+            elif writer is not None:
+                writer.write(out_dir / rec["image"], image)
+                writer.write(out_dir / rec["gt"], gt)
+            else:
+                dest = out_dir / rec["image"]
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                dest.write_bytes(image)
+                (out_dir / rec["gt"]).write_bytes(gt)
+            index.write(rec)
+        if writer is not None:
+            writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        index.abort()
+        raise
+    finally:
+        if pack is not None:
+            pack.close()
+    index.close()
+    return index.count
+
+
+def export_loose(src_dir, out_dir):
+    """Write packed pairs out as <stem>.tif + <stem>.gt.txt under out_dir.
+
+    Keeps each pair's relative path (so shard subdirectories survive) and
+    writes a loose index for out_dir. Returns the number of pairs written.
+    """
+    src_dir, out_dir = Path(src_dir), Path(out_dir)
+    if src_dir.resolve() == out_dir.resolve():
+        raise ValueError("export into a different directory; the loose index "
+                         "would replace the packed one")
+    pairs = PairReader(src_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index = IndexWriter(out_dir)
+    try:
+        for rec in pairs:
+            img, gt = out_dir / rec["image"], out_dir / rec["gt"]
+            img.parent.mkdir(parents=True, exist_ok=True)
+            img.write_bytes(pairs.image_bytes(rec))
+            gt.write_bytes(pairs.gt_bytes(rec))
+            index.write({k: v for k, v in rec.items() if k not in _PACK_FIELDS})
+    except BaseException:
+        index.abort()
+        raise
+    finally:
+        pairs.close()
+    index.close()
+    return index.count
+
+
+def _validate_packed(gt_dir, records):
+    """Shards exist, cover every offset, and every image starts like a TIFF."""
+    packs = PackCache()
+    sizes, missing, truncated, bad_image, empty = {}, [], [], [], []
+    try:
+        for r in records:
+            path = gt_dir / r["pack"]
+            if r["pack"] not in sizes:
+                sizes[r["pack"]] = path.stat().st_size if path.exists() else None
+            size = sizes[r["pack"]]
+            if size is None:
+                missing.append(r["stem"])
+                continue
+            if max(r["image_offset"] + r["image_bytes"],
+                   r["gt_offset"] + r["gt_bytes"]) > size:
+                truncated.append(r["stem"])
+                continue
+            if packs.read(path, r["image_offset"], 4) not in (b"II*\x00", b"MM\x00*"):
+                bad_image.append(r["stem"])
+            if r["gt_bytes"] == 0:
+                empty.append(r["stem"])
+    finally:
+        packs.close()
+    return {"images": len(records) - len(missing) - len(truncated),
+            "transcriptions": len(records) - len(missing) - len(truncated),
+            "orphan_images": [], "orphan_transcriptions": [],
+            "indexed": len(records), "packs": len(sizes),
+            "missing_from_disk": (missing + truncated)[:10],
+            "missing_from_index": [], "unreadable_images": bad_image[:10],
+            "empty_transcriptions": empty[:10]}
+
+
+def validate(gt_dir):
+    """Every .tif has a .gt.txt and vice versa, and the index agrees.
+
+    Lists each directory once (os.scandir, no per-file stat). With an index,
+    also reports pairs it lists that are missing on disk and pairs on disk it
+    does not list, and empty transcriptions by their recorded size.
+    """
+    gt_dir = Path(gt_dir)
+    idx = index_path(gt_dir)
+    if idx.exists():
+        records = list(read_index(idx))
+        if records and "pack" in records[0]:
+            return _validate_packed(gt_dir, records)
+
+    imgs, gts = set(), set()
+    dirs = [gt_dir]
+    while dirs:
+        d = dirs.pop()
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir():
+                    dirs.append(Path(e.path))
+                    continue
+                rel = Path(e.path).relative_to(gt_dir).as_posix()
+                if e.name.endswith(".tif"):
+                    imgs.add(rel[:-4])
+                elif e.name.endswith(".gt.txt"):
+                    gts.add(rel[:-7])
+
+    report = {"images": len(imgs), "transcriptions": len(gts),
+              "orphan_images": sorted(imgs - gts)[:10],
+              "orphan_transcriptions": sorted(gts - imgs)[:10]}
+
+    if idx.exists():
+        indexed, empty = set(), []
+        for r in records:
+            indexed.add(r["image"][:-4])
+            if r.get("gt_bytes") == 0:
+                empty.append(r["stem"])
+        on_disk = imgs & gts
+        report.update(indexed=len(indexed),
+                      missing_from_disk=sorted(indexed - on_disk)[:10],
+                      missing_from_index=sorted(on_disk - indexed)[:10],
+                      empty_transcriptions=empty[:10])
+    return report
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Inspect or unpack rendered ground truth.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export", help="packed shards -> loose tesstrain pairs")
+    e.add_argument("src", help="packed output directory (e.g. gt)")
+    e.add_argument("dest", help="directory to write .tif/.gt.txt pairs into")
+    v = sub.add_parser("validate", help="check pairs against the index")
+    v.add_argument("gt_dir")
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        n = export_loose(args.src, args.dest)
+        print(f"exported {n:,} pairs to {args.dest}")
+        return 0
+    report = validate(args.gt_dir)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report.get("missing_from_disk") or report["orphan_images"] \
+        or report["orphan_transcriptions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
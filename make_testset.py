@@ -32,15 +32,19 @@ entirely, and read every line against the image.
 
 import argparse
 import csv
+import os
 import re
-import subprocess
 import sys
+import tempfile
 import unicodedata
 from pathlib import Path
 
 import cv2
 import numpy as np
 
+import ocrpool
+from segmentation import find_bands, ink_extent, merge_bands, smooth
+
 MIN_LINE_HEIGHT = 12        # px; below this a band is noise, not a line
 MIN_INK_FRACTION = 0.002    # a band must carry at least this share of dark px
 PAD = 6
@@ -85,40 +89,30 @@ def find_lines(binary):
     bodies and can form their own band, exactly the effect that costs the
     synthetic pipeline 0.075% of its pages.
     """
-    proj = (binary > 0).sum(axis=1).astype(float)
-    if proj.max() == 0:
+    ink = binary > 0
+    row_ink = ink.sum(axis=1)
+    if row_ink.max() == 0:
         return []
     k = max(3, binary.shape[0] // 400)
-    proj = np.convolve(proj, np.ones(k) / k, mode="same")
+    proj = smooth(row_ink.astype(float), k)
 
     thresh = max(1.0, proj.max() * 0.06)
-    bands, inside, start = [], False, 0
-    for i, v in enumerate(proj):
-        if v > thresh and not inside:
-            start, inside = i, True
-        elif v <= thresh and inside:
-            bands.append([start, i])
-            inside = False
-    if inside:
-        bands.append([start, len(proj)])
+    bands = find_bands(proj > thresh)
     if not bands:
         return []
 
-    heights = sorted(b[1] - b[0] for b in bands)
+    heights = sorted(e - s for s, e in bands)
     median_h = heights[len(heights) // 2]
-    merged = [bands[0]]
-    for s, e in bands[1:]:
-        if s - merged[-1][1] < median_h * 0.45:     # diacritic band
-            merged[-1][1] = e
-        else:
-            merged.append([s, e])
-
-    total_ink = (binary > 0).sum()
+    merged = merge_bands(bands, median_h * 0.45)      # diacritic bands
+
+    # Ink per band from one cumulative sum instead of re-scanning each band.
+    cum = np.concatenate(([0], np.cumsum(row_ink)))
+    total_ink = cum[-1]
     keep = []
     for s, e in merged:
         if e - s < MIN_LINE_HEIGHT:
             continue
-        if (binary[s:e] > 0).sum() < total_ink * MIN_INK_FRACTION:
+        if cum[e] - cum[s] < total_ink * MIN_INK_FRACTION:
             continue
         keep.append((s, e))
     return keep
@@ -154,9 +148,10 @@ def segment(args):
 
         for i, (y0, y1) in enumerate(bands, 1):
             crop = gray[max(0, y0 - PAD):min(gray.shape[0], y1 + PAD), :]
-            cols = np.where((binarise(crop) > 0).sum(axis=0) > 0)[0]
-            if cols.size:
-                crop = crop[:, max(0, cols[0] - PAD):min(crop.shape[1], cols[-1] + PAD)]
+            extent = ink_extent(binarise(crop) > 0)
+            if extent is not None:
+                x0, x1 = extent
+                crop = crop[:, max(0, x0 - PAD):min(crop.shape[1], x1 - 1 + PAD)]
             lid = f"{stem}_l{i:03d}"
             cv2.imwrite(str(out / "images" / f"{lid}.tif"), crop)
             gt = out / "gt" / f"{lid}.gt.txt"
@@ -176,17 +171,19 @@ def segment(args):
 def bootstrap(args):
     out = Path(args.out)
     imgs = sorted((out / "images").glob("*.tif"))
-    filled = 0
+    todo = []
     for img in imgs:
         gt = out / "gt" / f"{img.stem}.gt.txt"
         if gt.exists() and gt.read_text(encoding="utf-8").strip():
             continue
-        r = subprocess.run(
-            ["tesseract", str(img), "stdout", "-l", args.model, "--psm", "7"],
-            capture_output=True, text=True)
-        text = " ".join(r.stdout.split()) if r.returncode == 0 else ""
-        gt.write_text(text, encoding="utf-8")
-        filled += 1
+        todo.append(img)
+    filled = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for img, error in ocrpool.recognise(todo, tmp, args.model, jobs=args.jobs):
+            pred = Path(tmp) / f"{img.stem}.txt"
+            text = "" if error else " ".join(pred.read_text(encoding="utf-8").split())
+            (out / "gt" / f"{img.stem}.gt.txt").write_text(text, encoding="utf-8")
+            filled += 1
     print(f"pre-filled {filled} of {len(imgs)} transcriptions using '{args.model}'")
     print("\nThese are MACHINE GUESSES, not ground truth. Read every one against\n"
           "its image and correct it. Anything you do not check is not data.")
@@ -276,6 +273,8 @@ def main():
     b.add_argument("--out", default="testset")
     b.add_argument("--model", default="tam",
                    help="use stock 'tam', NOT the model you are evaluating")
+    b.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                   help="workers, each with the model loaded")
     b.set_defaults(func=bootstrap)
 
     c = sub.add_parser("check", help="completeness and encoding check")
@@ -0,0 +1,314 @@
+"""Recognise many line images with one loaded model per worker.
+
+`tesseract <line.tif> <stem> -l tam --psm 7` spends most of its time
+starting up and reading the .traineddata, not on the ~30 px line. recognise()
+starts --jobs worker processes that each initialise one tessapi.Engine for
+the model and then take line images in chunks, writing <stem>.txt through
+the call the command makes (ProcessPages with a text renderer), so with the
+text the command would:
+
+    for img, error in recognise(images, "pred", "tam", jobs=8):
+        if error:
+            ...
+
+Without libtesseract, or when the API cannot load the model, the same
+images go through cmdrun.CommandRunner as `tesseract` commands instead --
+still --jobs at a time, just paying the start-up per line.
+
+recognise_models() does the same for several models over one image set,
+each into its own directory. A worker reads and decodes each image once
+(tessapi.Pix) and hands it to an engine per model, loading each model the
+first time it needs it, and only (image, model) pairs without a prediction
+yet are sent at all -- so adding a model to a comparison costs that model's
+predictions alone.
+
+Given a PredictionCache, "without a prediction" means without a successful
+one in the cache, whose key is the .traineddata's SHA-256, the image's, the
+page segmentation mode and the tesseract configuration, including whether
+the text came from the API or the command. What sits in the
+output directory is then only written from it: a prediction left by another
+model of the same name is replaced, a renamed model -- or one trained again
+to the same weights -- reuses its text, and a failed line is tried again on
+the next run rather than kept as an empty prediction.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cmdrun
+import tessapi
+
+PSM_SINGLE_LINE = 7
+
+# Where tesseract looks for -l <lang> without --tessdata-dir, besides
+# $TESSDATA_PREFIX: Debian/Ubuntu packages, then a source build.
+TESSDATA_DIRS = ("/usr/share/tesseract-ocr/5/tessdata", "/usr/share/tesseract-ocr/4.00/tessdata",
+                 "/usr/local/share/tessdata", "/usr/share/tessdata")
+
+_MODELS = {}                # name -> Model, per worker process
+_ENGINES = {}               # name -> Engine or the error loading it
+_PSM = PSM_SINGLE_LINE
+
+
+class Model(namedtuple("Model", "name lang datapath out_dir")):
+    """A model to recognise with: -l lang from the tessdata directory
+    datapath (None for tesseract's own), predictions into out_dir."""
+
+    def pred(self, img):
+        return Path(self.out_dir) / f"{Path(img).stem}.txt"
+
+    def traineddata(self):
+        """The .traineddata file tesseract will load, or None if not found."""
+        dirs = [self.datapath] if self.datapath else \
+            [os.environ.get("TESSDATA_PREFIX", ""), *TESSDATA_DIRS]
+        for d in filter(None, dirs):
+            path = Path(d) / f"{self.lang}.traineddata"
+            if path.exists():
+                return path
+        return None
+
+
+class PredictionCache:
+    """Recognised text by (model, image, psm, config), one line per result.
+
+        {"key": "<sha256>", "text": "...", "returncode": 0, "seconds": 0.041}
+
+    returncode is tesseract's exit status, or null when it never gave one
+    (it could not be started, timed out, or the API call failed). Only
+    returncode 0 is reused; a key's later line supersedes earlier ones, but
+    a success is not undone by a later failure. Lines are appended, so a
+    cache can be shared by every sweep that recognises the same test set.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        torn = False
+        if self.path.exists():
+            data = self.path.read_text(encoding="utf-8")
+            torn = bool(data) and not data.endswith("\n")
+            for line in data.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue            # torn last line from a crash
+                old = self.entries.get(entry["key"])
+                if old is None or old["returncode"] != 0:
+                    self.entries[entry["key"]] = entry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        if torn:
+            self._fh.write("\n")
+
+    @staticmethod
+    def key(model_hash, image_hash, psm, config):
+        blob = json.dumps([model_hash, image_hash, str(psm), config], sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """The cached text for key if it was recognised successfully, else None."""
+        entry = self.entries.get(key)
+        return entry["text"] if entry is not None and entry["returncode"] == 0 else None
+
+    def add(self, key, text, returncode, seconds):
+        entry = {"key": key, "text": text, "returncode": returncode,
+                 "seconds": round(seconds, 4)}
+        self._fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if returncode == 0 or key not in self.entries:
+            self.entries[key] = entry
+
+    def flush(self):
+        self._fh.flush()
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _config():
+    """What besides model, image and psm decides the text: the tesseract
+    build, and the config files passed (none). recognise_models adds the
+    path the text comes through, "api" or "cli"."""
+    version = tessapi.version() if tessapi.available() else None
+    if version is None:
+        try:
+            out = subprocess.run(["tesseract", "--version"], capture_output=True, text=True)
+            version = (out.stdout or out.stderr).split("\n", 1)[0].strip() or None
+        except OSError:
+            pass
+    return {"tesseract": version, "configs": []}
+
+
+def _write(path, text):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _init_models(models, psm):
+    global _PSM
+    _MODELS.update((m.name, m) for m in models)
+    _PSM = psm
+
+
+def _engine(name):
+    if name not in _ENGINES:
+        m = _MODELS[name]
+        try:
+            _ENGINES[name] = tessapi.Engine(lang=m.lang, datapath=m.datapath, psm=_PSM)
+        except tessapi.TesseractError as exc:
+            _ENGINES[name] = str(exc)
+    return _ENGINES[name]
+
+
+def _fan(args):
+    """Decode one image and recognise it with each named model; returns
+    [(name, error, text, seconds), ...]."""
+    img, names = args
+    try:
+        pix = tessapi.Pix(img)
+    except tessapi.TesseractError as exc:
+        return [(name, str(exc)[:70], None, 0.0) for name in names]
+    with pix:
+        return [_one(pix, img, name) for name in names]
+
+
+def _one(pix, img, name):
+    """(name, error, text, seconds) for one decoded image and model."""
+    engine = _engine(name)
+    if isinstance(engine, str):
+        return name, engine, None, 0.0
+    pred = _MODELS[name].pred(img)
+    base = pred.with_name(f"{pred.stem}.tmp")       # the renderer adds .txt
+    made = Path(f"{base}.txt")
+    started = time.perf_counter()
+    ok = engine.recognise(pix, base)
+    seconds = time.perf_counter() - started
+    if not ok or not made.exists():
+        made.unlink(missing_ok=True)
+        return name, "libtesseract failed", None, seconds
+    os.replace(made, pred)
+    return name, None, pred.read_text(encoding="utf-8"), seconds
+
+
+def _engine_ok(lang, datapath, psm):
+    """Whether workers will be able to load the model through the API."""
+    if not tessapi.available():
+        return False
+    try:
+        tessapi.Engine(lang=lang, datapath=datapath, psm=psm).close()
+    except tessapi.TesseractError as exc:
+        print(f"[note] {exc}; running tesseract per line")
+        return False
+    return True
+
+
+def recognise(images, out_dir, lang, datapath=None, psm=PSM_SINGLE_LINE,
+              jobs=None, timeout=cmdrun.TIMEOUT, cache=None):
+    """Write <out_dir>/<stem>.txt for each image without one; datapath is the
+    tessdata directory. Yields (image, error) as each finishes, error None
+    on success. With a PredictionCache, see recognise_models."""
+    model = Model(lang, lang, datapath, out_dir)
+    for img, _, error in recognise_models(images, [model], psm=psm, jobs=jobs,
+                                          timeout=timeout, cache=cache):
+        yield img, error
+
+
+def recognise_models(images, models, psm=PSM_SINGLE_LINE, jobs=None,
+                     timeout=cmdrun.TIMEOUT, cache=None):
+    """Recognise images with every Model in models, skipping pairs whose
+    prediction exists -- in cache, if given, else in the model's out_dir.
+    Yields (image, model name, error) for each pair recognised, error None
+    on success."""
+    images = [Path(p) for p in images]
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    for m in models:
+        Path(m.out_dir).mkdir(parents=True, exist_ok=True)
+    api = [m for m in models if _engine_ok(m.lang, m.datapath, int(psm))]
+    cli = [m for m in models if m not in api]
+
+    keys = {}
+    if cache is not None:
+        shared = _config()
+        config = {m.name: dict(shared, path="api" if m in api else "cli") for m in models}
+        model_hash = {}
+        for m in models:
+            path = m.traineddata()
+            if path is None:
+                print(f"[note] {m.lang}.traineddata not found; {m.name} is not cached")
+            else:
+                model_hash[m.name] = _file_sha256(path)
+        for img in images:
+            image_hash = _file_sha256(img)
+            for name, mh in model_hash.items():
+                keys[img, name] = PredictionCache.key(mh, image_hash, psm, config[name])
+
+    def needed(img, m):
+        key = keys.get((img, m.name))
+        if key is None:
+            return not m.pred(img).exists()
+        text = cache.get(key)
+        if text is None:
+            return True
+        pred = m.pred(img)
+        if not pred.exists() or pred.read_text(encoding="utf-8") != text:
+            _write(pred, text)
+        return False
+
+    def record(img, name, error, text, returncode, seconds):
+        key = keys.get((img, name))
+        if key is not None:
+            cache.add(key, text if error is None else "", returncode, seconds)
+        return img, name, error
+
+    todo = [(img, [m.name for m in api if needed(img, m)]) for img in images]
+    todo = [t for t in todo if t[1]]
+    if todo:
+        chunk = max(1, min(32, len(todo) // (4 * jobs)))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_models,
+                                 initargs=(api, int(psm))) as ex:
+            for (img, _), done in zip(todo, ex.map(_fan, todo, chunksize=chunk)):
+                for name, error, text, seconds in done:
+                    yield record(img, name, error, text,
+                                 0 if error is None else None, seconds)
+                if cache is not None:
+                    cache.flush()
+
+    # Per command: each tesseract decodes the image again.
+    todo = [(img, m) for m in cli for img in images if needed(img, m)]
+    if not todo:
+        return
+    runner = cmdrun.CommandRunner(jobs, timeout=timeout, env=cmdrun.tesseract_env())
+
+    async def one(pair):
+        img, m = pair
+        opts = (["--tessdata-dir", m.datapath] if m.datapath else []) + ["-l", m.lang]
+        started = time.perf_counter()
+        r = await runner.run(["tesseract", img, Path(m.out_dir) / img.stem,
+                              "--psm", psm] + opts)
+        return r, time.perf_counter() - started
+
+    for done in runner.completed(one, todo):
+        for (img, m), (r, seconds) in done:
+            if r.ok and m.pred(img).exists():
+                yield record(img, m.name, None, m.pred(img).read_text(encoding="utf-8"),
+                             0, seconds)
+            else:
+                yield record(img, m.name, r.error() if not r.ok else "no output", None,
+                             r.returncode or None, seconds)
+        if cache is not None:
+            cache.flush()
@@ -12,60 +12,632 @@ This script does exactly what the Makefile's two pattern rules do --
     %.box:   generate_line_box.py -i <img> -t <img>.gt.txt > <img>.box
     %.lstmf: tesseract <img> <stem> --psm 13 lstm.train
 
--- across a process pool, then exits. Afterwards `make training` finds every
+-- --jobs lines at a time, then exits. Afterwards `make training` finds every
 .lstmf already present, skips straight past the expensive stage, and proceeds
 to build the file lists and train.
 
     python3 prepare_lstmf.py --gt-dir gt --jobs 10
     cd $TESSTRAIN_DIR && make training MODEL_NAME=... GROUND_TRUTH_DIR=...
 
-Safe to interrupt and re-run: completed pairs are skipped.
+Safe to interrupt and re-run: completed pairs are skipped. Each finished
+pair is appended to gt.lstmf.jsonl with the index's digest of its image and
+transcription, so a re-run decides what is done from the index and that
+ledger alone, without a stat per file, and redoes exactly the pairs whose
+inputs changed since (or that failed). The index's digest is from render
+time; --verify also stat()s every pair the ledger has as done, prepares it
+again if its .lstmf is missing or empty, and hashes it from disk if its
+image or .gt.txt is no longer the size the index gives or is newer than its
+.lstmf -- a hand-corrected transcription, say. --rehash hashes every pair
+from disk (and verifies). A .lstmf made before the ledger existed is taken
+as done if it is newer than its pair. --restart ignores the ledger.
+
+--lists DIR then writes tesstrain's all-lstmf, list.train and list.eval into
+DIR (tesstrain's data/<MODEL_NAME>) from the ledger: every pair whose .lstmf
+is current, split --ratio-train to --seed, optionally per font or source
+(--stratify) so each keeps its share of both lists. experiments/train.py
+passes them to make with -o, so make neither rebuilds them nor stats every
+.lstmf to find out whether it should.
+
+Several machines sharing gt/ over NFS can split the work. --shard i/N takes
+the pairs whose stem hashes to i mod N, the same set on every machine
+whatever order the index lists them in; each shard writes its own ledger
+part. --claim makes each pair an exclusively created <stem>.lstmf.claim
+while it is worked on, so processes may also share a shard, or all take the
+whole tree as a work queue; a claim older than --claim-ttl is presumed
+abandoned. A claim is released only once its pair's ledger line is written,
+and whoever claims the pair next reads the other parts first, so a pair
+finished elsewhere is known from the ledger, not from file times kept by
+another host's clock. Once every process has finished, --merge folds the
+parts into gt.lstmf.jsonl, lists what failed or is missing -- including
+pairs the ledger has as done whose .lstmf is not on disk -- and exits
+non-zero unless every pair is done:
+
+    host1$ python3 prepare_lstmf.py --gt-dir /shared/gt --shard 0/3
+    host2$ python3 prepare_lstmf.py --gt-dir /shared/gt --shard 1/3
+    host3$ python3 prepare_lstmf.py --gt-dir /shared/gt --shard 2/3
+    python3 prepare_lstmf.py --gt-dir /shared/gt --merge --lists data/tam_ft
+
+Pairs are taken from the pair index render.generate writes next to the
+output directory (gt.index.jsonl), so a 400k-file tree -- flat or sharded
+into subdirectories -- is not listed again here. Directories without an
+index are globbed as before.
+
+Packed output (render.generate(packed=True)) is read straight from its shard
+files: each worker unpacks only the pair it is about to process, next to
+where its .lstmf goes, leaving the loose layout `make training` expects.
+
+The .box step no longer starts an interpreter per line. line_box() writes
+what generate_line_box.py writes -- one WordStr box over the whole crop
+carrying the NFC-normalised transcription, then the tab end-of-line box --
+inside the worker, so tesseract is the only subprocess left per line.
+tests/test_line_box.py pins it to golden .box files and, with TESSTRAIN_DIR
+set, to the script itself. --check-box N also runs the first N loose pairs
+through both before anything is written and stops on any difference;
+--box-subprocess goes back to calling the script.
+
+With --api each worker keeps one libtesseract handle (tessapi.Engine),
+initialised once with lstm.train, and writes every .lstmf it is given
+through it instead of starting tesseract per line; start-up, not
+recognition, is most of the cost of a 30 px line. Where libtesseract is not
+found, or will not initialise, workers use the tesseract command as before.
+
+Otherwise no Python workers are involved: cmdrun.CommandRunner keeps --jobs
+tesseract processes running straight from this one, with a --timeout per
+command and one retry, and the .box is written here between them.
+
+Lines are taken widest image first (index byte sizes, or file sizes without
+an index), a few per job in flight, so 200k pending lines cost one small
+tuple each rather than a future each, and the run does not end waiting on
+one long line picked up last. The --api pool gets them in chunks, shrinking
+towards the end for the same reason. Progress and the ETA, reckoned in image
+bytes, are printed every --progress seconds.
 """
 
 import argparse
+import hashlib
 import os
+import random
+import socket
 import subprocess
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
+from PIL import Image
+
+import cmdrun
+import tessapi
+from gt_store import LstmfLedger, PackCache, iter_pairs, pair_digest
+
 PSM = "13"          # tesstrain default: raw line, no layout analysis
+CHUNK = 32          # lines per task, at most
+IN_FLIGHT = 4       # chunks per worker queued or running
+RATIO_TRAIN = 0.90  # tesstrain's default
+CLAIM_TTL = 3600    # seconds before another process's claim is presumed dead
+LISTS = ("all-lstmf", "list.train", "list.eval")
 
+_PACKS = PackCache()        # per worker process
+_ENGINE = None              # per worker process, with --api
+_SEEN = None                # LstmfLedger read for other processes' work, with --claim
 
-def one(args):
-    """Produce .box then .lstmf for a single image. Returns (stem, status)."""
-    img, tesstrain_dir, box_script = args
-    img = Path(img)
+
+def line_box(image, text):
+    """tesstrain's generate_line_box.py output for one line, as bytes.
+
+    Only the image header is read, for its size.
+    """
+    with Image.open(image) as im:
+        width, height = im.size
+    lines = text.strip().split("\n")
+    if len(lines) != 1:
+        raise ValueError(f"ground truth should be exactly one line, not {len(lines)}")
+    line = unicodedata.normalize("NFC", lines[0].strip())
+    if not line:
+        return b""
+    return (f"WordStr 0 0 {width} {height} 0 #{line}\n"
+            f"\t 0 0 {width} {height} 0\n").encode("utf-8")
+
+
+def script_box(img, gt, box_script, env=None):
+    """The same, from generate_line_box.py in a subprocess."""
+    r = subprocess.run([sys.executable, str(box_script), "-i", str(img), "-t", str(gt)],
+                       capture_output=True,
+                       env=env or dict(os.environ, PYTHONIOENCODING="utf-8"))
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.decode()[:70])
+    return r.stdout
+
+
+def check_box_parity(pairs, box_script):
+    """Differences between line_box and the script over (img, gt) paths."""
+    diffs = []
+    for img, gt in pairs:
+        ours = line_box(img, Path(gt).read_text(encoding="utf-8"))
+        theirs = script_box(img, gt, box_script)
+        if ours != theirs:
+            diffs.append((Path(img).name, ours[:80], theirs[:80]))
+    return diffs
+
+
+def _digest(gt_dir, rec):
+    """The pair digest of an index record without one, or None if missing."""
+    try:
+        if "pack" in rec:
+            pack = gt_dir / rec["pack"]
+            return pair_digest(_PACKS.read(pack, rec["image_offset"], rec["image_bytes"]),
+                               _PACKS.read(pack, rec["gt_offset"], rec["gt_bytes"]))
+        return pair_digest((gt_dir / rec["image"]).read_bytes(),
+                           (gt_dir / rec["gt"]).read_bytes())
+    except OSError:
+        return None
+
+
+def _verify(gt_dir, rec):
+    """--verify for a pair the ledger has as done: "missing" if its .lstmf is
+    missing or empty, "changed" if its loose pair may differ from the index
+    digest (another size than the index's, or newer than the .lstmf), else
+    None."""
+    img = gt_dir / rec["image"]
+    try:
+        lstmf = img.with_suffix(".lstmf").stat()
+    except OSError:
+        return "missing"
+    if not lstmf.st_size:
+        return "missing"
+    if "pack" in rec:
+        return None             # unpacked afresh from its shard when redone
+    try:
+        img_st, gt_st = img.stat(), (gt_dir / rec["gt"]).stat()
+    except OSError:
+        return "changed"
+    if (rec.get("image_bytes", img_st.st_size), rec.get("gt_bytes", gt_st.st_size)) \
+            != (img_st.st_size, gt_st.st_size):
+        return "changed"
+    return "changed" if max(img_st.st_mtime, gt_st.st_mtime) > lstmf.st_mtime else None
+
+
+def _lstmf_present(gt_dir, rel):
+    """Whether the .lstmf of the pair at index path rel is there, non-empty."""
+    try:
+        return (gt_dir / rel).with_suffix(".lstmf").stat().st_size > 0
+    except OSError:
+        return False
+
+
+def _made_before_ledger(gt_dir, rec):
+    """A non-empty .lstmf newer than its loose pair."""
+    img = gt_dir / rec["image"]
+    try:
+        lstmf = img.with_suffix(".lstmf").stat()
+        newest = max(img.stat().st_mtime, (gt_dir / rec["gt"]).stat().st_mtime)
+    except OSError:
+        return False
+    return lstmf.st_size > 0 and lstmf.st_mtime >= newest
+
+
+def in_shard(stem, shard):
+    """Whether stem belongs to shard (i, n): by its hash, not its position."""
+    i, n = shard
+    return int(hashlib.sha256(stem.encode("utf-8")).hexdigest()[:16], 16) % n == i
+
+
+def parse_shard(text):
+    i, _, n = text.partition("/")
+    i, n = int(i), int(n)
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"--shard wants i/N with 0 <= i < N, not {text}")
+    return i, n
+
+
+def _claim(path, ttl):
+    """Create path exclusively; True if this process now holds it. A claim
+    older than ttl seconds is taken over (_take_stale), then created afresh."""
+    for _ in range(3):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            try:
+                if not _take_stale(path, ttl):
+                    return False
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, "w") as fh:
+            fh.write(f"{socket.gethostname()} {os.getpid()}\n")
+        return True
+    return False
+
+
+def _take_stale(path, ttl):
+    """Move a claim older than ttl out of the way; False to back off.
+
+    Renaming it aside is what only one taker can do, but by then the file
+    renamed may be a fresh claim made since the old one was judged stale.
+    Unless what was moved is the very file looked at, it goes back.
+    """
+    before = os.stat(path)
+    if time.time() - before.st_mtime < ttl:
+        return False
+    holder = Path(path).read_bytes()
+    aside = f"{path}.{socket.gethostname()}.{os.getpid()}"
+    os.rename(path, aside)
+    moved = os.stat(aside)
+    if ((moved.st_ino, moved.st_mtime_ns, moved.st_size)
+            == (before.st_ino, before.st_mtime_ns, before.st_size)
+            and Path(aside).read_bytes() == holder):
+        os.unlink(aside)
+        return True
+    try:
+        os.link(aside, path)
+    except FileExistsError:
+        pass                    # claimed once more meanwhile; that one stands
+    os.unlink(aside)
+    return False
+
+
+def _release(claim):
+    if claim is not None:
+        Path(claim).unlink(missing_ok=True)
+
+
+def _init_worker(use_api, gt_dir=None):
+    global _ENGINE, _SEEN
+    if gt_dir is not None:
+        _SEEN = LstmfLedger(gt_dir, readonly=True)
+    if not use_api:
+        return
+    try:
+        _ENGINE = tessapi.Engine(configs=["lstm.train"], psm=int(PSM))
+    except tessapi.TesseractError as exc:
+        print(f"[warn] pid {os.getpid()}: {exc}; using the tesseract command",
+              flush=True)
+
+
+def _begin(img, packed, claim_ttl, rel, digest):
+    """Claim (with claim_ttl set), clear and unpack one pair before its .box
+    and .lstmf are made. Returns (status, claim): status None to go on, else
+    why not; claim is the lock file to release once the pair's ledger line
+    is written, if one was taken. "claimed" means another process holds the
+    pair, "elsewhere" that one has finished it: its ledger part has rel
+    done with this digest.
+    """
     stem = img.with_suffix("")
-    box = stem.with_suffix(".box")
     lstmf = stem.with_suffix(".lstmf")
-    gt = Path(str(stem) + ".gt.txt")
-
-    if lstmf.exists() and lstmf.stat().st_size > 0:
-        return stem.name, "skip"
+    gt = Path(f"{stem}.gt.txt")
+    claim = None
+    if claim_ttl is not None:
+        img.parent.mkdir(parents=True, exist_ok=True)
+        claim = Path(f"{lstmf}.claim")
+        if not _claim(claim, claim_ttl):
+            return "claimed", None
+        _SEEN.refresh()
+        if _SEEN.done(rel, digest):
+            return "elsewhere", claim
+    # Unlink rather than overwrite: these may be hardlinks into an
+    # artifact store.
+    for path in (stem.with_suffix(".box"), lstmf) + ((img, gt) if packed is not None else ()):
+        path.unlink(missing_ok=True)
+    if packed is not None:
+        shard, img_off, img_len, gt_off, gt_len = packed
+        img.parent.mkdir(parents=True, exist_ok=True)
+        img.write_bytes(_PACKS.read(shard, img_off, img_len))
+        gt.write_bytes(_PACKS.read(shard, gt_off, gt_len))
     if not gt.exists():
-        return stem.name, "no-gt"
+        return "no-gt", claim
+    return None, claim
+
+
+def _builtin_box(img):
+    """Write img's .box with line_box; a status if that fails, else None."""
+    stem = img.with_suffix("")
+    try:
+        data = line_box(img, Path(f"{stem}.gt.txt").read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        return f"box-fail: {str(exc)[:70]}"
+    stem.with_suffix(".box").write_bytes(data)
+    return None
+
+
+def _tesseract_cmd(img):
+    return ["tesseract", str(img), str(img.with_suffix("")), "--psm", PSM, "lstm.train"]
+
+
+def _box_cmd(img, tesstrain_dir, box_script):
+    return [sys.executable, str(Path(tesstrain_dir) / box_script),
+            "-i", str(img), "-t", str(img.with_suffix("")) + ".gt.txt"]
+
+
+def one(args):
+    """Produce .box then .lstmf for a single image in a pool worker.
+    Returns (stem, status, claim).
+
+    Both are made afresh; main has already decided this pair needs them.
+    packed, when set, is (shard, image offset, image size, gt offset, gt size):
+    the pair is unpacked from its shard first. box_script None builds the
+    .box here (line_box); otherwise it is run. With claim_ttl set the pair
+    is claimed first (_begin), and the claim left to the caller to release.
+    """
+    img, tesstrain_dir, box_script, packed, claim_ttl, rel, digest = args
+    img = Path(img)
+    status, claim = _begin(img, packed, claim_ttl, rel, digest)
+    try:
+        return img.stem, status or _make(img, tesstrain_dir, box_script), claim
+    except BaseException:
+        _release(claim)
+        raise
+
 
+def _make(img, tesstrain_dir, box_script):
     env = dict(os.environ, PYTHONIOENCODING="utf-8", OMP_THREAD_LIMIT="1")
+    if box_script is None:
+        status = _builtin_box(img)
+        if status:
+            return status
+    else:
+        r = subprocess.run(_box_cmd(img, tesstrain_dir, box_script),
+                           capture_output=True, env=env)
+        if r.returncode != 0:
+            return f"box-fail: {r.stderr.decode()[:70]}"
+        img.with_suffix(".box").write_bytes(r.stdout)
 
-    if not (box.exists() and box.stat().st_size > 0):
-        r = subprocess.run(
-            [sys.executable, str(Path(tesstrain_dir) / box_script),
-             "-i", str(img), "-t", str(gt)],
-            capture_output=True, env=env)
+    if _ENGINE is not None:
+        if not _ENGINE.process(img, img.with_suffix("")):
+            return "lstmf-fail: libtesseract"
+    else:
+        r = subprocess.run(_tesseract_cmd(img), capture_output=True, env=env)
         if r.returncode != 0:
-            return stem.name, f"box-fail: {r.stderr.decode()[:70]}"
-        box.write_bytes(r.stdout)
+            return f"lstmf-fail: {r.stderr.decode()[:70]}"
+    return "ok" if img.with_suffix(".lstmf").exists() else "lstmf-missing"
 
-    r = subprocess.run(
-        ["tesseract", str(img), str(stem), "--psm", PSM, "lstm.train"],
-        capture_output=True, env=env)
-    if r.returncode != 0:
-        return stem.name, f"lstmf-fail: {r.stderr.decode()[:70]}"
-    if not lstmf.exists():
-        return stem.name, "lstmf-missing"
-    return stem.name, "ok"
+
+async def one_async(runner, args):
+    """one() for the command runner: the same steps, with the box script and
+    tesseract run as commands from this process."""
+    img, tesstrain_dir, box_script, packed, claim_ttl, rel, digest = args
+    img = Path(img)
+    status, claim = _begin(img, packed, claim_ttl, rel, digest)
+    try:
+        return img.stem, status or await _make_async(runner, img, tesstrain_dir,
+                                                     box_script), claim
+    except BaseException:
+        _release(claim)
+        raise
+
+
+async def _make_async(runner, img, tesstrain_dir, box_script):
+    env = cmdrun.tesseract_env(PYTHONIOENCODING="utf-8")
+    if box_script is None:
+        status = _builtin_box(img)
+        if status:
+            return status
+    else:
+        r = await runner.run(_box_cmd(img, tesstrain_dir, box_script), env=env)
+        if not r.ok:
+            return f"box-fail: {r.error()}"
+        img.with_suffix(".box").write_bytes(r.stdout)
+    r = await runner.run(_tesseract_cmd(img), env=env)
+    if not r.ok:
+        return f"lstmf-fail: {r.error()}"
+    return "ok" if img.with_suffix(".lstmf").exists() else "lstmf-missing"
+
+
+def run_chunk(chunk):
+    """one() over a list of its arguments; [(stem, status, claim), ...]."""
+    return [one(args) for args in chunk]
+
+
+def chunks(todo, jobs, size=CHUNK):
+    """Split todo into consecutive chunks of at most size, shrinking towards
+    the end so the last chunks are spread over every worker."""
+    i = 0
+    while i < len(todo):
+        n = max(1, min(size, (len(todo) - i) // (IN_FLIGHT * jobs)))
+        yield todo[i:i + n]
+        i += n
+
+
+def _pool_batches(todo, args, payload, use_api):
+    """Run todo through a process pool in chunks; yields lists of
+    (todo item, (stem, status, claim)), and [] every --progress seconds."""
+    work = chunks(todo, args.jobs, args.chunk)
+    pending = {}
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                             initargs=(use_api, args.gt_dir if args.claim else None)) as ex:
+        while True:
+            while len(pending) < IN_FLIGHT * args.jobs:
+                chunk = next(work, None)
+                if chunk is None:
+                    break
+                pending[ex.submit(run_chunk, [payload(t) for t in chunk])] = chunk
+            if not pending:
+                return
+            finished, _ = wait(pending, timeout=args.progress,
+                               return_when=FIRST_COMPLETED)
+            yield [pair for fut in finished
+                   for pair in zip(pending.pop(fut), fut.result())]
+
+
+def _runner_batches(todo, args, payload):
+    """The same from a CommandRunner: tesseract processes straight from here,
+    --jobs at a time, with no Python worker in between."""
+    runner = cmdrun.CommandRunner(args.jobs, timeout=args.timeout)
+
+    async def run(t):
+        return await one_async(runner, payload(t))
+
+    yield from runner.completed(run, todo, window=IN_FLIGHT * args.jobs,
+                                tick=args.progress)
+
+
+def split(items, ratio, seed, key=None):
+    """(train, eval) from items, the same for the same items and seed.
+
+    With key, each stratum key(item) is split at the ratio on its own and the
+    halves merged, so every stratum keeps its share of both lists.
+    """
+    rng = random.Random(seed)
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item) if key else None, []).append(item)
+    train, held = [], []
+    for k in sorted(groups, key=lambda k: (k is None, str(k))):
+        group = groups[k]
+        rng.shuffle(group)
+        cut = round(len(group) * ratio)
+        train += group[:cut]
+        held += group[cut:]
+    rng.shuffle(train)
+    rng.shuffle(held)
+    return train, held
+
+
+def write_lists(out_dir, train, held):
+    """tesstrain's all-lstmf / list.train / list.eval, each replaced whole."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, paths in zip(LISTS, (train + held, train, held)):
+        tmp = out_dir / f"{name}.tmp"
+        tmp.write_text("".join(f"{p}\n" for p in paths), encoding="utf-8")
+        os.replace(tmp, out_dir / name)
+
+
+def process(todo, args, ledger, script):
+    """Prepare todo, recording each pair in the ledger. Returns how many
+    succeeded."""
+    global _SEEN
+    if not args.box_subprocess and args.check_box:
+        if script.exists():
+            sample = [(Path(t[1]), Path(t[1][:-len(".tif")] + ".gt.txt"))
+                      for t in todo if Path(t[1]).exists()][:args.check_box]
+            diffs = check_box_parity(sample, script)
+            if diffs:
+                for name, ours, theirs in diffs[:3]:
+                    print(f"  {name}\n    built-in {ours!r}\n    {script.name} {theirs!r}")
+                sys.exit(f"built-in .box output differs from {script} on "
+                         f"{len(diffs)} of {len(sample)} pairs; use --box-subprocess")
+            print(f"built-in .box output matches {script.name} on {len(sample)} pairs")
+        else:
+            print(f"[note] {script} not found; built-in .box output not cross-checked")
+
+    use_api = False
+    if args.api:
+        use_api = tessapi.available()
+        print(f"libtesseract {tessapi.version()}: one handle per worker" if use_api
+              else "[note] libtesseract not found; running tesseract per line")
+
+    started = time.time()
+    done = failed = ok = elsewhere = 0
+    problems = []
+    box_script = args.box_script if args.box_subprocess else None
+    total_bytes = sum(t[0] for t in todo) or 1
+    done_bytes = 0
+    last_report = started
+
+    def report():
+        el = time.time() - started
+        rate = done / el if el else 0
+        eta = (f"{el * (total_bytes - done_bytes) / done_bytes / 60:>5.1f} min"
+               if done_bytes else "   --    ")
+        print(f"  {done:>7,}/{len(todo):,}  "
+              f"{rate * 60:>6.0f} lines/min  "
+              f"ETA {eta}  failed {failed}", flush=True)
+
+    def payload(t):
+        return (t[1], args.tesstrain_dir, box_script, t[2],
+                args.claim_ttl if args.claim else None, t[3], t[4])
+
+    if args.claim and not use_api:
+        _SEEN = ledger          # the runner's pairs are begun in this process
+    batches = (_pool_batches(todo, args, payload, use_api) if use_api
+               else _runner_batches(todo, args, payload))
+    for batch in batches:
+        claims = []
+        for (size, _, _, rel, digest), (name, status, claim) in batch:
+            done += 1
+            done_bytes += size
+            claims.append(claim)
+            if status in ("claimed", "elsewhere"):
+                elsewhere += 1      # in another process's ledger
+                continue
+            ledger.add(rel, digest, status)
+            if status == "ok":
+                ok += 1
+            else:
+                failed += 1
+                if len(problems) < 10:
+                    problems.append(f"{name}: {status}")
+        ledger.flush()
+        # Only now: a process claiming one of these next finds it in the ledger.
+        for claim in claims:
+            _release(claim)
+        if time.time() - last_report >= args.progress:
+            last_report = time.time()
+            report()
+    report()
+
+    el = time.time() - started
+    print(f"\nprocessed {done:,} in {el / 60:.1f} min "
+          f"({done / el * 60:.0f} lines/min), {failed} failed"
+          + (f", {elsewhere:,} taken by other processes" if elsewhere else ""))
+    for p in problems:
+        print(f"  {p}")
+    return ok
+
+
+def emit_lists(gt_dir, ledger, listed, args):
+    """Lists of every pair done in the ledger whose .lstmf is on disk: make
+    is told not to rebuild them, so a dangling path would only surface in
+    lstmtraining."""
+    root = gt_dir.resolve()
+    ready, absent = [], 0
+    for rel, digest, stratum in listed:
+        if not ledger.done(rel, digest):
+            continue
+        if not _lstmf_present(gt_dir, rel):
+            absent += 1
+            continue
+        ready.append((str(root / rel[:-len(".tif")]) + ".lstmf", stratum))
+    if absent:
+        print(f"[warn] {absent:,} pairs done in the ledger have no .lstmf and are "
+              f"left out of the lists; re-run with --verify to prepare them")
+    train, held = split(ready, args.ratio_train, args.seed,
+                        (lambda t: t[1]) if args.stratify else None)
+    write_lists(args.lists, [p for p, _ in train], [p for p, _ in held])
+    print(f"{len(train):,} lines in list.train, {len(held):,} in list.eval"
+          + (f", split per {args.stratify}" if args.stratify else "")
+          + f" -> {args.lists}")
+
+
+def merge(gt_dir, ledger, n_images, todo, finished, listed, args):
+    """--merge: one ledger again, and a report of what is not done. A pair
+    the ledger has as done (finished) counts only if its .lstmf is on disk."""
+    parts = ledger.parts()
+    ledger.merge()
+    absent = [rel for rel in finished if not _lstmf_present(gt_dir, rel)]
+    failed, missing = {}, []
+    for _, path, _, rel, digest in todo:
+        Path(path[:-len(".tif")] + ".lstmf.claim").unlink(missing_ok=True)
+        entry = ledger.entries.get(rel)
+        if entry is not None and entry["sha256"] == digest:
+            failed.setdefault(entry["status"].split(":")[0], []).append(rel)
+        else:
+            missing.append(rel)
+    print(f"merged {len(parts)} ledger part(s) into {ledger.path.name}: "
+          f"{n_images - len(todo) - len(absent):,} of {n_images:,} pairs done, "
+          f"{sum(map(len, failed.values())):,} failed, {len(missing):,} never "
+          f"prepared (or changed since), {len(absent):,} done without a .lstmf")
+    for status, rels in sorted(failed.items()):
+        print(f"  {status:<14} {len(rels):>7,}  e.g. {', '.join(rels[:3])}")
+    if missing:
+        print(f"  {'missing':<14} {len(missing):>7,}  e.g. {', '.join(missing[:3])}")
+    if absent:
+        print(f"  {'no .lstmf':<14} {len(absent):>7,}  e.g. {', '.join(absent[:3])}"
+              f"  (re-run with --verify)")
+    if args.lists:
+        emit_lists(gt_dir, ledger, listed, args)
+    return 1 if todo or absent else 0
 
 
 def main():
@@ -76,57 +648,131 @@ def main():
     ap.add_argument("--tesstrain-dir",
                     default=os.environ.get("TESSTRAIN_DIR", ""))
     ap.add_argument("--box-script", default="generate_line_box.py")
+    ap.add_argument("--box-subprocess", action="store_true",
+                    help="run --box-script per line instead of building .box "
+                         "files in the worker")
+    ap.add_argument("--check-box", type=int, default=0, metavar="N",
+                    help="compare the built-in .box output with --box-script on "
+                         "N pairs before starting (default: off; needs a "
+                         "tesstrain checkout)")
+    ap.add_argument("--api", action="store_true",
+                    help="keep one libtesseract handle per worker instead of "
+                         "running tesseract per line")
+    ap.add_argument("--chunk", type=int, default=CHUNK,
+                    help="most lines sent to a worker at once (with --api)")
+    ap.add_argument("--timeout", type=float, default=cmdrun.TIMEOUT, metavar="SECONDS",
+                    help="for one tesseract command, after which it is retried once")
+    ap.add_argument("--progress", type=float, default=30.0, metavar="SECONDS",
+                    help="seconds between progress lines")
+    ap.add_argument("--restart", action="store_true",
+                    help="ignore the ledger and prepare every pair again")
+    ap.add_argument("--verify", action="store_true",
+                    help="stat every finished pair: redo a missing .lstmf, rehash "
+                         "a pair changed since the index was written")
+    ap.add_argument("--rehash", action="store_true",
+                    help="digest every pair from disk instead of trusting the "
+                         "index (implies --verify)")
+    ap.add_argument("--lists", default=None, metavar="DIR",
+                    help="write all-lstmf, list.train and list.eval here "
+                         "(tesstrain's data/<MODEL_NAME>)")
+    ap.add_argument("--ratio-train", type=float, default=RATIO_TRAIN)
+    ap.add_argument("--seed", type=int, default=0, help="for the train/eval split")
+    ap.add_argument("--stratify", choices=("font", "source"), default=None,
+                    help="split each font (or source) at --ratio-train separately")
+    ap.add_argument("--shard", type=parse_shard, default=None, metavar="I/N",
+                    help="only the pairs whose stem hashes to I mod N")
+    ap.add_argument("--claim", action="store_true",
+                    help="claim each pair with a lock file before working on it, "
+                         "for processes sharing pairs")
+    ap.add_argument("--claim-ttl", type=float, default=CLAIM_TTL, metavar="SECONDS",
+                    help="age at which a claim is presumed abandoned")
+    ap.add_argument("--merge", action="store_true",
+                    help="fold the shards' ledgers together and check that "
+                         "every pair is done; prepares nothing")
     args = ap.parse_args()
 
-    if not args.tesstrain_dir:
-        sys.exit("set TESSTRAIN_DIR or pass --tesstrain-dir")
-    script = Path(args.tesstrain_dir) / args.box_script
-    if not script.exists():
+    script = Path(args.tesstrain_dir or ".") / args.box_script
+    if args.box_subprocess and not args.tesstrain_dir:
+        sys.exit("--box-subprocess needs TESSTRAIN_DIR or --tesstrain-dir")
+    if args.box_subprocess and not script.exists():
         sys.exit(f"missing {script}")
 
+    if args.merge and (args.shard or args.restart):
+        sys.exit("--merge takes the whole directory; drop --shard / --restart")
+    if args.lists and args.shard:
+        sys.exit("write the lists after the shards finish, with --merge --lists")
+
     gt_dir = Path(args.gt_dir)
-    images = sorted(gt_dir.glob("*.tif"))
-    if not images:
+    part = "-".join(
+        ([f"shard{args.shard[0]}of{args.shard[1]}"] if args.shard else [])
+        + ([f"{socket.gethostname()}-{os.getpid()}"] if args.claim else [])) or None
+    ledger = LstmfLedger(gt_dir, resume=not args.restart, part=part)
+    n_images = adopted = 0
+    # (image bytes, image path, packed location or None, index path, digest)
+    todo = []
+    listed = []         # (index path, digest, stratum), with --lists
+    finished = []       # index paths done in the ledger, with --merge
+    for r in iter_pairs(gt_dir):
+        if args.shard and not in_shard(r["stem"], args.shard):
+            continue
+        n_images += 1
+        digest = r.get("sha256") or _digest(gt_dir, r)
+        check = None
+        if (args.verify or args.rehash) and ledger.done(r["image"], digest):
+            check = _verify(gt_dir, r)
+        if "sha256" in r and (args.rehash or check == "changed"):
+            digest = _digest(gt_dir, r)
+            if digest != r["sha256"]:
+                ledger.indexed[r["image"]] = r["sha256"]
+        if args.lists:
+            listed.append((r["image"], digest, r.get(args.stratify) if args.stratify else None))
+        if ledger.done(r["image"], digest) and check != "missing":
+            if args.merge:
+                finished.append(r["image"])
+            continue
+        if (r["image"] not in ledger.entries and not args.restart and "pack" not in r
+                and digest is not None and _made_before_ledger(gt_dir, r)):
+            ledger.add(r["image"], digest, "ok")
+            adopted += 1
+            if args.merge:
+                finished.append(r["image"])
+            continue
+        img = gt_dir / r["image"]
+        size = r.get("image_bytes")
+        if size is None:
+            size = img.stat().st_size if img.exists() else 0
+        packed = None
+        if "pack" in r:
+            packed = (str(gt_dir / r["pack"]), r["image_offset"], r["image_bytes"],
+                      r["gt_offset"], r["gt_bytes"])
+        todo.append((size, str(img), packed, r["image"], digest))
+    ledger.flush()
+    if not n_images:
         sys.exit(f"no .tif files in {gt_dir}")
+    # Widest first; ties keep index order.
+    todo.sort(key=lambda t: -t[0])
 
-    todo = [p for p in images
-            if not (p.with_suffix(".lstmf").exists()
-                    and p.with_suffix(".lstmf").stat().st_size > 0)]
-    print(f"{len(images):,} images, {len(images) - len(todo):,} already done, "
-          f"{len(todo):,} to process on {args.jobs} workers")
-    if not todo:
-        print("Nothing to do.")
-        return 0
+    if args.merge:
+        return merge(gt_dir, ledger, n_images, todo, finished, listed, args)
 
-    started = time.time()
-    done = failed = 0
-    problems = []
-    payload = [(str(p), args.tesstrain_dir, args.box_script) for p in todo]
-
-    with ProcessPoolExecutor(max_workers=args.jobs) as ex:
-        futures = [ex.submit(one, p) for p in payload]
-        for fut in as_completed(futures):
-            name, status = fut.result()
-            done += 1
-            if status not in ("ok", "skip"):
-                failed += 1
-                if len(problems) < 10:
-                    problems.append(f"{name}: {status}")
-            if done % 2000 == 0 or done == len(todo):
-                el = time.time() - started
-                rate = done / el
-                eta = (len(todo) - done) / rate / 60 if rate else 0
-                print(f"  {done:>7,}/{len(todo):,}  "
-                      f"{rate * 60:>6.0f} lines/min  "
-                      f"ETA {eta:>5.1f} min  failed {failed}", flush=True)
+    print(f"{n_images:,} images"
+          + (f" in shard {args.shard[0]}/{args.shard[1]}" if args.shard else "")
+          + f", {n_images - len(todo):,} already done"
+          + (f" ({adopted:,} from before the ledger)" if adopted else "")
+          + f", {len(todo):,} to process on {args.jobs} workers")
+    ok = 0
+    if todo:
+        ok = process(todo, args, ledger, script)
+    else:
+        print("Nothing to do.")
+    if ledger.superseded and part is None and not ledger.parts():
+        ledger.compact()
+    ledger.close()
 
-    el = time.time() - started
-    print(f"\nprocessed {done:,} in {el / 60:.1f} min "
-          f"({done / el * 60:.0f} lines/min), {failed} failed")
-    for p in problems:
-        print(f"  {p}")
-    n = len(list(gt_dir.glob("*.lstmf")))
+    n = n_images - len(todo) + ok
     print(f"\n{n:,} .lstmf files now in {gt_dir}")
+    if args.lists:
+        emit_lists(gt_dir, ledger, listed, args)
     print("Next: cd $TESSTRAIN_DIR && make training MODEL_NAME=... "
           "GROUND_TRUTH_DIR=... MAX_ITERATIONS=...")
     return 0
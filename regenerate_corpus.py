@@ -27,6 +27,7 @@ Wikisource.
 
 import argparse
 import json
+import os
 import sys
 import time
 from collections import Counter
@@ -50,47 +51,101 @@ def main():
     ap.add_argument("--seed", type=int, default=SEED)
     ap.add_argument("--out", default=str(OUT_DIR))
     ap.add_argument("--font-dir", default="fonts")
+    ap.add_argument("--shard-pages", type=int, default=None, metavar="N",
+                    help="write each N pages to their own subdirectory of "
+                         "--out instead of one flat directory")
+    ap.add_argument("--packed", action="store_true",
+                    help="write pairs into shard files instead of loose "
+                         "files; unpack with `python gt_store.py export`")
+    ap.add_argument("--encoding", default=None,
+                    choices=sorted(render_mod.ENCODINGS),
+                    help="crop format (default: config CROP_ENCODING, 'gray')")
+    ap.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) - 2),
+                    help="render pages on this many processes; output is "
+                         "identical for any value")
+    ap.add_argument("--layout", default="page", choices=["page", "line"],
+                    help="'line' renders each line on its own canvas, so a "
+                         "segmentation mismatch drops one line, not a page")
+    ap.add_argument("--engine", default="text", choices=list(render_mod.ENGINES),
+                    help="'words' composes lines from cached word bitmaps "
+                         "(see experiments/bench_words.py for fidelity)")
+    ap.add_argument("--overflow", default=None,
+                    choices=["report", "reassign", "rechunk"],
+                    help="check line widths before rendering (experiments/"
+                         "preflight.py) and report, re-font or split lines "
+                         "too wide for the page")
+    ap.add_argument("--stream", action="store_true",
+                    help="render through render.generate_stream: a bounded "
+                         "window of pages in memory, but no resume and no "
+                         "--overflow")
+    ap.add_argument("--restart", action="store_true",
+                    help="render every page again instead of resuming from "
+                         "<out>.pages.jsonl")
     args = ap.parse_args()
+    if args.stream and args.overflow:
+        ap.error("--overflow needs generate()'s preflight; drop --stream")
+    if args.stream and args.restart:
+        ap.error("--stream never resumes, so there is nothing to --restart")
 
     started = time.time()
     print("Building per-source line pools...")
     pool = corpus_mod.build_pool()
     raw = sum(len(v) for v in pool.values())
 
-    lines = corpus_mod.select(pool, sources=None, n_lines=args.n_lines,
-                              seed=args.seed, dedup=True)
-    uniq = len(corpus_mod.select(pool, n_lines=None, seed=args.seed, dedup=True))
-
+    # (line, source) pairs: provenance travels with each line rather than in
+    # a second dict over every string in the pool. The seeded shuffle needs
+    # the selection in memory once; it is the only list of it kept.
+    records = corpus_mod.select(pool, sources=None, n_lines=args.n_lines,
+                                seed=args.seed, dedup=True, with_source=True)
+    seen = set()
+    uniq = sum(corpus_mod.has_tamil(ln) for stem in sorted(pool)
+               for ln in corpus_mod.deduplicate(pool[stem], seen))
+    del pool, seen
+
+    # Unrenderable lines are dropped in place, keeping the order.
     coverage = render_mod.common_coverage(args.font_dir)
-    lines, unrenderable = render_mod.renderable(lines, coverage)
+    kept = 0
+    for record in records:
+        if render_mod.can_render(record[0], coverage):
+            records[kept] = record
+            kept += 1
+    unrenderable = len(records) - kept
+    del records[kept:]
 
     print(f"  raw pool          {raw:,} lines")
     print(f"  after dedup       {uniq:,} lines  ({raw - uniq:,} duplicates removed)")
-    print(f"  font-coverage     {len(unrenderable):,} lines dropped "
+    print(f"  font-coverage     {unrenderable:,} lines dropped "
           f"(a character no typeface set can render)")
-    print(f"  selected          {len(lines):,} lines  (seed={args.seed})")
+    print(f"  selected          {len(records):,} lines  (seed={args.seed})")
 
     # Provenance of the selection, so the composition is reportable.
-    index = {}
-    for src, src_lines in pool.items():
-        for ln in src_lines:
-            index.setdefault(ln, src)
-    provenance = Counter(index.get(ln, "?") for ln in lines)
+    provenance = Counter(src for _, src in records)
     print("\n  selected lines by source:")
     for src, n in provenance.most_common():
-        print(f"    {src:<34} {n:>7,}  {n / len(lines) * 100:5.1f}%")
+        print(f"    {src:<34} {n:>7,}  {n / len(records) * 100:5.1f}%")
 
     if args.dry_run:
         print(f"\nDry run — nothing rendered. ({time.time() - started:.1f}s)")
         return 0
 
-    corpus_mod.write_corpus(lines, CORPUS_TXT)
+    corpus_mod.write_corpus([ln for ln, _ in records], CORPUS_TXT)
     print(f"\nWrote {CORPUS_TXT}")
 
     print(f"\nRendering to {args.out}/ ...")
-    manifest = render_mod.generate(
-        lines, args.out, font_dir=args.font_dir, font_names=None,
-        assignment="round-robin", seed=args.seed)
+    if args.stream:
+        manifest = render_mod.generate_stream(
+            iter(records), args.out, font_dir=args.font_dir, font_names=None,
+            assignment="round-robin", seed=args.seed, jobs=args.jobs,
+            shard_pages=args.shard_pages, packed=args.packed,
+            encoding=args.encoding, layout=args.layout, engine=args.engine)
+    else:
+        manifest = render_mod.generate(
+            [ln for ln, _ in records], args.out, font_dir=args.font_dir, font_names=None,
+            assignment="round-robin", seed=args.seed, jobs=args.jobs,
+            shard_pages=args.shard_pages, packed=args.packed, encoding=args.encoding,
+            resume=not args.restart, layout=args.layout, engine=args.engine,
+            overflow=args.overflow,
+            sources=[src for _, src in records])
 
     counts = manifest["font_line_counts"]
     lo, hi = min(counts.values()), max(counts.values())
@@ -105,6 +160,9 @@ def main():
     if check["orphan_images"] or check["orphan_transcriptions"]:
         print(f"  ORPHANS           {check['orphan_images'][:3]} "
               f"{check['orphan_transcriptions'][:3]}")
+    if check.get("missing_from_disk") or check.get("missing_from_index"):
+        print(f"  INDEX MISMATCH    {check['missing_from_disk'][:3]} "
+              f"{check['missing_from_index'][:3]}")
 
     meta = {
         "seed": args.seed,
@@ -113,7 +171,7 @@ def main():
         "deduplicated_lines": uniq,
         "selection": "seeded shuffle then truncate (experiments/corpus.py:select)",
         "font_assignment": "round-robin, line i -> font i mod n",
-        "unrenderable_dropped": len(unrenderable),
+        "unrenderable_dropped": unrenderable,
         "provenance": dict(provenance),
         "manifest": manifest,
         "validation": check,
@@ -0,0 +1,77 @@
+"""Projection-profile line segmentation shared by every segmenter here.
+
+render.segment_page (synthetic pages), generate-gt.py and make_testset.py
+(real photographs) all find text lines the same way: sum the ink along each
+row, call every run of rows above a threshold a band, then trim each band's
+crop to the columns that carry ink. They used to do it with three copies of a
+Python loop over the projection. This module does it once, with NumPy:
+
+    band starts/ends   rising and falling edges of the row mask, via np.diff
+    column extent      first ink column by argmax, last by argmax on the
+                       reversed mask
+    smoothing          moving average, for photographs
+    diacritic merging  fold a band into its predecessor when the gap between
+                       them is small, for the pulli and vowel signs that can
+                       sit in a band of their own
+
+Band lists are identical to the loops they replace (experiments/
+bench_segment.py checks this on a rendered page and times both).
+"""
+
+import numpy as np
+
+
+def find_bands(mask, close_open=True):
+    """Maximal runs of True in a 1-D row mask, as half-open (start, end) pairs.
+
+    close_open controls a run still open at the last row: True closes it at
+    len(mask), False drops it. generate-gt.py always dropped it, and keeps
+    doing so rather than quietly changing what it emits.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not close_open and ends.size and ends[-1] == mask.size:
+        starts, ends = starts[:-1], ends[:-1]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def projection_bands(binary, threshold, close_open=True):
+    """Bands of rows whose summed ink exceeds threshold.
+
+    binary is an inverse-binarised image (ink non-zero), exactly what the
+    callers already compute.
+    """
+    projection = binary.sum(axis=1, dtype=np.int64)
+    return find_bands(projection > threshold, close_open)
+
+
+def smooth(projection, k):
+    """Moving average over k rows, same length as the input."""
+    return np.convolve(projection, np.ones(k) / k, mode="same")
+
+
+def merge_bands(bands, max_gap):
+    """Fold each band into its predecessor when the gap between them is
+    below max_gap. Returns a new list; input order is assumed."""
+    if not bands:
+        return []
+    arr = np.asarray(bands)
+    gaps = arr[1:, 0] - arr[:-1, 1]
+    first = np.concatenate(([True], gaps >= max_gap))
+    starts = arr[first, 0]
+    ends = arr[np.concatenate((first[1:], [True])), 1]
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def ink_extent(mask):
+    """Half-open (x0, x1) span of columns holding any ink, or None if blank.
+
+    Equivalent to cv2.boundingRect(cv2.findNonZero(mask)) on the x axis
+    without materialising a coordinate list for every ink pixel.
+    """
+    cols = np.asarray(mask).any(axis=0)
+    if not cols.any():
+        return None
+    return int(cols.argmax()), int(cols.size - cols[::-1].argmax())
@@ -23,6 +23,10 @@ Usage:
     # tesstrain-style directory: *.gt.txt paired with *.txt predictions
     python tamil_ocr_eval.py --gt_dir test/gt --pred_dir test/pred
 
+    # rendered output with a pair index, loose or packed (see gt_store.py):
+    # transcriptions are read through the index, predictions by stem
+    python tamil_ocr_eval.py --gt_dir gt --pred_dir pred
+
     # add bootstrapped confidence intervals and a confusion listing
     python tamil_ocr_eval.py --gt_dir test/gt --pred_dir test/pred \
         --bootstrap 2000 --confusions 25
@@ -37,6 +41,8 @@ import unicodedata
 from collections import Counter
 from pathlib import Path
 
+from gt_store import PairReader, index_path
+
 # Tamil combining marks: dependent vowel signs U+0BBE-U+0BCC, virama (pulli)
 # U+0BCD, and the AU length mark U+0BD7. A grapheme cluster is one base
 # character followed by any run of these.
@@ -239,13 +245,19 @@ def collect_pairs(args):
     if args.gt_dir:
         gt_dir, pred_dir = Path(args.gt_dir), Path(args.pred_dir)
         pairs, missing = [], []
-        for gt_file in sorted(gt_dir.glob("*.gt.txt")):
-            stem = gt_file.name[: -len(".gt.txt")]
+        if index_path(gt_dir).exists():
+            refs = PairReader(gt_dir)
+            gts = sorted(((r["stem"], r) for r in refs), key=lambda x: x[0])
+            load = refs.text
+        else:
+            gts = [(f.name[: -len(".gt.txt")], f) for f in sorted(gt_dir.glob("*.gt.txt"))]
+            load = read
+        for stem, ref in gts:
             pred = pred_dir / f"{stem}.txt"
             if not pred.exists():
                 missing.append(stem)
                 continue
-            pairs.append((stem, read(gt_file), read(pred)))
+            pairs.append((stem, load(ref), read(pred)))
         if missing:
             print(f"[warn] {len(missing)} ground-truth files had no prediction "
                   f"(first: {missing[0]})", file=sys.stderr)
@@ -0,0 +1,195 @@
+"""A long-lived libtesseract handle, through the C API and ctypes.
+
+`tesseract <img> <stem> --psm 13 lstm.train` spends most of its time on one
+~30 px line starting up: loading the library, reading eng.traineddata,
+parsing the lstm.train config. Recognition of the line itself is a small
+fraction. Engine does that start-up once and then runs any number of lines
+through the same handle, the way the CLI runs the pages of one document:
+
+    with Engine(configs=["lstm.train"], psm=13) as engine:
+        for img in images:
+            engine.process(img, stem_of(img))     # writes <stem>.lstmf
+
+process() is TessBaseAPIProcessPages with no renderer after SetOutputName,
+which is the call the CLI itself makes in training mode, so the .lstmf files
+are the ones the CLI writes. recognise() makes the same call with a text
+renderer, as `tesseract <image> <outputbase>` does for plain recognition,
+and writes the same <outputbase>.txt. Given a Pix -- the image read once by
+leptonica's pixRead, as the CLI reads it -- recognise() runs the CLI's
+per-page call, TessBaseAPIProcessPage, on it instead, so one read and
+decode can serve several engines:
+
+    with Pix(img) as pix:
+        for engine in engines:
+            engine.recognise(pix, outputbase_for(engine))
+
+Nothing beyond ctypes is needed. available() is False when libtesseract
+cannot be found (set TESSERACT_LIB to its path if find_library misses it),
+and callers fall back to the CLI. One handle per process: the API is not
+safe to share between threads.
+"""
+
+import ctypes
+import ctypes.util
+import os
+
+OEM_DEFAULT = 3
+
+_LIB = None
+_LEPT = None
+
+
+class TesseractError(RuntimeError):
+    pass
+
+
+def _load():
+    """The shared library with its signatures declared, or None."""
+    global _LIB, _LEPT
+    if _LIB is not None:
+        return _LIB or None
+    name = os.environ.get("TESSERACT_LIB") or ctypes.util.find_library("tesseract")
+    # OpenMP reads its thread limit when the library loads: one thread per
+    # handle, without leaving the limit on for the commands run later.
+    saved = os.environ.get("OMP_THREAD_LIMIT")
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    try:
+        lib = ctypes.CDLL(name) if name else None
+    except OSError:
+        lib = None
+    finally:
+        if saved is None:
+            del os.environ["OMP_THREAD_LIMIT"]
+        else:
+            os.environ["OMP_THREAD_LIMIT"] = saved
+    if lib is None:
+        _LIB = False
+        return None
+    # Leptonica is libtesseract's own dependency; its symbols are usually
+    # reachable through the tesseract handle.
+    _LEPT = lib
+    if not hasattr(lib, "pixRead"):
+        lept = ctypes.util.find_library("leptonica") or ctypes.util.find_library("lept")
+        _LEPT = ctypes.CDLL(lept) if lept else None
+
+    p, s, i = ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int
+    for fn, args, res in (
+            ("TessVersion", [], s),
+            ("TessBaseAPICreate", [], p),
+            ("TessBaseAPIInit1", [p, s, s, i, ctypes.POINTER(s), i], i),
+            ("TessBaseAPISetVariable", [p, s, s], i),
+            ("TessBaseAPISetPageSegMode", [p, i], None),
+            ("TessBaseAPISetOutputName", [p, s], None),
+            ("TessBaseAPIProcessPages", [p, s, s, i, p], i),
+            ("TessBaseAPIProcessPage", [p, p, i, s, s, i, p], i),
+            ("TessTextRendererCreate", [s], p),
+            ("TessResultRendererBeginDocument", [p, s], i),
+            ("TessResultRendererEndDocument", [p], i),
+            ("TessDeleteResultRenderer", [p], None),
+            ("TessBaseAPIClear", [p], None),
+            ("TessBaseAPIEnd", [p], None),
+            ("TessBaseAPIDelete", [p], None)):
+        f = getattr(lib, fn)
+        f.argtypes, f.restype = args, res
+    if _LEPT is not None:
+        _LEPT.pixRead.argtypes, _LEPT.pixRead.restype = [s], p
+        _LEPT.pixDestroy.argtypes, _LEPT.pixDestroy.restype = [ctypes.POINTER(p)], None
+    _LIB = lib
+    return lib
+
+
+def available():
+    return _load() is not None
+
+
+def version():
+    lib = _load()
+    return lib.TessVersion().decode() if lib else None
+
+
+class Engine:
+    """One initialised TessBaseAPI, reused for every image given to it."""
+
+    def __init__(self, lang="eng", datapath=None, configs=(), psm=None,
+                 variables=None, oem=OEM_DEFAULT):
+        lib = _load()
+        if lib is None:
+            raise TesseractError("libtesseract not found (set TESSERACT_LIB)")
+        self._lib = lib
+        self._api = lib.TessBaseAPICreate()
+        argv = (ctypes.c_char_p * max(1, len(configs)))(
+            *[c.encode() for c in configs])
+        if lib.TessBaseAPIInit1(self._api, os.fsencode(datapath) if datapath else None,
+                                lang.encode(), oem, argv, len(configs)) != 0:
+            self.close()
+            raise TesseractError(f"could not initialise tesseract for {lang!r} "
+                                 f"with {list(configs)}")
+        for key, value in (variables or {}).items():
+            if not lib.TessBaseAPISetVariable(self._api, key.encode(), str(value).encode()):
+                self.close()
+                raise TesseractError(f"unknown tesseract variable {key!r}")
+        if psm is not None:
+            lib.TessBaseAPISetPageSegMode(self._api, int(psm))
+
+    def process(self, image, outputbase, renderer=None):
+        """Run one image as `tesseract <image> <outputbase>` would. True on success."""
+        self._lib.TessBaseAPISetOutputName(self._api, os.fsencode(str(outputbase)))
+        ok = self._lib.TessBaseAPIProcessPages(self._api, os.fsencode(str(image)),
+                                               None, 0, renderer)
+        self._lib.TessBaseAPIClear(self._api)
+        return bool(ok)
+
+    def recognise(self, image, outputbase):
+        """Write the text of one image -- a path, or a Pix already read -- to
+        <outputbase>.txt. True on success."""
+        renderer = self._lib.TessTextRendererCreate(os.fsencode(str(outputbase)))
+        try:
+            if not isinstance(image, Pix):
+                return self.process(image, outputbase, renderer)
+            # What ProcessPages does around each page of an image it has read.
+            self._lib.TessBaseAPISetOutputName(self._api, os.fsencode(str(outputbase)))
+            ok = (self._lib.TessResultRendererBeginDocument(renderer, b"")
+                  and self._lib.TessBaseAPIProcessPage(
+                      self._api, image.pix, 0, os.fsencode(image.path), None, 0, renderer)
+                  and self._lib.TessResultRendererEndDocument(renderer))
+            self._lib.TessBaseAPIClear(self._api)
+            return bool(ok)
+        finally:
+            # Closes the .txt.
+            self._lib.TessDeleteResultRenderer(renderer)
+
+    def close(self):
+        if self._api:
+            self._lib.TessBaseAPIEnd(self._api)
+            self._lib.TessBaseAPIDelete(self._api)
+            self._api = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Pix:
+    """One image read by leptonica's pixRead, for Engine.recognise; freed
+    by close()."""
+
+    def __init__(self, path):
+        if _load() is None or _LEPT is None:
+            raise TesseractError("leptonica not found alongside libtesseract")
+        self.path = str(path)
+        self.pix = _LEPT.pixRead(os.fsencode(self.path))
+        if not self.pix:
+            raise TesseractError(f"leptonica could not read {self.path}")
+
+    def close(self):
+        if self.pix:
+            _LEPT.pixDestroy(ctypes.byref(ctypes.c_void_p(self.pix)))
+            self.pix = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
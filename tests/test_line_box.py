@@ -0,0 +1,58 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import prepare_lstmf  # noqa: E402
+
+# Each <case>.box is what tesstrain's generate_line_box.py wrote for
+# <case>.gt.txt over a blank 412x37 crop.
+DATA = Path(__file__).resolve().parent / "data" / "box"
+CASES = sorted(p.name[:-len(".gt.txt")] for p in DATA.glob("*.gt.txt"))
+SIZE = (412, 37)
+
+TESSTRAIN = os.environ.get("TESSTRAIN_DIR")
+BOX_SCRIPT = Path(TESSTRAIN or ".") / "generate_line_box.py"
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "line.tif"
+    Image.new("L", SIZE, 255).save(path)
+    return path
+
+
+def test_cases_are_there():
+    assert CASES == ["combining", "empty", "nfd", "spaces", "zwj"]
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_line_box_matches_golden(image, case):
+    text = (DATA / f"{case}.gt.txt").read_text(encoding="utf-8")
+    assert prepare_lstmf.line_box(image, text) == (DATA / f"{case}.box").read_bytes()
+
+
+def test_line_box_composes_nfd_and_keeps_joiners(image):
+    nfd = (DATA / "nfd.gt.txt").read_text(encoding="utf-8")
+    assert "\u0bca" not in nfd
+    assert "\u0bca".encode() in prepare_lstmf.line_box(image, nfd)
+    zwj = (DATA / "zwj.gt.txt").read_text(encoding="utf-8")
+    box = prepare_lstmf.line_box(image, zwj)
+    assert "\u200d".encode() in box and "\u200c".encode() in box
+
+
+def test_line_box_rejects_two_lines(image):
+    with pytest.raises(ValueError):
+        prepare_lstmf.line_box(image, "ஒன்று\nஇரண்டு\n")
+
+
+@pytest.mark.skipif(not (TESSTRAIN and BOX_SCRIPT.exists()),
+                    reason="set TESSTRAIN_DIR to a tesstrain checkout")
+@pytest.mark.parametrize("case", CASES)
+def test_line_box_matches_tesstrain(image, case):
+    gt = DATA / f"{case}.gt.txt"
+    assert prepare_lstmf.check_box_parity([(image, gt)], BOX_SCRIPT) == []
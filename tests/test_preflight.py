@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "experiments"))
+
+import preflight  # noqa: E402
+
+# 100 px of usable width: 10 characters at 10 px each.
+CFG = SimpleNamespace(A4_WIDTH=120, PADDING=10)
+
+
+class CharIndex:
+    """10 px per character in every face."""
+    fonts = [("a", None), ("b", None)]
+
+    def widths(self, lines, assigned):
+        return np.array([10.0 * len(line) for line in lines])
+
+
+def assign(n):
+    return [i % 2 for i in range(n)]
+
+
+def test_rechunk_leaves_an_over_wide_word_whole():
+    word = "x" * 15
+    lines, assigned, origin = preflight.rechunk(["ok", word, "fine too"], assign,
+                                                CharIndex(), CFG)
+    assert lines == ["ok", word, "fine too"]
+    assert origin == [0, 1, 2]
+    assert preflight.check(lines, assigned, CharIndex(), CFG)[0] == [1]
+
+
+def test_rechunk_never_emits_an_empty_part():
+    word = "x" * 15
+    lines, _, origin = preflight.rechunk([f"ab {word} cd", f"{word} "], assign,
+                                         CharIndex(), CFG)
+    assert all(line.strip() for line in lines)
+    assert " ".join(lines[:3]) == f"ab {word} cd"
+    assert origin == [0, 0, 0, 1]
+
+
+def test_rechunk_splits_at_the_last_boundary_that_fits():
+    lines, _, origin = preflight.rechunk(["aaaa bbbb cccc"], assign, CharIndex(), CFG)
+    assert lines == ["aaaa bbbb", "cccc"]
+    assert origin == [0, 0]
@@ -0,0 +1,85 @@
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import prepare_lstmf  # noqa: E402
+
+# Stands in for `tesseract <img> <stem> --psm 13 lstm.train`.
+FAKE_TESSERACT = "#!/bin/sh\nprintf lstmf > \"$2.lstmf\"\n"
+
+
+@pytest.fixture
+def gt_dir(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tesseract = bin_dir / "tesseract"
+    tesseract.write_text(FAKE_TESSERACT)
+    tesseract.chmod(tesseract.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{Path(sys.executable).parent}:/usr/bin:/bin")
+
+    gt = tmp_path / "gt"
+    gt.mkdir()
+    for i, text in enumerate(["தமிழ் ஒன்று", "இரண்டு", "மூன்று வரி"], 1):
+        Image.new("L", (120 + 10 * i, 32), 255).save(gt / f"line_{i}.tif")
+        (gt / f"line_{i}.gt.txt").write_text(text + "\n", encoding="utf-8")
+    return gt
+
+
+def run(gt_dir, *extra):
+    argv = ["prepare_lstmf.py", "--gt-dir", str(gt_dir), "--jobs", "1",
+            "--progress", "3600", *extra]
+    old, sys.argv = sys.argv, argv
+    try:
+        return prepare_lstmf.main()
+    finally:
+        sys.argv = old
+
+
+def test_verify_rebuilds_a_deleted_lstmf(gt_dir, capsys):
+    assert run(gt_dir) == 0
+    lstmf = gt_dir / "line_2.lstmf"
+    assert lstmf.read_bytes() == b"lstmf"
+
+    lstmf.unlink()
+    run(gt_dir)
+    assert "0 to process" in capsys.readouterr().out     # the ledger alone
+    assert not lstmf.exists()
+
+    run(gt_dir, "--verify")
+    assert "1 to process" in capsys.readouterr().out
+    assert lstmf.read_bytes() == b"lstmf"
+
+
+def test_verify_rebuilds_an_empty_lstmf(gt_dir, capsys):
+    run(gt_dir)
+    (gt_dir / "line_1.lstmf").write_bytes(b"")
+    capsys.readouterr()
+    run(gt_dir, "--verify")
+    assert "1 to process" in capsys.readouterr().out
+    assert (gt_dir / "line_1.lstmf").read_bytes() == b"lstmf"
+
+
+def test_merge_fails_when_done_pairs_have_no_lstmf(gt_dir, capsys):
+    run(gt_dir)
+    for lstmf in gt_dir.glob("*.lstmf"):
+        lstmf.unlink()
+    capsys.readouterr()
+    assert run(gt_dir, "--merge") == 1
+    out = capsys.readouterr().out
+    assert "0 of 3 pairs done" in out
+    assert "3 done without a .lstmf" in out
+
+
+def test_lists_leave_out_a_missing_lstmf(gt_dir, tmp_path, capsys):
+    run(gt_dir)
+    (gt_dir / "line_3.lstmf").unlink()
+    lists = tmp_path / "lists"
+    run(gt_dir, "--lists", str(lists), "--ratio-train", "1.0")
+    listed = (lists / "all-lstmf").read_text(encoding="utf-8").split()
+    assert sorted(Path(p).name for p in listed) == ["line_1.lstmf", "line_2.lstmf"]
+    assert "1 pairs done in the ledger have no .lstmf" in capsys.readouterr().out
@@ -1,4 +1,24 @@
 import os
+import sys
+
+from gt_store import index_path, validate
+
+# Output of render.generate / regenerate_corpus.py. When it carries a pair
+# index, check it from that rather than walking the tree file by file.
+render_gt_dir = sys.argv[1] if len(sys.argv) > 1 else "gt"
+if index_path(render_gt_dir).exists():
+    report = validate(render_gt_dir)
+    print(f"\nVerification Completed! Pairs indexed: {report['indexed']}, "
+          f"on disk: {min(report['images'], report['transcriptions'])}")
+    problems = {k: report[k] for k in ("orphan_images", "orphan_transcriptions",
+                                       "missing_from_disk", "missing_from_index",
+                                       "empty_transcriptions") if report[k]}
+    for label, names in problems.items():
+        print(f"\n⚠️ {label.replace('_', ' ').capitalize()}:")
+        print("\n".join(names))
+    if not problems:
+        print("\n✅ All TIFF and GT files are correctly paired and valid!")
+    sys.exit(1 if problems else 0)
 
 # Base directory where generated dataset is stored
 dataset_base_dir = "Zenode_DataSet"